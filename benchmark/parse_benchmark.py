@@ -0,0 +1,89 @@
+# html parsing benchmark on the crawled pages: time and peak memory per page for the full parse and the
+# restricted article parse (preprocessing/article_parser.py), whether every handler still produces the same
+# chunks from both, and the raw-bytes redirect check against finding the redirect in a parsed tree
+# usage (from the repo root): python benchmark/parse_benchmark.py [terraria_wiki_pages] [--limit 500]
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "preprocessing"))
+
+from article_parser import parse_article
+from remove_redundant_pages import is_redirect
+import preprocessing
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def page_chunks(soup, page_title):
+    chunks = {}
+    for handler in preprocessing.HANDLERS:
+        chunks[handler["name"]] = preprocessing.run_handler(handler, soup, page_title)["chunks"]
+    return json.dumps(chunks, sort_keys=True, ensure_ascii=False)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full and restricted html parsing on the crawled pages")
+    parser.add_argument("pages_dir", nargs="?", default=os.path.join(ROOT, "terraria_wiki_pages"))
+    parser.add_argument("--limit", type=int, default=None, help="only the first n pages")
+    parser.add_argument("--no-handlers", action="store_true", help="skip running the handlers on both trees")
+    args = parser.parse_args()
+
+    files = sorted(name for name in os.listdir(args.pages_dir) if name.endswith(".html"))[:args.limit]
+    stats = {mode: {"seconds": [], "peak": []} for mode in ("full", "restricted")}
+    redirect_seconds = {"bytes": 0.0, "tree": 0.0}
+    different = []
+    for name in files:
+        with open(os.path.join(args.pages_dir, name), "rb") as f:
+            html = f.read()
+        page_title = os.path.splitext(name)[0]
+
+        soups = {}
+        for mode in stats:
+            soups[mode], seconds, peak = measure(parse_article, html, mode == "restricted")
+            stats[mode]["seconds"].append(seconds)
+            stats[mode]["peak"].append(peak)
+
+        start = time.perf_counter()
+        is_redirect(html)
+        redirect_seconds["bytes"] += time.perf_counter() - start
+        start = time.perf_counter()
+        parse_article(html, False).find("p", string=lambda text: text and text.strip().startswith("Redirect to:"))
+        redirect_seconds["tree"] += time.perf_counter() - start
+
+        if not args.no_handlers and page_chunks(soups["full"], page_title) != page_chunks(soups["restricted"], page_title):
+            different.append(page_title)
+
+    print(f"{len(files)} pages from {args.pages_dir}")
+    print(f"{'parse':<12}{'ms/page':>10}{'p95 ms':>10}{'peak KB/page':>14}{'p95 peak KB':>13}")
+    for mode, values in stats.items():
+        print(
+            f"{mode:<12}{1000 * sum(values['seconds']) / len(files):>10.2f}{1000 * percentile(values['seconds'], 95):>10.2f}"
+            f"{sum(values['peak']) / len(files) / 1024:>14.1f}{percentile(values['peak'], 95) / 1024:>13.1f}"
+        )
+    print(f"redirect check: {1e6 * redirect_seconds['bytes'] / len(files):.1f} us/page on the raw bytes, "
+          f"{1000 * redirect_seconds['tree'] / len(files):.2f} ms/page with a parsed tree")
+    if not args.no_handlers:
+        print(f"pages whose handler output differs: {len(different)}" + (f" (e.g. {', '.join(different[:5])})" if different else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# offline retrieval benchmark: recall@k, MRR, latency and memory for each configuration in configs.json.
+# every configuration runs in a fresh process, so its memory does not include the indexes of the ones before it
+# usage (from the repo root): python benchmark/run_benchmark.py [--configs benchmark/configs.json] [--compare old_results.json]
+# the encoders must already be in the local huggingface cache, nothing is downloaded
+
+import os
+
+# stay offline and on the cpu, set before sentence_transformers/torch are imported
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import argparse
+import glob
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "preprocessing"))
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from index import build_faiss_index, chunk_metadata
+from metrics import resident_memory_bytes
+from retrieval import retrieve
+from chunk_records import read_chunks
+
+BENCHMARK_DIR = os.path.join(ROOT, "benchmark")
+DEFAULT_QUESTIONS = os.path.join(BENCHMARK_DIR, "questions_v1.json")
+DEFAULT_CONFIGS = os.path.join(BENCHMARK_DIR, "configs.json")
+DEFAULT_CORPUS = os.path.join(ROOT, "preprocessing", "terraria_preprocessed_chunks_*.json")
+RECALL_KS = [1, 3, 5, 10]
+
+
+def load_corpus(pattern):
+    chunks = []
+    for path in sorted(glob.glob(pattern)):
+        chunks.extend(read_chunks(path))
+    return chunks
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+# the sections a result stands for: its own and those of every copy dedup.py collapsed into it
+def result_sections(result):
+    metadata = result["metadata"]
+    sections = {(metadata.get("page_title"), metadata.get("section_title"))}
+    sections.update((entry["page_title"], entry["section_title"]) for entry in metadata.get("duplicates", []))
+    return sections
+
+
+def relevant_labels(result, gold):
+    sections = result_sections(result)
+    return {(label["page_title"], label["section_title"]) for label in gold} & sections
+
+
+def is_relevant(result, gold):
+    return bool(relevant_labels(result, gold))
+
+
+def score_question(results, gold):
+    # recall@k is the share of the gold sections found in the first k results
+    recalls = {}
+    for k in RECALL_KS:
+        found = set()
+        for r in results[:k]:
+            found |= relevant_labels(r, gold)
+        recalls[k] = len(found) / len(gold)
+
+    reciprocal_rank = 0.0
+    for rank, result in enumerate(results, start=1):
+        if is_relevant(result, gold):
+            reciprocal_rank = 1 / rank
+            break
+    return recalls, reciprocal_rank
+
+
+def embeddings_file(work_dir, encoder_name):
+    return os.path.join(work_dir, encoder_name.replace("/", "_") + ".npy")
+
+
+# Step 1: encode the corpus once per encoder and write the metadata file, every config reads them from disk
+def prepare(configs, chunks, work_dir):
+    for encoder_name in dict.fromkeys(config["encoder"] for config in configs):
+        encoder = SentenceTransformer(encoder_name, device="cpu")
+        start = time.perf_counter()
+        embeddings = encoder.encode([c["text"] for c in chunks], convert_to_tensor=False)
+        print(f"Encoded {len(chunks)} chunks with {encoder_name} in {time.perf_counter() - start:.1f}s")
+        np.save(embeddings_file(work_dir, encoder_name), np.asarray(embeddings, dtype="float32"))
+        del encoder, embeddings
+    # the same metadata index.py writes, with the provenance of collapsed duplicates
+    with open(os.path.join(work_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(chunk_metadata(chunks), f)
+
+
+# runs in its own process, see run_isolated
+def run_config(config, questions, work_dir):
+    model = SentenceTransformer(config["encoder"], device="cpu")
+
+    # Step 2: build the index and write it out the same way index.py does, the bot reads from disk
+    embeddings = np.load(embeddings_file(work_dir, config["encoder"]))
+    start = time.perf_counter()
+    index = build_faiss_index(embeddings, config["index_type"])
+    build_seconds = time.perf_counter() - start
+    index_file = os.path.join(work_dir, f"{config['name']}.faiss")
+    metadata_file = os.path.join(work_dir, "metadata.json")
+    faiss.write_index(index, index_file)
+    del index, embeddings
+
+    # Step 3: run every question through the real retrieve()
+    latencies = []
+    recall_totals = {k: 0.0 for k in RECALL_KS}
+    reciprocal_rank_total = 0.0
+    for question in questions:
+        start = time.perf_counter()
+        results = retrieve(
+            question["question"], index_file, metadata_file, model,
+            top_k=config["top_k"], title_weight=config["title_weight"], section_weight=config["section_weight"]
+        )
+        latencies.append(time.perf_counter() - start)
+        recalls, reciprocal_rank = score_question(results, question["gold"])
+        for k in RECALL_KS:
+            recall_totals[k] += recalls[k]
+        reciprocal_rank_total += reciprocal_rank
+
+    count = len(questions)
+    return {
+        "config": config,
+        "metrics": {
+            **{f"recall@{k}": recall_totals[k] / count for k in RECALL_KS if k <= config["top_k"]},
+            "mrr": reciprocal_rank_total / count,
+            "latency_p50_ms": percentile(latencies, 50) * 1000,
+            "latency_p95_ms": percentile(latencies, 95) * 1000,
+            "build_seconds": build_seconds,
+            "index_bytes": os.path.getsize(index_file),
+            # encoder, metadata and this config's index only
+            "rss_bytes": resident_memory_bytes(),
+        }
+    }
+
+
+def run_isolated(config, questions, work_dir):
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_config, config, questions, work_dir).result()
+
+
+def print_runs(runs, previous=None):
+    previous_by_name = {run["config"]["name"]: run["metrics"] for run in (previous or {}).get("runs", [])}
+    print(f"\n{'config':<24}{'R@1':>7}{'R@3':>7}{'R@10':>7}{'MRR':>7}{'p50 ms':>9}{'p95 ms':>9}{'RSS MB':>9}")
+    for run in runs:
+        m = run["metrics"]
+        print(
+            f"{run['config']['name']:<24}"
+            f"{m.get('recall@1', float('nan')):>7.3f}{m.get('recall@3', float('nan')):>7.3f}{m.get('recall@10', float('nan')):>7.3f}"
+            f"{m['mrr']:>7.3f}{m['latency_p50_ms']:>9.1f}{m['latency_p95_ms']:>9.1f}{m['rss_bytes'] / 2**20:>9.1f}"
+        )
+        old = previous_by_name.get(run["config"]["name"])
+        if old:
+            print(
+                f"{'  vs previous':<24}"
+                f"{m.get('recall@1', 0) - old.get('recall@1', 0):>+7.3f}{m.get('recall@3', 0) - old.get('recall@3', 0):>+7.3f}"
+                f"{m.get('recall@10', 0) - old.get('recall@10', 0):>+7.3f}{m['mrr'] - old['mrr']:>+7.3f}"
+                f"{m['latency_p50_ms'] - old['latency_p50_ms']:>+9.1f}{m['latency_p95_ms'] - old['latency_p95_ms']:>+9.1f}"
+                f"{(m['rss_bytes'] - old['rss_bytes']) / 2**20:>+9.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark for the Terraria RAG index")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="glob of preprocessed chunk files")
+    parser.add_argument("--only", nargs="*", help="names of the configs to run (default: all)")
+    parser.add_argument("--output", help="results file (default: benchmark/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to print deltas against")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        question_set = json.load(f)
+    with open(args.configs, "r", encoding="utf-8") as f:
+        configs = json.load(f)
+    if args.only:
+        configs = [config for config in configs if config["name"] in args.only]
+    chunks = load_corpus(args.corpus)
+    print(f"Loaded {len(chunks)} chunks and {len(question_set['questions'])} questions (v{question_set['version']})")
+
+    runs = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare(configs, chunks, work_dir)
+        for config in configs:
+            print(f"Running {config['name']}...")
+            runs.append(run_isolated(config, question_set["questions"], work_dir))
+
+    results = {
+        "questions_version": question_set["version"],
+        "corpus_chunks": len(chunks),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "runs": runs,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    print_runs(runs, previous)
+
+    output = args.output or os.path.join(BENCHMARK_DIR, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, default=float)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
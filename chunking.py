@@ -0,0 +1,144 @@
+# even out chunk sizes before embedding: split chunks over the token window (with overlap) and merge
+# tiny neighbouring chunks of the same page and section, so every vector covers a similar amount of text
+# usage: python chunking.py terraria_preprocessed.json -o terraria_preprocessed.json [--max-tokens 160]
+# runs after dedup.py and before index.py
+
+import argparse
+import json
+import os
+import sys
+from token_budget import DEFAULT_MODEL, get_tokenizer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
+
+from chunk_records import read_chunks
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces, tiktoken tokens are a little longer so 160 stays well under it
+DEFAULT_MAX_TOKENS = 160
+DEFAULT_MIN_TOKENS = 40
+DEFAULT_OVERLAP = 24
+
+
+def starts_word(tokenizer, token):
+    return tokenizer.decode_single_token_bytes(token)[:1] in (b" ", b"\n")
+
+
+# token windows of at most max_tokens, each starting overlap tokens before the previous one ended.
+# window edges are moved to word starts when one is close, so words are not cut in half
+def split_tokens(tokenizer, tokens, max_tokens, overlap):
+    windows = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + max_tokens, len(tokens))
+        if end < len(tokens):
+            for cut in range(end, start + max_tokens // 2, -1):
+                if starts_word(tokenizer, tokens[cut]):
+                    end = cut
+                    break
+        windows.append(tokenizer.decode(tokens[start:end]).strip())
+        if end == len(tokens):
+            break
+
+        next_start = max(end - overlap, start + 1)
+        for begin in range(next_start, end):
+            if starts_word(tokenizer, tokens[begin]):
+                next_start = begin
+                break
+        start = next_start
+    return windows
+
+
+def section_key(chunk):
+    return chunk["metadata"]["page_title"], chunk["metadata"]["section_title"]
+
+
+# a piece's own copy of the metadata, pieces of one chunk must not share its provenance list
+def piece_metadata(metadata):
+    copy = dict(metadata)
+    if "duplicates" in copy:
+        copy["duplicates"] = list(copy["duplicates"])
+    return copy
+
+
+def merge_into(target, chunk):
+    target["text"] += " " + chunk["text"]
+    duplicates = chunk["metadata"].get("duplicates")
+    if duplicates:
+        target["metadata"]["duplicates"] = target["metadata"].get("duplicates", []) + duplicates
+
+
+# sources, when given a list, gets the indexes of the input chunks behind every output chunk
+def normalize_chunks(chunks, max_tokens=DEFAULT_MAX_TOKENS, min_tokens=DEFAULT_MIN_TOKENS, overlap=DEFAULT_OVERLAP, model_name=DEFAULT_MODEL, sources=None):
+    if overlap >= max_tokens:
+        raise ValueError("overlap has to be smaller than max_tokens")
+    tokenizer = get_tokenizer(model_name)
+    # tiktoken tokenizes the whole corpus in parallel threads
+    token_lists = tokenizer.encode_ordinary_batch([chunk["text"] for chunk in chunks])
+
+    # Step 1: split everything over the window, the pieces keep their chunk's metadata
+    pieces = []
+    for source, (chunk, tokens) in enumerate(zip(chunks, token_lists)):
+        if len(tokens) <= max_tokens:
+            pieces.append((chunk["text"], chunk["metadata"], len(tokens), source))
+            continue
+        for text in split_tokens(tokenizer, tokens, max_tokens, overlap):
+            pieces.append((text, chunk["metadata"], None, source))
+
+    # Step 2: grow small chunks with the following pieces of the same section while they fit the window
+    normalized = []
+    sizes = []
+    piece_sources = []
+    for text, metadata, size, source in pieces:
+        if size is None:
+            size = len(tokenizer.encode_ordinary(text))
+        if normalized:
+            previous = normalized[-1]
+            if (
+                sizes[-1] < min_tokens
+                and section_key(previous) == (metadata["page_title"], metadata["section_title"])
+                and sizes[-1] + size + 1 <= max_tokens
+            ):
+                merge_into(previous, {"text": text, "metadata": metadata})
+                sizes[-1] += size + 1
+                if source != piece_sources[-1][-1]:
+                    piece_sources[-1].append(source)
+                continue
+        normalized.append({"text": text, "metadata": piece_metadata(metadata)})
+        sizes.append(size)
+        piece_sources.append([source])
+    if sources is not None:
+        sources.extend(piece_sources)
+    return normalized, sizes
+
+
+def describe_sizes(sizes):
+    sizes = sorted(sizes)
+    if not sizes:
+        return "no chunks"
+    return (
+        f"{len(sizes)} chunks, tokens min {sizes[0]} / median {sizes[len(sizes) // 2]} / "
+        f"p95 {sizes[int(0.95 * (len(sizes) - 1))]} / max {sizes[-1]}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split oversized and merge tiny chunks to an even token window")
+    parser.add_argument("input", help="deduplicated chunk file (dedup.py output)")
+    parser.add_argument("-o", "--output", default="terraria_preprocessed.json")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--min-tokens", type=int, default=DEFAULT_MIN_TOKENS, help="chunks below this are merged with the next chunk of the same section")
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP, help="tokens repeated between the pieces of a split chunk")
+    args = parser.parse_args()
+
+    chunks = read_chunks(args.input)
+
+    tokenizer = get_tokenizer()
+    print("Before:", describe_sizes([len(tokens) for tokens in tokenizer.encode_ordinary_batch([c["text"] for c in chunks])]))
+    normalized, sizes = normalize_chunks(chunks, args.max_tokens, args.min_tokens, args.overlap)
+    print("After: ", describe_sizes(sizes))
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(normalized, output, indent=4, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# recipes compiled into a compact adjacency-array graph (item -> station, ingredients x quantity)
+# for exact bill of materials and reverse "used in" lookups
+# usage: python crafting_graph.py preprocessing/terraria_entities.db index/crafting_graph.npz
+
+import argparse
+import math
+import re
+import sqlite3
+from fractions import Fraction
+import numpy as np
+from structured_lookup import RECIPE_PATTERNS, ARTICLE, normalize_query
+
+TOTAL_PATTERNS = [
+    re.compile(rf"^what do i need in total to (?:craft|make) {ARTICLE}(?P<name>.+)$"),
+    re.compile(rf"^(?:what are )?(?:all|the total|the raw|all the raw) (?:materials|ingredients) (?:for|to (?:craft|make)) {ARTICLE}(?P<name>.+)$"),
+    re.compile(rf"^(?:bill of materials|raw materials|total materials|full recipe) (?:for|of) {ARTICLE}(?P<name>.+)$"),
+]
+
+
+# read every recipe out of the entity tables and lay them out as flat arrays (csr style)
+def compile_graph(entities_db_file):
+    connection = sqlite3.connect(entities_db_file)
+
+    # a result's own page lists its recipes first, the copies from ingredient pages come after
+    recipes = connection.execute(
+        "SELECT id, result, result_quantity, station, page_title = result AS own_page FROM recipes "
+        "ORDER BY own_page DESC, id"
+    ).fetchall()
+    ingredient_rows = {}
+    for recipe_id, item, quantity in connection.execute("SELECT recipe_id, item, quantity FROM recipe_ingredients"):
+        ingredient_rows.setdefault(recipe_id, []).append((item, quantity))
+    connection.close()
+
+    names, stations = {}, {}
+    def item_id(name):
+        return names.setdefault(name, len(names))
+    def station_id(name):
+        return stations.setdefault(name or "By Hand", len(stations))
+
+    # the same recipe appears once per page it is listed on, keep one copy
+    seen = set()
+    recipe_result, recipe_quantity, recipe_station, ingredient_offsets, ingredient_ids, ingredient_quantities = [], [], [], [0], [], []
+    for recipe_id, result, result_quantity, station, _ in recipes:
+        ingredients = tuple(sorted(ingredient_rows.get(recipe_id, [])))
+        key = (result.lower(), result_quantity, station, ingredients)
+        if key in seen or not ingredients:
+            continue
+        seen.add(key)
+        recipe_result.append(item_id(result))
+        recipe_quantity.append(result_quantity)
+        recipe_station.append(station_id(station))
+        for item, quantity in ingredients:
+            ingredient_ids.append(item_id(item))
+            ingredient_quantities.append(quantity)
+        ingredient_offsets.append(len(ingredient_ids))
+
+    num_items = len(names)
+    recipe_result = np.array(recipe_result, dtype=np.int32)
+    ingredient_ids = np.array(ingredient_ids, dtype=np.int32)
+    ingredient_offsets = np.array(ingredient_offsets, dtype=np.int32)
+
+    # item -> recipes that produce it, and item -> recipes that use it
+    produced_by = [[] for _ in range(num_items)]
+    for recipe, result in enumerate(recipe_result):
+        produced_by[result].append(recipe)
+    used_in = [[] for _ in range(num_items)]
+    for recipe in range(len(recipe_result)):
+        for ingredient in set(ingredient_ids[ingredient_offsets[recipe]:ingredient_offsets[recipe + 1]].tolist()):
+            used_in[ingredient].append(recipe)
+
+    def to_csr(lists):
+        offsets = np.zeros(len(lists) + 1, dtype=np.int32)
+        offsets[1:] = np.cumsum([len(values) for values in lists])
+        flat = np.array([value for values in lists for value in values], dtype=np.int32)
+        return offsets, flat
+
+    produced_offsets, produced_recipes = to_csr(produced_by)
+    used_offsets, used_recipes = to_csr(used_in)
+
+    return CraftingGraph(
+        item_names=np.array(list(names), dtype=str),
+        station_names=np.array(list(stations), dtype=str),
+        recipe_result=recipe_result,
+        recipe_quantity=np.array(recipe_quantity, dtype=np.int32),
+        recipe_station=np.array(recipe_station, dtype=np.int32),
+        ingredient_offsets=ingredient_offsets,
+        ingredient_ids=ingredient_ids,
+        ingredient_quantities=np.array(ingredient_quantities, dtype=np.int32),
+        produced_offsets=produced_offsets,
+        produced_recipes=produced_recipes,
+        used_offsets=used_offsets,
+        used_recipes=used_recipes,
+    )
+
+
+class CraftingGraph:
+    ARRAYS = [
+        "item_names", "station_names", "recipe_result", "recipe_quantity", "recipe_station",
+        "ingredient_offsets", "ingredient_ids", "ingredient_quantities",
+        "produced_offsets", "produced_recipes", "used_offsets", "used_recipes",
+    ]
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.ids_by_name = {name.lower(): i for i, name in enumerate(self.item_names.tolist())}
+        self.expansion_cache = {}
+
+    def save(self, path):
+        np.savez_compressed(path, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
+
+    def find_item(self, name):
+        name = name.lower()
+        if name in self.ids_by_name:
+            return self.ids_by_name[name]
+        if name.endswith("s") and name[:-1] in self.ids_by_name:
+            return self.ids_by_name[name[:-1]]
+        return None
+
+    def ingredients(self, recipe):
+        start, end = self.ingredient_offsets[recipe], self.ingredient_offsets[recipe + 1]
+        return zip(self.ingredient_ids[start:end].tolist(), self.ingredient_quantities[start:end].tolist())
+
+    def recipes_for(self, item):
+        return self.produced_recipes[self.produced_offsets[item]:self.produced_offsets[item + 1]].tolist()
+
+    def used_in(self, item):
+        recipes = self.used_recipes[self.used_offsets[item]:self.used_offsets[item + 1]].tolist()
+        return sorted({str(self.item_names[self.recipe_result[recipe]]) for recipe in recipes})
+
+    # raw materials and stations for ONE unit of item, memoized so shared sub-trees are expanded once.
+    # uses the first recipe of every item, anything without a recipe (or part of a cycle) counts as raw
+    def expand(self, item, visiting=frozenset()):
+        if item in self.expansion_cache:
+            return self.expansion_cache[item] + (True,)
+        recipes = self.recipes_for(item)
+        if not recipes:
+            return {item: Fraction(1)}, set(), True
+        if item in visiting:
+            # cut the cycle here, the caller's result depends on where the cycle was entered
+            return {item: Fraction(1)}, set(), False
+
+        recipe = recipes[0]
+        per_unit = Fraction(1, int(self.recipe_quantity[recipe]))
+        materials, stations = {}, {str(self.station_names[self.recipe_station[recipe]])}
+        complete = True
+        for ingredient, quantity in self.ingredients(recipe):
+            sub_materials, sub_stations, sub_complete = self.expand(ingredient, visiting | {item})
+            for material, amount in sub_materials.items():
+                materials[material] = materials.get(material, 0) + amount * quantity * per_unit
+            stations |= sub_stations
+            complete = complete and sub_complete
+
+        if complete:
+            self.expansion_cache[item] = (materials, stations)
+        return materials, stations, complete
+
+    def bill_of_materials(self, item, quantity=1):
+        materials, stations, _ = self.expand(item)
+        totals = {
+            str(self.item_names[material]): math.ceil(amount * quantity)
+            for material, amount in materials.items()
+        }
+        return dict(sorted(totals.items())), sorted(stations)
+
+    def bill_of_materials_text(self, name, quantity=1):
+        item = self.find_item(name)
+        if item is None or not self.recipes_for(item):
+            return None
+        totals, stations = self.bill_of_materials(item, quantity)
+        item_name = self.item_names[item]
+        text = f"In total, crafting {quantity} {item_name} from raw materials needs " + ", ".join(
+            f"{amount} {material}" for material, amount in totals.items()
+        )
+        text += f", using these crafting stations: {', '.join(stations)}."
+        used_in = self.used_in(item)
+        if used_in:
+            text += f" {item_name} is used in: {', '.join(used_in[:15])}."
+        return text
+
+
+# the item a crafting question is about, or None when it is not a crafting question
+def match_crafting_question(query):
+    query = normalize_query(query)
+    for pattern in TOTAL_PATTERNS + RECIPE_PATTERNS:
+        match = pattern.match(query)
+        if match:
+            return match.group("name")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the crafting graph from the entity tables")
+    parser.add_argument("entities_db_file")
+    parser.add_argument("output", help="npz file, keep it next to the faiss index")
+    args = parser.parse_args()
+
+    graph = compile_graph(args.entities_db_file)
+    graph.save(args.output)
+    print(f"Saved crafting graph with {len(graph.item_names)} items and {len(graph.recipe_result)} recipes to {args.output}")
+
+if __name__ == "__main__":
+    main()
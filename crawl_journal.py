@@ -0,0 +1,114 @@
+# journal of a crawl in sqlite: the listing's continuation token and every listed page with its download status.
+# a listing batch and the token after it are written in one transaction and a page is marked done right after it
+# is saved, so a crawl that dies is resumed by downloading the listed pages that are not done and continuing the
+# listing from the stored token. a page that failed is downloaded again by later runs until it has failed
+# max_attempts times, so one network error does not drop it from every crawl after it
+
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    pageid INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    lastrevid INTEGER,
+    touched TEXT,
+    status TEXT NOT NULL DEFAULT 'listed',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS pages_status ON pages (status);
+"""
+
+LISTED = "listed"
+FAILED = "failed"
+MAX_ATTEMPTS = 3
+
+# listed pages and failed ones with attempts left
+PENDING = "(status = ? OR (status = ? AND attempts < ?))"
+
+
+class CrawlJournal:
+    def __init__(self, journal_file, max_attempts=MAX_ATTEMPTS):
+        # the listing runs in its own thread, every access goes through the lock
+        self.connection = sqlite3.connect(journal_file, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(pages)")]
+        if "attempts" not in columns:
+            # journal of a crawl started before failed pages were retried
+            self.connection.execute("ALTER TABLE pages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            self.connection.execute("UPDATE pages SET attempts = 1 WHERE status != ?", (LISTED,))
+            self.connection.commit()
+        self.lock = threading.Lock()
+        self.max_attempts = max_attempts
+        self.pending_params = (LISTED, FAILED, max_attempts)
+
+    def get_state(self, name):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_state(self, name, value):
+        self.connection.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+
+    # the api's continue parameters for the next listing request, None before the first batch
+    def listing_continue(self):
+        return self.get_state("continue")
+
+    def listing_done(self):
+        return bool(self.get_state("listing_done"))
+
+    def started(self):
+        return self.get_state("started_at") is not None
+
+    def pending_count(self):
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM pages WHERE {PENDING}", self.pending_params).fetchone()[0]
+
+    def finished(self):
+        return self.listing_done() and self.pending_count() == 0
+
+    def start_new(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM pages")
+            self.connection.execute("DELETE FROM state")
+            self.set_state("started_at", time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+    # a page listed twice (the listing moved while we crawled) keeps its status
+    def record_listing_batch(self, pages, next_continue):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO pages (pageid, title, lastrevid, touched) VALUES (?, ?, ?, ?)",
+                [(page["pageid"], page["title"], page.get("lastrevid"), page.get("touched")) for page in pages]
+            )
+            self.set_state("continue", next_continue)
+            if next_continue is None:
+                self.set_state("listing_done", True)
+
+    def pending_pages(self):
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT pageid, title, lastrevid, touched FROM pages WHERE {PENDING} ORDER BY pageid", self.pending_params
+            ).fetchall()
+        return [{"pageid": pageid, "title": title, "lastrevid": lastrevid, "touched": touched} for pageid, title, lastrevid, touched in rows]
+
+    # status is what happened to the page: saved, duplicate or failed
+    def mark_done(self, pageid, status):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE pages SET status = ?, attempts = attempts + 1, finished_at = ? WHERE pageid = ?", (status, time.time(), pageid)
+            )
+
+    def counts(self):
+        with self.lock:
+            return dict(self.connection.execute("SELECT status, COUNT(*) FROM pages GROUP BY status").fetchall())
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,237 @@
+# collapse near-duplicate chunks before indexing using minhash signatures and lsh banding
+# usage: python dedup.py [chunk files...] -o terraria_preprocessed.json
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import zlib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
+
+from chunk_records import read_chunks
+
+MERSENNE_PRIME = (1 << 31) - 1
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# which copy of a duplicate keeps its page and section, lowest first: a recipe row is the same text on the
+# crafted item's page and under "Used in" on every ingredient's page, and only the first one answers
+# "how do I craft x" with the right page. ties go to the earlier chunk
+SECTION_PRIORITY = {"Crafting - Recipes": 0, "Crafting - Used in": 2}
+DEFAULT_PRIORITY = 1
+
+
+def representative_priority(chunk):
+    return SECTION_PRIORITY.get(chunk["metadata"]["section_title"], DEFAULT_PRIORITY)
+
+
+def provenance_entry(chunk):
+    return {"page_title": chunk["metadata"]["page_title"], "section_title": chunk["metadata"]["section_title"]}
+
+
+def shingles(text, size=3):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    def __init__(self, num_perm=128, seed=1):
+        # universal hashing (a*x + b) mod p, a and b are below 2^31 so the product fits in int64
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+
+    def signature(self, shingle_set):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) & 0x7FFFFFFF for s in shingle_set),
+            dtype=np.int64, count=len(shingle_set)
+        )
+        # one row per permutation, min over the shingles
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        root_x, root_y = self.find(x), self.find(y)
+        if root_x != root_y:
+            # the earlier chunk stays the root, the root only identifies the cluster
+            self.parent[max(root_x, root_y)] = min(root_x, root_y)
+
+
+def find_duplicate_clusters(texts, threshold=0.95, num_perm=128, bands=16, shingle_size=3):
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+    rows = num_perm // bands
+    clusters = UnionFind(len(texts))
+
+    # Step 1: exact duplicates (after normalizing case and whitespace) collapse without any hashing work
+    first_by_text = {}
+    for i, text in enumerate(texts):
+        key = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).digest()
+        if key in first_by_text:
+            clusters.union(first_by_text[key], i)
+        else:
+            first_by_text[key] = i
+    unique_ids = sorted(first_by_text.values())
+
+    # Step 2: minhash signature for every distinct text
+    hasher = MinHasher(num_perm)
+    shingle_sets = {i: shingles(texts[i], shingle_size) for i in unique_ids}
+    signatures = {i: hasher.signature(shingle_sets[i]) for i in unique_ids}
+
+    # Step 3: lsh banding, texts that agree on every row of some band land in the same bucket
+    for band in range(bands):
+        buckets = {}
+        for i in unique_ids:
+            key = signatures[i][band * rows:(band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(i)
+
+        # Step 4: verify candidates with the exact jaccard, comparing against one representative per cluster
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            representatives = []
+            for i in members:
+                for rep in representatives:
+                    if clusters.find(i) == clusters.find(rep):
+                        break
+                    if jaccard(shingle_sets[i], shingle_sets[rep]) >= threshold:
+                        clusters.union(rep, i)
+                        break
+                else:
+                    representatives.append(i)
+
+    return [clusters.find(i) for i in range(len(texts))]
+
+
+# keep the highest priority chunk of each cluster and record where every collapsed copy came from
+def deduplicate_chunks(chunks, threshold=0.95, num_perm=128, bands=16, shingle_size=3):
+    roots = find_duplicate_clusters([c["text"] for c in chunks], threshold, num_perm, bands, shingle_size)
+
+    clusters = {}
+    for i, root in enumerate(roots):
+        clusters.setdefault(root, []).append(i)
+
+    kept = {}
+    for members in clusters.values():
+        representative = min(members, key=lambda i: (representative_priority(chunks[i]), i))
+        chunk = chunks[representative]
+        metadata = dict(chunk["metadata"])
+        provenance = list(chunk["metadata"].get("duplicates", []))
+        for i in members:
+            if i != representative:
+                provenance.extend(chunks[i]["metadata"].get("duplicates", []))
+                provenance.append(provenance_entry(chunks[i]))
+        if provenance:
+            metadata["duplicates"] = provenance
+        kept[representative] = {"text": chunk["text"], "metadata": metadata}
+
+    return [kept[i] for i in sorted(kept)]
+
+
+# the same clustering for chunks that arrive one page at a time (pipeline.py): a chunk is checked against
+# every chunk kept so far and either kept or recorded as a duplicate of the best earlier one it matches.
+# a kept chunk has been passed on already, so its page and section cannot change any more: a copy with a higher
+# priority than every chunk it matches (a recipe whose "Used in" row came first) is kept as well and takes
+# the later copies. kept chunks are the dicts handed out earlier, their provenance grows as later copies come in
+class StreamingDeduplicator:
+    def __init__(self, threshold=0.95, num_perm=128, bands=16, shingle_size=3):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.first_by_text = {}
+        self.buckets = [{} for _ in range(bands)]
+        self.kept = []
+        self.priorities = []
+        self.shingle_sets = []
+        self.duplicates = 0
+
+    def better(self, i, j):
+        return j is None or (self.priorities[i], i) < (self.priorities[j], j)
+
+    def find(self, text, priority):
+        key = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).digest()
+        match = self.first_by_text.get(key)
+        if match is not None and self.priorities[match] <= priority:
+            return match, key, None, None
+        shingle_set = shingles(text, self.shingle_size)
+        signature = self.hasher.signature(shingle_set)
+        band_keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+        for band, band_key in enumerate(band_keys):
+            for i in self.buckets[band].get(band_key, ()):
+                if self.better(i, match) and jaccard(shingle_set, self.shingle_sets[i]) >= self.threshold:
+                    match = i
+        return match, key, shingle_set, band_keys
+
+    # returns the chunk to pass on, or None when it collapsed into an earlier one
+    def add(self, chunk):
+        priority = representative_priority(chunk)
+        match, key, shingle_set, band_keys = self.find(chunk["text"], priority)
+        if match is not None and self.priorities[match] <= priority:
+            provenance = self.kept[match]["metadata"]["duplicates"]
+            provenance.extend(chunk["metadata"].get("duplicates", []))
+            provenance.append(provenance_entry(chunk))
+            self.duplicates += 1
+            return None
+
+        i = len(self.kept)
+        # always a list, pipeline.resolve_provenance reads it again after the run for the copies that arrive later
+        metadata = dict(chunk["metadata"], duplicates=list(chunk["metadata"].get("duplicates", [])))
+        kept = {"text": chunk["text"], "metadata": metadata}
+        self.kept.append(kept)
+        self.priorities.append(priority)
+        self.shingle_sets.append(shingle_set)
+        if self.better(i, self.first_by_text.get(key)):
+            self.first_by_text[key] = i
+        for band, band_key in enumerate(band_keys):
+            self.buckets[band].setdefault(band_key, []).append(i)
+        return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collapse near-duplicate chunks before indexing")
+    parser.add_argument("inputs", nargs="*", help="preprocessed chunk files (default: preprocessing/terraria_preprocessed_chunks_*.json)")
+    parser.add_argument("-o", "--output", default="terraria_preprocessed.json")
+    parser.add_argument("--threshold", type=float, default=0.95, help="jaccard similarity of word shingles to count as a duplicate")
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--bands", type=int, default=16)
+    args = parser.parse_args()
+
+    inputs = args.inputs or sorted(glob.glob("preprocessing/terraria_preprocessed_chunks_*.json"))
+    chunks = []
+    for path in inputs:
+        chunks.extend(read_chunks(path))
+
+    deduplicated = deduplicate_chunks(chunks, args.threshold, args.num_perm, args.bands)
+    print(f"Collapsed {len(chunks) - len(deduplicated)} of {len(chunks)} chunks, {len(deduplicated)} left.")
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(deduplicated, output, indent=4, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
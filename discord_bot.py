@@ -1,27 +1,95 @@
 from interactions import Client, Intents, slash_command, listen, SlashContext, slash_option, OptionType, Role
 from dotenv import load_dotenv
 import os
-import json
-import numpy as np
-import faiss
 from sentence_transformers import SentenceTransformer
-from openai import OpenAI
 import asyncio
-from fuzzywuzzy import fuzz
+import time
+from retrieval import retrieve, retrieve_batch, retrieve_batch_loaded
+from token_budget import pack_context, count_tokens
+from llm_backends import get_backend
+from metrics import span, observe_stage, format_timings, format_memory, start_metrics_server
+from batching import MicroBatcher
+from structured_lookup import StructuredLookup
+from crafting_graph import CraftingGraph, match_crafting_question
+from shards import ShardedIndex
+from index_loader import load_index, load_metadata
+from index_versions import LiveIndex, CURRENT_FILE, CRAFTING_GRAPH_FILE, ENTITIES_DB_FILE
 
 AUTHORIZED_ROLE_IDS = [1316917479838322718] 
 
 load_dotenv()
 
-client = OpenAI(
-    api_key = os.getenv("OPENAI_API_KEY"),
-)
+# LLM_BACKEND picks openai (default), local (any openai-compatible server) or fake
+llm_backend = get_backend()
 
 # path to files from index
 local_folder = "index"  
 index_file = os.path.join(local_folder, "terraria_index.faiss")
 metadata_file = os.path.join(local_folder, "metadata.json")
 
+# built with shards.py, when present it replaces the single index
+shards_dir = os.path.join(local_folder, "shards")
+sharded_index = ShardedIndex(shards_dir) if os.path.isdir(shards_dir) else None
+
+# built with index_versions.py: the version named in index/CURRENT is live and followed while the bot runs
+live_index = None
+if sharded_index is None and os.path.exists(os.path.join(local_folder, CURRENT_FILE)):
+    live_index = LiveIndex(local_folder, expected_encoder="all-MiniLM-L6-v2")
+
+# indexes are memory-mapped (INDEX_MMAP=0 to turn it off), so this is quick and bot processes on one
+# host share a single copy. queries reuse what is loaded here
+if sharded_index is None and live_index is None and os.path.exists(index_file):
+    load_index(index_file)
+    load_metadata(metadata_file)
+print(f"[INFO] Index loaded: {format_memory()}")
+
+
+# recipe and drop questions only search the matching sections (QUERY_ROUTING=0 searches everything), see sections.py
+query_routing = os.getenv("QUERY_ROUTING", "1") != "0"
+
+# the loaded index to search, None for the plain index_file / metadata_file pair
+def current_index():
+    if sharded_index:
+        return sharded_index
+    if live_index:
+        return live_index.refresh()
+    return None
+
+# exact stat / recipe / drop questions are answered from the entity tables without the llm. the index builds
+# copy them next to the index; a live index version brings its own, like its crafting graph
+entities_db_file = os.path.join(local_folder, ENTITIES_DB_FILE)
+local_structured_lookup = StructuredLookup(entities_db_file) if live_index is None and os.path.exists(entities_db_file) else None
+
+
+def current_structured_lookup():
+    if live_index:
+        return current_index().structured_lookup
+    return local_structured_lookup
+
+# crafting questions get an exact bill of materials added to the prompt. a live index version brings its own
+# graph, the one in local_folder goes with a sharded or plain index
+crafting_graph_file = os.path.join(local_folder, CRAFTING_GRAPH_FILE)
+local_crafting_graph = CraftingGraph.load(crafting_graph_file) if live_index is None and os.path.exists(crafting_graph_file) else None
+
+
+def current_crafting_graph():
+    if live_index:
+        return current_index().crafting_graph
+    return local_crafting_graph
+
+
+def bill_of_materials_chunk(query):
+    crafting_graph = current_crafting_graph()
+    item_name = match_crafting_question(query) if crafting_graph else None
+    text = crafting_graph.bill_of_materials_text(item_name) if item_name else None
+    if not text:
+        return None
+    return {
+        "text": text,
+        "metadata": {"page_title": item_name, "section_title": "Bill of Materials"},
+        "score": float("inf"),  # exact data, always packed first
+    }
+
 bot = Client(intents=Intents.ALL)
 # initaize bot
 @listen()
@@ -34,58 +102,11 @@ async def on_message_create(event):
     print(f"message received: {event.message.content}")
     
 
-def retrieve(query, index_file, metadata_file, model, top_k=3, title_weight=1.5, section_weight=1.2):
-    # Step 1: remove small words and encode the query
-    stop_words = set(["how", "to", "with", "for", "the", "a", "an", "in", "at", "of"])
-    query_tokens = [word for word in query.split() if word.lower() not in stop_words]
-    cleaned_query = ' '.join(query_tokens)  # Reduced query, e.g., "craft workbench"
-    query_embedding = model.encode([cleaned_query], convert_to_tensor=False)
-    
-    # Step 2: load the FAISS index and search for closest matches
-    index = faiss.read_index(index_file)
-    distances, indices = index.search(np.array(query_embedding), k=top_k)
-    
-    # Step 3: load metadata for each result
-    with open(metadata_file, "r", encoding="utf-8") as meta_f:
-        metadata = json.load(meta_f)
-    
-    # fine tune the distance match
-    results = []
-    for i, distance in zip(indices[0], distances[0]):
-        if 0 <= i < len(metadata):
-            metadata_entry = metadata[i]
-            text = metadata_entry.get("text", "[No text available]")
-            page_title = metadata_entry.get("page_title", "").lower()
-            section_title = metadata_entry.get("section_title", "").lower()
-            
-            # Step 4: using exponential decay, convert distance to score from the fais distances
-            score = np.exp(-distance)  
-            
-            # Step 5: matching for title and section title 
-            if fuzz.partial_ratio(cleaned_query.lower(), page_title) > 80:
-                score *= title_weight  
-            if fuzz.partial_ratio(cleaned_query.lower(), section_title) > 80:
-                score *= section_weight  
-             
-            results.append({
-                "text": text,
-                "metadata": metadata_entry,
-                "score": score  
-            })
-    
-    # Step 7: sort the results by score (higher is better)
-    results = sorted(results, key=lambda x: x["score"], reverse=True)
-    
-    # Step 8: return the top_k results
-    return results[:top_k]
-
-
-def generate_response_gpt(query, retrieved_chunks, max_input_tokens=800, max_output_tokens=300, temperature=0.7):
+def generate_response_gpt(query, retrieved_chunks, max_input_tokens=800, max_output_tokens=300, temperature=0.7, backend=None, timings=None):
+    backend = backend or llm_backend
     try:
-        # Step 1: for the chunks, limit them to 200 tokens
-        estimated_chunk_token_size = 200  
-        max_chunks = max_input_tokens // estimated_chunk_token_size
-        truncated_chunks = retrieved_chunks[:max_chunks]  #
+        # Step 1: pack as many of the best chunks as fit in the token budget
+        packed_chunks, context, context_tokens = pack_context(retrieved_chunks, max_input_tokens)
 
         # Step 2: initial prompt with user query
         prompt = (
@@ -99,35 +120,37 @@ def generate_response_gpt(query, retrieved_chunks, max_input_tokens=800, max_out
         )
         
         # Step 3: add in the context
-        for i, chunk in enumerate(truncated_chunks):
-            prompt += f"({i+1}) {chunk['text']}\n"
+        prompt += context
         
         prompt += "\n--- End of Context ---\n\n"
         prompt += "Answer the user's question in a clear, step-by-step manner, citing any relevant context when appropriate.\nAnswer:"
 
+        messages = [
+            {"role": "system", "content": (
+                "You are a Terraria Q&A assistant with expertise on game mechanics, bosses, items, and progression. "
+                "If you do not know the answer to a question, politely inform the user that you don't have the exact information, "
+                "but suggest helpful resources such as the Terraria Wiki, forums, or other community resources."
+            )},
+            {"role": "user", "content": prompt}
+        ]
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        print(f"[INFO] Prompt tokens: {prompt_tokens} ({context_tokens}/{max_input_tokens} context tokens, {len(packed_chunks)}/{len(retrieved_chunks)} chunks)")
+
         # Step 4: now using the chatgpt feature double sandwich the prompt to get paying attention to context both in here and in the prompt
-        stream = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": (
-                    "You are a Terraria Q&A assistant with expertise on game mechanics, bosses, items, and progression. "
-                    "If you do not know the answer to a question, politely inform the user that you don't have the exact information, "
-                    "but suggest helpful resources such as the Terraria Wiki, forums, or other community resources."
-                )},
-                {"role": "user", "content": prompt}
-            ],
-            model="gpt-3.5-turbo-1106",
-            stream=True,
-            max_tokens=max_output_tokens,
-            temperature=temperature
-        )
+        start = time.perf_counter()
+        stream = backend.stream_chat(messages, max_tokens=max_output_tokens, temperature=temperature)
 
         # Step 5: stream content to discord
         response_content = ""
-        for chunk in stream:
-            content = chunk.choices[0].delta.content or ""
+        first_token = True
+        for content in stream:
+            if first_token:
+                observe_stage(timings, "llm_first_token", time.perf_counter() - start)
+                first_token = False
             print(content, end="")  
             response_content += content  
 
+        observe_stage(timings, "llm_total", time.perf_counter() - start)
         return response_content 
     
     except Exception as e:
@@ -136,18 +159,57 @@ def generate_response_gpt(query, retrieved_chunks, max_input_tokens=800, max_out
         return "An error occurred while processing this query. Please try again later."
 
 # this is the rag system of retrieval and generation
-def run_rag_system(query, index_file, metadata_file):
+# pass a dict as timings to get the seconds spent in each stage back
+def run_rag_system(query, index_file, metadata_file, timings=None):
     print(f"Processing query: {query}")
-    bert_model = SentenceTransformer('all-MiniLM-L6-v2')
-    retrieved_chunks = retrieve(query, index_file, metadata_file, bert_model)
-    response = generate_response_gpt(query, retrieved_chunks)
+    with span(timings, "total"):
+        with span(timings, "model_load"):
+            bert_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # over-fetch, the packer decides how many actually fit in the prompt
+        retrieved_chunks = retrieve(query, index_file, metadata_file, bert_model, top_k=10, timings=timings, routing=query_routing)
+        response = generate_response_gpt(query, retrieved_chunks, timings=timings)
     return response
 
 
-# call rag asyncrenously
-async def async_run_rag_system(query: str) -> str:
+# retrieval for every query that came in during the same few milliseconds
+def run_retrieval_batch(queries):
+    batch_timings = {}
+    with span(batch_timings, "model_load"):
+        bert_model = SentenceTransformer('all-MiniLM-L6-v2')
+    loaded_index = current_index()
+    if loaded_index:
+        results = retrieve_batch_loaded(queries, loaded_index, bert_model, top_k=10, timings=batch_timings, routing=query_routing)
+    else:
+        results = retrieve_batch(queries, index_file, metadata_file, bert_model, top_k=10, timings=batch_timings, routing=query_routing)
+    return [(retrieved_chunks, batch_timings) for retrieved_chunks in results]
+
+retrieval_batcher = MicroBatcher(
+    run_retrieval_batch,
+    window_ms=float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "5")),
+    max_batch_size=int(os.getenv("RETRIEVAL_MAX_BATCH_SIZE", "32"))
+)
+
+
+# call rag asyncrenously, concurrent queries share one batched retrieval
+async def async_run_rag_system(query: str, timings=None) -> str:
+    print(f"Processing query: {query}")
     loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(None, run_rag_system, query, index_file, metadata_file)
+    with span(timings, "total"):
+        structured_lookup = current_structured_lookup()
+        if structured_lookup:
+            with span(timings, "structured_lookup"):
+                answer = await loop.run_in_executor(None, structured_lookup.answer, query)
+            if answer:
+                return answer
+        retrieved_chunks, batch_timings = await retrieval_batcher.submit(query)
+        if timings is not None:
+            timings.update(batch_timings)
+        bill_of_materials = bill_of_materials_chunk(query)
+        if bill_of_materials:
+            retrieved_chunks = [bill_of_materials] + retrieved_chunks
+        response = await loop.run_in_executor(
+            None, lambda: generate_response_gpt(query, retrieved_chunks, timings=timings)
+        )
     return response
 
 @slash_command(name="query", description="Enter your query to search the Terraria RAG system")
@@ -174,7 +236,13 @@ async def get_response(ctx: SlashContext, input_text: str):
     required=True,
     opt_type=OptionType.STRING,
 )
-async def show_chunks(ctx: SlashContext, input_text: str):
+@slash_option(
+    name="show_timings",
+    description="Also show how long each retrieval stage took",
+    required=False,
+    opt_type=OptionType.BOOLEAN,
+)
+async def show_chunks(ctx: SlashContext, input_text: str, show_timings: bool = False):
     # Check if the user has any of the allowed roles
     user_roles = [role.id for role in ctx.author.roles]
     if not any(role_id in user_roles for role_id in AUTHORIZED_ROLE_IDS):
@@ -183,10 +251,18 @@ async def show_chunks(ctx: SlashContext, input_text: str):
 
     await ctx.defer()  
     try:
-        bert_model = SentenceTransformer('all-MiniLM-L6-v2')
-        retrieved_chunks = retrieve(input_text, index_file, metadata_file, bert_model)
+        timings = {}
+        with span(timings, "model_load"):
+            bert_model = SentenceTransformer('all-MiniLM-L6-v2')
+        loaded_index = current_index()
+        if loaded_index:
+            retrieved_chunks = retrieve_batch_loaded([input_text], loaded_index, bert_model, timings=timings, routing=query_routing)[0]
+        else:
+            retrieved_chunks = retrieve(input_text, index_file, metadata_file, bert_model, timings=timings, routing=query_routing)
         
         all_chunk_data = ""
+        if show_timings:
+            all_chunk_data += f"**Timings**:\n{format_timings(timings)}\n\n"
         
         for chunk in retrieved_chunks:
             chunk_info = ""
@@ -205,6 +281,8 @@ async def show_chunks(ctx: SlashContext, input_text: str):
         response_message = f"An error occurred while processing your query. Please try again. \n\n**Error**: {e}"
         await ctx.send(response_message)
 
-bot.start(os.getenv("DISCORD_TOKEN"))
+if __name__ == "__main__":
+    start_metrics_server(int(os.getenv("METRICS_PORT", "9108")))
+    bot.start(os.getenv("DISCORD_TOKEN"))
 
 
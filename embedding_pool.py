@@ -0,0 +1,115 @@
+# encode a corpus on every core: texts are sorted by length, cut into tasks and spread over encoder worker
+# processes with a fixed number of torch threads each, the embeddings come back in the original order.
+# EmbeddingPool.encode has the same signature as SentenceTransformer.encode, so index.write_index takes either.
+# usage: python embedding_pool.py terraria_preprocessed.json [--workers 4] [--threads 2] [--compare]
+
+import argparse
+import os
+import sys
+import time
+from multiprocessing import get_context
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
+
+from chunk_records import read_chunks
+
+DEFAULT_ENCODER = "all-MiniLM-L6-v2"
+
+
+# worker process side, one encoder per process
+worker_model = None
+worker_batch_size = 32
+
+def init_worker(encoder_name, torch_threads, batch_size):
+    global worker_model, worker_batch_size
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(torch_threads)
+    worker_model = SentenceTransformer(encoder_name, device="cpu")
+    worker_batch_size = batch_size
+
+
+def encode_task(task):
+    positions, texts = task
+    embeddings = worker_model.encode(texts, batch_size=worker_batch_size, convert_to_numpy=True)
+    return positions, embeddings.astype("float32")
+
+
+class EmbeddingPool:
+    def __init__(self, encoder_name=DEFAULT_ENCODER, workers=None, torch_threads=None, batch_size=32, task_size=512):
+        cores = os.cpu_count() or 1
+        self.workers = workers or max(1, cores // 2)
+        self.torch_threads = torch_threads or max(1, cores // self.workers)
+        self.task_size = task_size
+        # spawn, torch does not survive fork once its thread pool is running
+        self.pool = get_context("spawn").Pool(
+            self.workers, initializer=init_worker, initargs=(encoder_name, self.torch_threads, batch_size)
+        )
+
+    # tasks hold texts of similar length so a batch is not padded to its longest outlier,
+    # and small tasks keep every worker busy until the end
+    def tasks(self, texts):
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.task_size):
+            positions = order[start:start + self.task_size]
+            yield positions, [texts[i] for i in positions]
+
+    def encode(self, texts, convert_to_tensor=False):
+        embeddings = None
+        for positions, block in self.pool.imap_unordered(encode_task, self.tasks(texts)):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), block.shape[1]), dtype="float32")
+            embeddings[positions] = block
+        return embeddings if embeddings is not None else np.empty((0, 0), dtype="float32")
+
+    # one tiny task per worker, returns once the encoders are loaded
+    def warm_up(self):
+        self.pool.map(encode_task, [([0], ["warm up"])] * self.workers, chunksize=1)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode a chunk file with a pool of encoder processes and report throughput")
+    parser.add_argument("preprocessed_file")
+    parser.add_argument("--encoder", default=DEFAULT_ENCODER)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads per worker")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--limit", type=int, default=None, help="only encode the first n chunks")
+    parser.add_argument("--compare", action="store_true", help="also time the single model.encode call index.py used to make")
+    args = parser.parse_args()
+
+    texts = [chunk["text"] for chunk in read_chunks(args.preprocessed_file)][:args.limit]
+
+    baseline = None
+    if args.compare:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.encoder, device="cpu")
+        start = time.perf_counter()
+        baseline = model.encode(texts, batch_size=args.batch_size, convert_to_tensor=False)
+        seconds = time.perf_counter() - start
+        print(f"single call:  {len(texts) / seconds:>8.1f} chunks/s ({seconds:.1f}s)")
+
+    with EmbeddingPool(args.encoder, args.workers, args.threads, args.batch_size) as pool:
+        # loading the encoder in every worker is not part of the throughput
+        pool.warm_up()
+        start = time.perf_counter()
+        embeddings = pool.encode(texts)
+        seconds = time.perf_counter() - start
+        print(f"pool {pool.workers}x{pool.torch_threads}:   {len(texts) / seconds:>8.1f} chunks/s ({seconds:.1f}s)")
+
+    if baseline is not None:
+        print(f"max difference to single call: {np.abs(np.asarray(baseline) - embeddings).max():.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# local openai-compatible server backed by FakeBackend, point the bot at it with
+# LLM_BACKEND=local LLM_BASE_URL=http://localhost:8000/v1 to load test without paying for tokens
+
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from llm_backends import FakeBackend
+
+
+def make_handler(backend):
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # one line per request drowns out the load test output
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            messages = request.get("messages", [])
+            max_tokens = request.get("max_tokens") or 300
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+
+            def chunk_payload(delta, finish_reason=None):
+                return {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": backend.model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+
+            if not request.get("stream"):
+                content = "".join(backend.stream_chat(messages, max_tokens=max_tokens))
+                self.send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": backend.model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]
+                })
+                return
+
+            # server sent events, one event per token like the real api
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            self.wfile.write(f"data: {json.dumps(chunk_payload({'role': 'assistant', 'content': ''}))}\n\n".encode("utf-8"))
+            for token in backend.stream_chat(messages, max_tokens=max_tokens):
+                self.wfile.write(f"data: {json.dumps(chunk_payload({'content': token}))}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(f"data: {json.dumps(chunk_payload({}, 'stop'))}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return FakeLLMHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible chat server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--num-tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    backend = FakeBackend(
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        num_tokens=args.num_tokens
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    print(f"Fake LLM server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
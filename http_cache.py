@@ -0,0 +1,147 @@
+# persistent cache of api responses for the scraper, keyed by url and request parameters. an entry keeps the
+# response's ETag / Last-Modified and the page revision it was rendered from: a request for a revision that is
+# already cached never leaves the machine, anything else is revalidated with a conditional request, and a 304
+# costs a round trip but no body. bodies are stored compressed and the least recently used entries are evicted
+# once the cache grows over its size cap
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+import requests
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    params TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    revid INTEGER,
+    touched TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+def request_key(url, params):
+    return hashlib.sha256(f"{url}\n{json.dumps(params, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+
+class HttpCache:
+    def __init__(self, cache_file, max_bytes=DEFAULT_MAX_BYTES, commit_every=200, session=None):
+        # the pipeline downloads from several threads, every access goes through the lock
+        self.connection = sqlite3.connect(cache_file, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.session = session or requests.Session()
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.pending_writes = 0
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+
+    def lookup(self, key):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT etag, last_modified, revid, touched, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+    def touch(self, key):
+        with self.lock:
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.commit()
+
+    def store(self, key, url, params, response, revid, touched):
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, params, etag, last_modified, revid, touched, body, size, fetched_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, json.dumps(params, sort_keys=True), response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                 revid, touched, body, len(body), now, now)
+            )
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            self.commit()
+
+    # least recently used first, down to 90% of the cap so not every new entry triggers another round
+    def evict(self):
+        target = self.max_bytes * 0.9
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY last_used")
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def commit(self):
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.connection.commit()
+            self.pending_writes = 0
+
+    # json of a GET request. revid / touched describe the revision the caller expects (from the page listing),
+    # an entry rendered from that revision is returned without asking the server
+    def get_json(self, url, params, revid=None, touched=None):
+        key = request_key(url, params)
+        entry = self.lookup(key)
+        if entry is not None:
+            etag, last_modified, cached_revid, cached_touched, body = entry
+            if revid is not None and cached_revid == revid and cached_touched == touched:
+                self.hits += 1
+                self.touch(key)
+                return json.loads(zlib.decompress(body))
+
+        headers = {}
+        if entry is not None:
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        response = self.session.get(url, params=params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.not_modified += 1
+            self.touch(key)
+            return json.loads(zlib.decompress(body))
+        response.raise_for_status()
+
+        self.misses += 1
+        # compressed size as it came over the wire
+        self.bytes_downloaded += response.raw.tell() or len(response.content)
+        data = response.json()
+        if "error" in data:
+            return data
+        # without an expected revision, remember the one the response says it was rendered from
+        if revid is None and "parse" in data:
+            revid = data["parse"].get("revid")
+        self.store(key, url, params, response, revid, touched)
+        return data
+
+    def summary(self):
+        return (
+            f"HTTP cache: {self.hits} local hits, {self.not_modified} not modified, {self.misses} downloaded "
+            f"({self.bytes_downloaded / 1024 ** 2:.1f} MB), {self.total_bytes / 1024 ** 2:.1f} MB cached"
+        )
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+        self.session.close()
@@ -2,50 +2,65 @@
 # !pip install faiss-cpu sentence-transformers transformers
 
 # import dependencies
-from google.colab import drive
 import os
 import json
+import math
+import shutil
+import sys
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
-from transformers import GPT2LMHeadModel, GPT2Tokenizer, AutoTokenizer, AutoModelForCausalLM
+from crafting_graph import compile_graph
+from sections import section_type
+from embedding_pool import EmbeddingPool
 
-# connect to drive
-print("Mounting Google Drive...")
-drive.mount('/content/drive')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
 
-drive_folder = "/content/drive/MyDrive/Terraria_RAG"
-os.makedirs(drive_folder, exist_ok=True)  
+from chunk_records import read_chunks
 
-preprocessed_file = "/content/drive/MyDrive/Terraria_RAG/terraria_preprocessed.json"
-index_file = "/content/drive/MyDrive/Terraria_RAG/terraria_index.faiss"
-metadata_file = "/content/drive/MyDrive/Terraria_RAG/metadata.json"
+INDEX_TYPES = ["flat", "hnsw", "ivf"]
 
-# index the data with FAISS
-def index_data(preprocessed_file, index_file, metadata_file):
-    model = SentenceTransformer('all-MiniLM-L6-v2')     # bert like model to encode data
 
-    # read the processed file
-    with open(preprocessed_file, "r", encoding="utf-8") as f:
-        data_chunks = json.load(f)
-        # print(f"Loaded {len(data_chunks)} chunks from {preprocessed_file}.")
+# create the FAISS index for the embeddings (flat is exact, hnsw and ivf are approximate but faster on big corpora)
+def build_faiss_index(embeddings, index_type="flat"):
+    embeddings = np.array(embeddings, dtype="float32")
+    dimension = embeddings.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, 32)
+        index.hnsw.efSearch = 64
+    elif index_type == "ivf":
+        nlist = max(1, int(4 * math.sqrt(len(embeddings))))
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        index.train(embeddings)
+        index.nprobe = 8
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    index.add(embeddings)
+    return index
 
-    # save the text to embed, and it to the metadata so can be indexed 
-    texts = [chunk["text"] for chunk in data_chunks]
+# embed the chunks and write the FAISS index and its metadata (vector i is metadata entry i)
+def chunk_metadata(data_chunks):
+    # save the text to embed, and it to the metadata so can be indexed
     metadata = [
-        {"text": chunk["text"], "page_title": chunk["metadata"]["page_title"], "section_title": chunk["metadata"]["section_title"]}
+        {
+            "text": chunk["text"],
+            "page_title": chunk["metadata"]["page_title"],
+            "section_title": chunk["metadata"]["section_title"],
+            # lets retrieval search only the sections a question is about, see sections.py
+            "section_type": section_type(chunk["metadata"]["section_title"]),
+        }
         for chunk in data_chunks
     ]
-    
-    # convert to embeddings using bert model
-    # print("Encoding text chunks into embeddings...")
-    embeddings = model.encode(texts, convert_to_tensor=False)
-    # print(f"Generated {len(embeddings)} embeddings.")
+    # keep where the chunks collapsed by dedup.py came from
+    for entry, chunk in zip(metadata, data_chunks):
+        if chunk["metadata"].get("duplicates"):
+            entry["duplicates"] = chunk["metadata"]["duplicates"]
+    return metadata
 
-    # create the FAISS index (the data base and store it)
-    # print("Creating FAISS index...")
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(np.array(embeddings))
+def save_index(index, metadata, index_file, metadata_file):
     faiss.write_index(index, index_file)
     # print(f"FAISS index saved to {index_file}.")
 
@@ -53,4 +68,62 @@ def index_data(preprocessed_file, index_file, metadata_file):
     # print("Saving metadata...")
     with open(metadata_file, "w", encoding="utf-8") as meta_f:
         json.dump(metadata, meta_f, indent=4)
-    # print(f"Metadata saved to {metadata_file}.")
\ No newline at end of file
+    # print(f"Metadata saved to {metadata_file}.")
+
+def write_index(data_chunks, model, index_file, metadata_file, index_type="flat"):
+    texts = [chunk["text"] for chunk in data_chunks]
+    metadata = chunk_metadata(data_chunks)
+
+    # convert to embeddings using bert model
+    # print("Encoding text chunks into embeddings...")
+    embeddings = model.encode(texts, convert_to_tensor=False)
+    # print(f"Generated {len(embeddings)} embeddings.")
+
+    # create the FAISS index (the data base and store it)
+    # print("Creating FAISS index...")
+    index = build_faiss_index(embeddings, index_type)
+    save_index(index, metadata, index_file, metadata_file)
+    return index
+
+# the entity tables for structured_lookup.py, skipped when the index folder already holds this database
+def copy_entities_db(entities_db_file, target_file):
+    if os.path.abspath(entities_db_file) != os.path.abspath(target_file):
+        shutil.copyfile(entities_db_file, target_file)
+
+# index the data with FAISS
+# workers > 1 encodes with a pool of encoder processes instead of one model.encode call
+def index_data(preprocessed_file, index_file, metadata_file, index_type="flat", encoder_name='all-MiniLM-L6-v2', entities_db_file=None, workers=None):
+    if workers and workers > 1:
+        model = EmbeddingPool(encoder_name, workers)
+    else:
+        model = SentenceTransformer(encoder_name)     # bert like model to encode data
+
+    # read the processed file
+    data_chunks = read_chunks(preprocessed_file)
+    # print(f"Loaded {len(data_chunks)} chunks from {preprocessed_file}.")
+
+    write_index(data_chunks, model, index_file, metadata_file, index_type)
+    if isinstance(model, EmbeddingPool):
+        model.close()
+
+    # compile the crafting graph from the entity tables and keep both next to the index, where the bot reads them
+    if entities_db_file:
+        graph = compile_graph(entities_db_file)
+        graph.save(os.path.join(os.path.dirname(index_file), "crafting_graph.npz"))
+        copy_entities_db(entities_db_file, os.path.join(os.path.dirname(index_file), "terraria_entities.db"))
+
+if __name__ == "__main__":
+    # connect to drive
+    from google.colab import drive
+    print("Mounting Google Drive...")
+    drive.mount('/content/drive')
+
+    drive_folder = "/content/drive/MyDrive/Terraria_RAG"
+    os.makedirs(drive_folder, exist_ok=True)
+
+    preprocessed_file = "/content/drive/MyDrive/Terraria_RAG/terraria_preprocessed.json"
+    index_file = "/content/drive/MyDrive/Terraria_RAG/terraria_index.faiss"
+    metadata_file = "/content/drive/MyDrive/Terraria_RAG/metadata.json"
+    entities_db_file = "/content/drive/MyDrive/Terraria_RAG/terraria_entities.db"
+
+    index_data(preprocessed_file, index_file, metadata_file, entities_db_file=entities_db_file if os.path.exists(entities_db_file) else None)
@@ -0,0 +1,55 @@
+# loads faiss indexes and their metadata once per process. indexes are memory-mapped read-only by default,
+# so every bot process on a host shares the same page cache copy instead of reading a private one into ram
+# (INDEX_MMAP=0 reads the whole index into memory like before)
+
+import json
+import os
+import threading
+import faiss
+
+# IO_FLAG_MMAP_IFC maps the flat vector storage (flat, hnsw and ivf indexes), older faiss only has IO_FLAG_MMAP
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+loaded = {}
+loaded_lock = threading.Lock()
+
+
+def mmap_enabled():
+    return os.getenv("INDEX_MMAP", "1") != "0"
+
+
+def read_index(index_file, mmap=None):
+    mmap = mmap_enabled() if mmap is None else mmap
+    if mmap:
+        try:
+            return faiss.read_index(index_file, MMAP_FLAGS)
+        except RuntimeError as e:
+            print(f"[INFO] Could not memory-map {index_file}, reading it into memory: {e}")
+    return faiss.read_index(index_file)
+
+
+def read_metadata(metadata_file):
+    with open(metadata_file, "r", encoding="utf-8") as meta_f:
+        return json.load(meta_f)
+
+
+# cached per path, reloaded when the file changes on disk
+def cached(kind, path, load):
+    key = (kind, path)
+    mtime = os.stat(path).st_mtime_ns
+    with loaded_lock:
+        entry = loaded.get(key)
+        if entry and entry[0] == mtime:
+            return entry[1]
+    value = load(path)
+    with loaded_lock:
+        loaded[key] = (mtime, value)
+    return value
+
+
+def load_index(index_file, mmap=None):
+    return cached("index", index_file, lambda path: read_index(path, mmap))
+
+
+def load_metadata(metadata_file):
+    return cached("metadata", metadata_file, read_metadata)
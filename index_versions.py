@@ -0,0 +1,333 @@
+# versioned index builds: every build goes to its own content-hashed directory under <root>/versions with a
+# manifest (chunk count, encoder, dimension, file hashes) and <root>/CURRENT names the live version.
+# CURRENT is replaced atomically, so a bot never sees a half-written index or an index and metadata from
+# different builds, and switching back to an older build is one pointer swap.
+# usage: python index_versions.py build terraria_preprocessed.json index [--entities-db preprocessing/terraria_entities.db]
+#        python index_versions.py list index
+#        python index_versions.py activate index <version>
+#        python index_versions.py rollback index
+#        python index_versions.py prune index [--keep 3]
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from crafting_graph import CraftingGraph
+from index_loader import read_index, read_metadata
+from structured_lookup import StructuredLookup
+from sections import reconstruct_vectors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
+
+from chunk_records import read_chunks
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+HISTORY_FILE = "HISTORY"
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "terraria_index.faiss"
+METADATA_FILE = "metadata.json"
+CRAFTING_GRAPH_FILE = "crafting_graph.npz"
+ENTITIES_DB_FILE = "terraria_entities.db"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def version_dir(root, version):
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_current(root):
+    path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def list_versions(root):
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_root):
+        return []
+    manifests = []
+    for name in os.listdir(versions_root):
+        if not name.startswith(".") and os.path.exists(os.path.join(versions_root, name, MANIFEST_FILE)):
+            manifests.append(read_manifest(os.path.join(versions_root, name)))
+    return sorted(manifests, key=lambda manifest: manifest["created_at"])
+
+
+# point CURRENT at a version: write a temp file next to it and rename over it (atomic on posix and windows).
+# every switch is appended to HISTORY, a rollback is marked as one so the next rollback goes further back
+def activate(root, version, rollback=False):
+    verify_manifest(version_dir(root, version))
+    fd, temp_path = tempfile.mkstemp(dir=root, prefix=".current-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(temp_path, os.path.join(root, CURRENT_FILE))
+    with open(os.path.join(root, HISTORY_FILE), "a", encoding="utf-8") as f:
+        f.write(f"{time.strftime('%Y-%m-%dT%H:%M:%S')} {version}{' rollback' if rollback else ''}\n")
+    print(f"[INFO] {version} is now the live index")
+
+
+# the versions that were made live, oldest first, with everything a rollback went back past removed
+def read_history(root):
+    history_path = os.path.join(root, HISTORY_FILE)
+    stack = []
+    if not os.path.exists(history_path):
+        return stack
+    with open(history_path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            version = fields[1]
+            if fields[2:] == ["rollback"]:
+                while stack and stack[-1] != version:
+                    stack.pop()
+                if not stack:
+                    stack.append(version)
+            else:
+                stack.append(version)
+    return stack
+
+
+# back to the version that was live before the current one, repeated rollbacks keep walking back
+def rollback(root):
+    current = read_current(root)
+    stack = read_history(root)
+    while stack and stack[-1] == current:
+        stack.pop()
+    while stack:
+        version = stack.pop()
+        if version != current and os.path.isdir(version_dir(root, version)):
+            activate(root, version, rollback=True)
+            return version
+    raise ValueError("No earlier version to roll back to")
+
+
+# the cheap checks run on every load, full=True also re-hashes every file
+def verify_manifest(path, manifest=None, full=False):
+    manifest = manifest or read_manifest(path)
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise ValueError(f"{manifest['version']}: {name} is missing")
+        if os.path.getsize(file_path) != expected["bytes"]:
+            raise ValueError(f"{manifest['version']}: {name} has {os.path.getsize(file_path)} bytes, manifest says {expected['bytes']}")
+        if full and file_sha256(file_path) != expected["sha256"]:
+            raise ValueError(f"{manifest['version']}: {name} does not match its hash")
+    return manifest
+
+
+# write_files(build_dir) writes a build's files and returns its manifest fields (chunk_count, encoder, ...).
+# the files are hashed, the build directory is named after the hash and moved into place
+def publish_version(root, write_files, make_current=True):
+    # build next to the final location so the rename into place cannot cross file systems
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions_root, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=versions_root, prefix=".build-")
+    os.chmod(build_dir, 0o755)  # mkdtemp is owner-only, bots may run as another user
+    try:
+        fields = write_files(build_dir)
+
+        files = {}
+        for name in sorted(os.listdir(build_dir)):
+            path = os.path.join(build_dir, name)
+            files[name] = {"sha256": file_sha256(path), "bytes": os.path.getsize(path)}
+        version = hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+        manifest = {"version": version, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **fields, "files": files}
+        with open(os.path.join(build_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+
+        final_dir = version_dir(root, version)
+        if os.path.exists(final_dir):
+            print(f"[INFO] Version {version} already exists, nothing changed")
+            shutil.rmtree(build_dir)
+        else:
+            os.rename(build_dir, final_dir)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    if make_current:
+        activate(root, version)
+    return version
+
+
+def build_version(preprocessed_file, root, index_type="flat", encoder_name="all-MiniLM-L6-v2", entities_db_file=None, make_current=True):
+    from sentence_transformers import SentenceTransformer
+    from index import copy_entities_db, write_index
+    from crafting_graph import compile_graph
+
+    data_chunks = read_chunks(preprocessed_file)
+
+    def write_files(build_dir):
+        model = SentenceTransformer(encoder_name)
+        index = write_index(data_chunks, model, os.path.join(build_dir, INDEX_FILE), os.path.join(build_dir, METADATA_FILE), index_type)
+        if entities_db_file:
+            compile_graph(entities_db_file).save(os.path.join(build_dir, CRAFTING_GRAPH_FILE))
+            copy_entities_db(entities_db_file, os.path.join(build_dir, ENTITIES_DB_FILE))
+        return {
+            "source_file": os.path.abspath(preprocessed_file),
+            "chunk_count": index.ntotal,
+            "encoder": encoder_name,
+            "dimension": index.d,
+            "index_type": index_type,
+        }
+
+    return publish_version(root, write_files, make_current)
+
+
+# remove old versions, the live one and the newest keep versions stay
+def prune(root, keep=3):
+    current = read_current(root)
+    versions = [manifest["version"] for manifest in list_versions(root)]
+    removed = []
+    for version in versions[:-keep] if keep else versions:
+        if version != current:
+            shutil.rmtree(version_dir(root, version))
+            removed.append(version)
+    return removed
+
+
+# one loaded build, verified against its manifest; searched like a faiss index
+class IndexVersion:
+    def __init__(self, path, expected_encoder=None):
+        self.path = path
+        self.manifest = verify_manifest(path)
+        self.version = self.manifest["version"]
+        if expected_encoder and self.manifest["encoder"] != expected_encoder:
+            raise ValueError(f"{self.version} was built with {self.manifest['encoder']}, the bot encodes queries with {expected_encoder}")
+
+        self.index = read_index(os.path.join(path, INDEX_FILE))
+        self.metadata = read_metadata(os.path.join(path, METADATA_FILE))
+        if not self.index.ntotal == len(self.metadata) == self.manifest["chunk_count"]:
+            raise ValueError(
+                f"{self.version}: index has {self.index.ntotal} vectors and metadata {len(self.metadata)} entries, "
+                f"manifest says {self.manifest['chunk_count']}"
+            )
+        if self.index.d != self.manifest["dimension"]:
+            raise ValueError(f"{self.version}: index dimension {self.index.d}, manifest says {self.manifest['dimension']}")
+        # built together with the index, so a query never mixes one build's chunks with another's recipes or entities
+        crafting_graph_file = os.path.join(path, CRAFTING_GRAPH_FILE)
+        self.crafting_graph = CraftingGraph.load(crafting_graph_file) if os.path.exists(crafting_graph_file) else None
+        entities_db_file = os.path.join(path, ENTITIES_DB_FILE)
+        self.structured_lookup = StructuredLookup(entities_db_file) if os.path.exists(entities_db_file) else None
+
+    def search(self, query_embeddings, k):
+        return self.index.search(query_embeddings, k)
+
+    def reconstruct_batch(self, ids):
+        return reconstruct_vectors(self.index, ids)
+
+
+# follows CURRENT: refresh() swaps in a new version when the pointer moves. a query keeps the version object it
+# got from refresh(), so queries already running finish on the old version while new ones use the new one.
+# a version that fails verification is never swapped in, the old one stays live
+class LiveIndex:
+    def __init__(self, root, expected_encoder=None):
+        self.root = root
+        self.expected_encoder = expected_encoder
+        self.lock = threading.Lock()
+        self.current = None
+        self.pointer_stat = None
+        if self.refresh() is None:
+            raise FileNotFoundError(f"No usable index version in {root}")
+
+    def refresh(self):
+        # activate() renames a new file over CURRENT, so its inode changes with every switch
+        try:
+            stat = os.stat(os.path.join(self.root, CURRENT_FILE))
+        except FileNotFoundError:
+            return self.current
+        pointer_stat = (stat.st_ino, stat.st_mtime_ns)
+        if pointer_stat == self.pointer_stat:
+            return self.current
+
+        with self.lock:
+            if pointer_stat == self.pointer_stat:
+                return self.current
+            self.pointer_stat = pointer_stat
+            version = read_current(self.root)
+            if self.current and self.current.version == version:
+                return self.current
+            try:
+                loaded = IndexVersion(version_dir(self.root, version), self.expected_encoder)
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"[INFO] Not switching to index version {version}: {e}")
+                return self.current
+            previous = self.current.version if self.current else None
+            self.current = loaded
+            print(f"[INFO] Live index version {previous} -> {loaded.version} ({loaded.manifest['chunk_count']} chunks)")
+            return self.current
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, list and switch versioned index builds")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build a new version and make it live")
+    build_parser.add_argument("preprocessed_file")
+    build_parser.add_argument("root", help="index folder, e.g. index")
+    build_parser.add_argument("--index-type", default="flat", choices=["flat", "hnsw", "ivf"])
+    build_parser.add_argument("--encoder", default="all-MiniLM-L6-v2")
+    build_parser.add_argument("--entities-db", default=None)
+    build_parser.add_argument("--no-activate", action="store_true", help="build only, keep the current version live")
+
+    list_parser = subparsers.add_parser("list")
+    list_parser.add_argument("root")
+    list_parser.add_argument("--verify", action="store_true", help="re-hash every file")
+
+    activate_parser = subparsers.add_parser("activate")
+    activate_parser.add_argument("root")
+    activate_parser.add_argument("version")
+
+    rollback_parser = subparsers.add_parser("rollback")
+    rollback_parser.add_argument("root")
+
+    prune_parser = subparsers.add_parser("prune")
+    prune_parser.add_argument("root")
+    prune_parser.add_argument("--keep", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_version(args.preprocessed_file, args.root, args.index_type, args.encoder, args.entities_db, not args.no_activate)
+    elif args.command == "list":
+        current = read_current(args.root)
+        for manifest in list_versions(args.root):
+            status = ""
+            if args.verify:
+                try:
+                    verify_manifest(version_dir(args.root, manifest["version"]), manifest, full=True)
+                    status = "ok"
+                except ValueError as e:
+                    status = f"BROKEN: {e}"
+            marker = "*" if manifest["version"] == current else " "
+            print(f"{marker} {manifest['version']}  {manifest['created_at']}  {manifest['chunk_count']:>7} chunks  {manifest['encoder']}  {manifest['index_type']}  {status}")
+    elif args.command == "activate":
+        activate(args.root, args.version)
+    elif args.command == "rollback":
+        rollback(args.root)
+    else:
+        for version in prune(args.root, args.keep):
+            print(f"[INFO] Removed {version}")
+
+if __name__ == "__main__":
+    main()
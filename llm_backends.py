@@ -0,0 +1,92 @@
+import os
+import time
+import zlib
+from openai import OpenAI
+
+DEFAULT_OPENAI_MODEL = "gpt-3.5-turbo-1106"
+
+
+# every backend takes chat messages and yields the response a piece at a time
+class LLMBackend:
+    name = "base"
+    model = None
+
+    def stream_chat(self, messages, max_tokens=300, temperature=0.7):
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, model=DEFAULT_OPENAI_MODEL, api_key=None, base_url=None):
+        self.model = model
+        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"), base_url=base_url)
+
+    def stream_chat(self, messages, max_tokens=300, temperature=0.7):
+        stream = self.client.chat.completions.create(
+            messages=messages,
+            model=self.model,
+            stream=True,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            yield chunk.choices[0].delta.content or ""
+
+
+# anything that speaks the openai chat completions api (vllm, llama.cpp server, fake_llm_server.py, ...)
+class LocalHTTPBackend(OpenAIBackend):
+    name = "local"
+
+    def __init__(self, model="local-model", base_url="http://localhost:8000/v1", api_key="not-needed"):
+        super().__init__(model=model, api_key=api_key, base_url=base_url)
+
+
+# deterministic stand-in: same prompt gives the same tokens, with configurable latency
+class FakeBackend(LLMBackend):
+    name = "fake"
+    vocabulary = [
+        "Craft", "the", "item", "at", "a", "Work", "Bench", "using", "Wood", "and",
+        "defeat", "the", "boss", "before", "entering", "Hardmode", "to", "unlock", "better", "gear",
+    ]
+
+    def __init__(self, model="fake-model", first_token_latency=0.3, token_latency=0.02, num_tokens=60):
+        self.model = model
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.num_tokens = num_tokens
+
+    def generate_tokens(self, messages, max_tokens):
+        # crc32 instead of hash() so the output does not change between runs
+        seed = zlib.crc32("".join(message["content"] for message in messages).encode("utf-8"))
+        count = min(self.num_tokens, max_tokens)
+        return [
+            self.vocabulary[(seed + i * 7) % len(self.vocabulary)] + " "
+            for i in range(count)
+        ]
+
+    def stream_chat(self, messages, max_tokens=300, temperature=0.7):
+        for i, token in enumerate(self.generate_tokens(messages, max_tokens)):
+            time.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            yield token
+
+
+# pick the backend from the environment, LLM_BACKEND = openai (default), local or fake
+def get_backend(name=None):
+    name = name or os.getenv("LLM_BACKEND", "openai")
+    if name == "openai":
+        return OpenAIBackend(model=os.getenv("LLM_MODEL", DEFAULT_OPENAI_MODEL))
+    if name == "local":
+        return LocalHTTPBackend(
+            model=os.getenv("LLM_MODEL", "local-model"),
+            base_url=os.getenv("LLM_BASE_URL", "http://localhost:8000/v1")
+        )
+    if name == "fake":
+        return FakeBackend(
+            first_token_latency=float(os.getenv("FAKE_LLM_FIRST_TOKEN_LATENCY", "0.3")),
+            token_latency=float(os.getenv("FAKE_LLM_TOKEN_LATENCY", "0.02")),
+            num_tokens=int(os.getenv("FAKE_LLM_NUM_TOKENS", "60"))
+        )
+    raise ValueError(f"Unknown LLM backend: {name}")
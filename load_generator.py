@@ -0,0 +1,116 @@
+# drive async_run_rag_system at a fixed rate and report latency percentiles per stage
+# run offline with LLM_BACKEND=fake, or LLM_BACKEND=local against fake_llm_server.py
+# usage: python load_generator.py [--qps 5] [--requests 200] [--queries-file queries.txt]
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from discord_bot import async_run_rag_system
+from metrics import STAGES
+
+DEFAULT_QUERIES = [
+    "How do I craft a Terra Blade?",
+    "What does the Eye of Cthulhu drop?",
+    "How to summon the Wall of Flesh",
+    "What is the best armor before Hardmode?",
+    "Where can I find Hellstone?",
+    "How much health does the Moon Lord have in Expert mode?",
+    "What do I need to make a Work Bench?",
+    "Which NPC sells the Cell Phone?",
+]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest rank
+    rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+async def run_one(query, results):
+    timings = {}
+    start = time.perf_counter()
+    try:
+        await async_run_rag_system(query, timings)
+    except Exception as e:
+        print(f"[INFO] Request failed for query '{query}': {e}")
+        results["errors"] += 1
+        return
+    timings["end_to_end"] = time.perf_counter() - start  # includes waiting for an executor thread
+    results["timings"].append(timings)
+
+
+async def run_load(queries, qps, num_requests):
+    results = {"timings": [], "errors": 0}
+    tasks = []
+    start = time.perf_counter()
+
+    # open loop: requests go out on schedule whether or not earlier ones finished
+    for i in range(num_requests):
+        delay = start + i / qps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run_one(queries[i % len(queries)], results)))
+
+    await asyncio.gather(*tasks)
+    results["wall_time"] = time.perf_counter() - start
+    return results
+
+
+def summarize(results, qps):
+    summary = {
+        "target_qps": qps,
+        "requests": len(results["timings"]) + results["errors"],
+        "errors": results["errors"],
+        "wall_time": results["wall_time"],
+        "achieved_qps": len(results["timings"]) / results["wall_time"] if results["wall_time"] else 0,
+        "stages": {}
+    }
+    for stage in STAGES + ["end_to_end"]:
+        values = [timings[stage] for timings in results["timings"] if stage in timings]
+        if values:
+            summary["stages"][stage] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+    return summary
+
+
+def print_summary(summary):
+    print(f"\nRequests: {summary['requests']} ({summary['errors']} errors) in {summary['wall_time']:.2f}s")
+    print(f"Target QPS: {summary['target_qps']:.2f}, achieved: {summary['achieved_qps']:.2f}")
+    print(f"{'stage':<18}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in summary["stages"].items():
+        print(f"{stage:<18}{stats['p50'] * 1000:>10.1f}{stats['p90'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}{stats['max'] * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Terraria RAG pipeline")
+    parser.add_argument("--qps", type=float, default=1.0, help="target requests per second")
+    parser.add_argument("--requests", type=int, default=20, help="total number of requests to send")
+    parser.add_argument("--queries-file", help="text file with one query per line")
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    results = asyncio.run(run_load(queries, args.qps, args.requests))
+    summary = summarize(results, args.qps)
+    print_summary(summary)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# per-stage timing spans for the rag pipeline, aggregated into histograms and
+# served in the prometheus text format on a local http endpoint
+
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# stages in the order a request goes through them
+STAGES = [
+    "structured_lookup",
+    "model_load",
+    "query_encode",
+    "index_load",
+    "index_search",
+    "metadata_load",
+    "rerank",
+    "llm_first_token",
+    "llm_total",
+    "total",
+]
+
+# prometheus client defaults, in seconds
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+stage_histograms = {stage: Histogram() for stage in STAGES}
+histograms_lock = threading.Lock()
+
+
+def observe_stage(timings, stage, seconds):
+    with histograms_lock:
+        histogram = stage_histograms.setdefault(stage, Histogram())
+    histogram.observe(seconds)
+    if timings is not None:
+        timings[stage] = seconds
+
+
+# with span(timings, "index_search"): ...  records into the request's timings dict and the histogram
+@contextmanager
+def span(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(timings, stage, time.perf_counter() - start)
+
+
+def format_timings(timings):
+    ordered = [stage for stage in STAGES if stage in timings] + [stage for stage in timings if stage not in STAGES]
+    return "\n".join(f"{stage}: {timings[stage] * 1000:.1f} ms" for stage in ordered)
+
+
+def render_prometheus():
+    lines = [
+        "# HELP rag_stage_seconds Time spent in each stage of the RAG pipeline.",
+        "# TYPE rag_stage_seconds histogram",
+    ]
+    with histograms_lock:
+        items = list(stage_histograms.items())
+    for stage, histogram in items:
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets + ["+Inf"], counts):
+            cumulative += bucket_count
+            lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {count}')
+
+    lines += [
+        "# HELP rag_resident_memory_bytes Resident memory of this process.",
+        "# TYPE rag_resident_memory_bytes gauge",
+        f"rag_resident_memory_bytes {resident_memory_bytes()}",
+        "# HELP rag_shared_memory_bytes Resident memory backed by files, e.g. memory-mapped indexes shared with other processes.",
+        "# TYPE rag_shared_memory_bytes gauge",
+        f"rag_shared_memory_bytes {shared_memory_bytes()}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the bot's console
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# serve /metrics from a daemon thread so it never keeps the bot alive
+def start_metrics_server(port=9108, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
+# resident set size of this process, /proc is linux only so fall back to the peak from getrusage
+def resident_memory_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # bytes on mac, kilobytes on linux
+
+
+# the part of the resident memory backed by files, memory-mapped indexes live here as a single page cache
+# copy shared by every process that maps them. 0 where /proc is not available
+def shared_memory_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[2]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def format_memory():
+    resident, shared = resident_memory_bytes(), shared_memory_bytes()
+    return f"{resident / 2**20:.1f} MiB resident, {shared / 2**20:.1f} MiB shared, {(resident - shared) / 2**20:.1f} MiB private"
@@ -0,0 +1,447 @@
+# one local run from the wiki to a live index version: list -> download -> filter -> preprocess -> chunk -> embed.
+# every stage has its own workers and hands its output to the next one through a bounded queue, so pages are
+# filtered, chunked and embedded while the crawl is still running. a full queue blocks the stage in front of it,
+# so a slow stage backs the pipeline up instead of filling memory, and a rebuild takes about as long as the
+# slowest stage instead of the sum of all of them.
+# usage: python pipeline.py index [--download-workers 8] [--preprocess-workers 4] [--embed-workers 1]
+#        python pipeline.py index --pages-dir terraria_wiki_pages   (re-index the pages already on disk, no crawl)
+
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
+
+from chunking import DEFAULT_MAX_TOKENS, DEFAULT_MIN_TOKENS, DEFAULT_OVERLAP, normalize_chunks
+from dedup import StreamingDeduplicator
+from remove_redundant_pages import unwanted_reason
+
+DEFAULT_ENCODER = "all-MiniLM-L6-v2"
+
+# end of a stage's input, every worker of the stage gets one
+DONE = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+# function takes one item (a list of up to batch_size items when batch_size > 1) and returns the items
+# for the next stage. stages with state shared between items (filter, chunk) run a single worker
+class Stage:
+    def __init__(self, name, function, workers=1, queue_size=64, batch_size=1):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.finished_workers = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.backlog_total = 0
+        self.backlog_max = 0
+        self.backlog_samples = 0
+        self.started = None
+        self.finished = None
+
+    def record(self, items_in, items_out, busy_seconds, blocked_seconds):
+        with self.lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_seconds += busy_seconds
+            self.blocked_seconds += blocked_seconds
+
+    def sample_backlog(self):
+        backlog = self.queue.qsize()
+        self.backlog_total += backlog
+        self.backlog_max = max(self.backlog_max, backlog)
+        self.backlog_samples += 1
+
+    def stats(self, wall_seconds):
+        active = (self.finished or time.perf_counter()) - self.started if self.started else 0.0
+        return {
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": self.busy_seconds,
+            # time spent waiting for room in the next stage's queue
+            "blocked_seconds": self.blocked_seconds,
+            "active_seconds": active,
+            # what the stage manages while the pipeline runs, and what it could do if it never waited on its input
+            "items_per_second": self.items_in / wall_seconds if wall_seconds else 0.0,
+            "capacity_per_second": self.items_in * self.workers / self.busy_seconds if self.busy_seconds else 0.0,
+            "backlog_avg": self.backlog_total / self.backlog_samples if self.backlog_samples else 0.0,
+            "backlog_max": self.backlog_max,
+        }
+
+
+class Pipeline:
+    def __init__(self, source, stages, sink, report_every=10.0):
+        self.source = source
+        self.source_stats = Stage("list", None, queue_size=1)
+        self.stages = stages
+        self.sink = sink
+        self.sink_lock = threading.Lock()
+        self.report_every = report_every
+        self.failed = threading.Event()
+        self.errors = []
+        self.started = None
+
+    # queue operations that give up once another stage failed, so an error cannot leave threads blocked forever
+    def put(self, q, item):
+        while True:
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                if self.failed.is_set():
+                    raise PipelineAborted()
+
+    def get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                if self.failed.is_set():
+                    raise PipelineAborted()
+
+    def emit(self, index, item):
+        if index + 1 < len(self.stages):
+            self.put(self.stages[index + 1].queue, item)
+        else:
+            with self.sink_lock:
+                self.sink(item)
+
+    # the last worker of a stage to finish ends the input of the next one
+    def finish(self, index):
+        stage = self.stages[index] if index >= 0 else self.source_stats
+        with stage.lock:
+            stage.finished_workers += 1
+            last = stage.finished_workers == stage.workers
+        if last:
+            stage.finished = time.perf_counter()
+            if index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    self.put(self.stages[index + 1].queue, DONE)
+
+    def fail(self, error):
+        self.errors.append(error)
+        self.failed.set()
+
+    def run_source(self):
+        stats = self.source_stats
+        stats.started = time.perf_counter()
+        try:
+            iterator = iter(self.source)
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, DONE)
+                stats.record(0, 0, time.perf_counter() - start, 0.0)
+                if item is DONE:
+                    break
+                start = time.perf_counter()
+                self.put(self.stages[0].queue, item)
+                stats.record(1, 1, 0.0, time.perf_counter() - start)
+            self.finish(-1)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self.fail(e)
+
+    # up to batch_size items, fewer when the queue runs dry; done is set once the stage's input ended
+    def take(self, stage):
+        item = self.get(stage.queue)
+        if item is DONE:
+            return [], True
+        batch = [item]
+        while len(batch) < stage.batch_size:
+            try:
+                item = stage.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def run_worker(self, index):
+        stage = self.stages[index]
+        try:
+            done = False
+            while not done:
+                batch, done = self.take(stage)
+                if not batch:
+                    continue
+                start = time.perf_counter()
+                outputs = stage.function(batch if stage.batch_size > 1 else batch[0])
+                busy = time.perf_counter() - start
+                start = time.perf_counter()
+                for output in outputs:
+                    self.emit(index, output)
+                stage.record(len(batch), len(outputs), busy, time.perf_counter() - start)
+            self.finish(index)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self.fail(e)
+
+    def report(self):
+        wall = time.perf_counter() - self.started
+        parts = [f"list {self.source_stats.items_out}"]
+        for stage in self.stages:
+            parts.append(f"{stage.name} {stage.items_in} (queue {stage.queue.qsize()})")
+        print(f"[{wall:7.1f}s] " + " | ".join(parts))
+
+    def monitor(self, threads):
+        last_report = time.perf_counter()
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.1)
+            for stage in self.stages:
+                stage.sample_backlog()
+            if self.report_every and time.perf_counter() - last_report >= self.report_every:
+                self.report()
+                last_report = time.perf_counter()
+
+    def run(self):
+        self.started = time.perf_counter()
+        threads = [threading.Thread(target=self.run_source, name="list", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            stage.started = self.started
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(target=self.run_worker, args=(index,), name=f"{stage.name}-{worker}", daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            self.monitor(threads)
+        except KeyboardInterrupt:
+            self.fail(KeyboardInterrupt())
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return time.perf_counter() - self.started
+
+    def stats(self):
+        wall = time.perf_counter() - self.started
+        return {stage.name: stage.stats(wall) for stage in [self.source_stats] + self.stages}
+
+    def summary(self):
+        wall = time.perf_counter() - self.started
+        lines = [f"{'stage':<12}{'workers':>8}{'in':>8}{'out':>8}{'busy s':>9}{'blocked s':>10}{'items/s':>9}{'capacity/s':>11}{'backlog':>14}"]
+        for name, stats in self.stats().items():
+            lines.append(
+                f"{name:<12}{stats['workers']:>8}{stats['items_in']:>8}{stats['items_out']:>8}{stats['busy_seconds']:>9.1f}"
+                f"{stats['blocked_seconds']:>10.1f}{stats['items_per_second']:>9.1f}{stats['capacity_per_second']:>11.1f}"
+                f"{stats['backlog_avg']:>8.1f} / {stats['backlog_max']:<3}"
+            )
+        # a stage's work spread over its workers, the slowest one sets the pace
+        work = {stage.name: stage.busy_seconds / stage.workers for stage in [self.source_stats] + self.stages}
+        slowest = max(work, key=work.get)
+        lines.append(f"wall {wall:.1f}s, slowest stage {slowest} ({work[slowest]:.1f}s of work per worker), sum of all stages {sum(work.values()):.1f}s")
+        return "\n".join(lines)
+
+
+# preprocess worker processes: the handlers and the chunk cleanup rules are loaded once per process
+worker_chunk_cleaner = None
+
+def init_preprocess_worker():
+    global worker_chunk_cleaner
+    from rule_engine import RuleEngine, load_rules
+    import preprocessing  # noqa: F401, loads the handlers and their rules
+    worker_chunk_cleaner = RuleEngine(load_rules("chunks"))
+
+
+def preprocess_page(page_title, html):
+    import preprocessing
+    chunks, entity_rows = preprocessing.process_page(html, page_title)
+    return [worker_chunk_cleaner.clean_record(chunk) for chunk in chunks], entity_rows
+
+
+def list_pages_dir(pages_dir):
+    for file_name in sorted(os.listdir(pages_dir)):
+        if file_name.endswith(".html"):
+            yield os.path.join(pages_dir, file_name)
+
+
+# chunks kept early are passed on before their later copies arrive, the deduplicator keeps adding those to the
+# kept chunk's own provenance. each output chunk gets the final provenance of the kept chunks it was made from
+def resolve_provenance(piece_sources):
+    for piece, kept_chunks in piece_sources:
+        duplicates = [entry for kept in kept_chunks for entry in kept["metadata"]["duplicates"]]
+        if duplicates:
+            piece["metadata"]["duplicates"] = duplicates
+        else:
+            piece["metadata"].pop("duplicates", None)
+
+
+def build_pipeline(args, chunks, embeddings, entity_rows, piece_sources):
+    import scraper
+
+    # list: the wiki's page listing, or the html files of an earlier crawl
+    if args.pages_dir:
+        source = list_pages_dir(args.pages_dir)
+
+        def download(path):
+            with open(path, "rb") as f:
+                return [(os.path.splitext(os.path.basename(path))[0], f.read())]
+    else:
+        if not args.no_http_cache:
+            from http_cache import HttpCache
+            scraper.http_cache = HttpCache(args.http_cache or scraper.CACHE_FILE, session=scraper.session)
+        sections = scraper.handled_section_titles() if args.sections else None
+        source = scraper.iter_all_pages()
+
+        def download(page):
+            title, content = scraper.fetch_expanded_page_content(page["pageid"], page.get("lastrevid"), page.get("touched"), sections)
+            if not (title and content):
+                return []
+            if args.save_pages:
+                scraper.save_page_content(title, content)
+            return [(title, content.encode("utf-8"))]
+
+    seen_hashes = set()
+    removed = {}
+
+    def keep_page(page):
+        title, html = page
+        reason = unwanted_reason(f"{title.replace('/', '_')}.html", html, seen_hashes)
+        if reason:
+            removed[reason] = removed.get(reason, 0) + 1
+            return []
+        return [page]
+
+    # the worker threads only wait on the process pool, parsing runs in the processes
+    preprocess_pool = ProcessPoolExecutor(args.preprocess_workers, mp_context=get_context("spawn"), initializer=init_preprocess_worker)
+
+    def preprocess(page):
+        title, html = page
+        return [preprocess_pool.submit(preprocess_page, title, html).result()]
+
+    # dedup across every page seen so far, then even out the chunk sizes of this page
+    deduplicator = StreamingDeduplicator(args.dedup_threshold)
+
+    def chunk(page):
+        page_chunks, page_entity_rows = page
+        entity_rows.extend(page_entity_rows)
+        kept = [kept_chunk for kept_chunk in map(deduplicator.add, page_chunks) if kept_chunk]
+        if not kept:
+            return []
+        sources = []
+        normalized, _ = normalize_chunks(kept, args.max_tokens, args.min_tokens, args.overlap, sources=sources)
+        piece_sources.extend((piece, [kept[i] for i in source]) for piece, source in zip(normalized, sources))
+        return normalized
+
+    # one encoder in this process, or a pool with one encoder process per embed worker thread
+    if args.embed_workers > 1:
+        from embedding_pool import EmbeddingPool
+        model = EmbeddingPool(args.encoder, args.embed_workers, task_size=args.embed_batch_size)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.encoder)
+
+    def embed(batch):
+        return [(batch, model.encode([c["text"] for c in batch], convert_to_tensor=False))]
+
+    def collect(item):
+        batch, batch_embeddings = item
+        chunks.extend(batch)
+        embeddings.append(np.asarray(batch_embeddings, dtype="float32"))
+
+    stages = [
+        Stage("download", download, args.download_workers, args.queue_size),
+        Stage("filter", keep_page, 1, args.queue_size),
+        Stage("preprocess", preprocess, args.preprocess_workers, args.queue_size),
+        Stage("chunk", chunk, 1, args.queue_size),
+        Stage("embed", embed, args.embed_workers, args.queue_size * 8, batch_size=args.embed_batch_size),
+    ]
+
+    def close():
+        preprocess_pool.shutdown()
+        if args.embed_workers > 1:
+            model.close()
+        if scraper.http_cache:
+            print(scraper.http_cache.summary())
+            scraper.http_cache.close()
+        print(f"Filtered pages: {removed or 'none'}, duplicate chunks collapsed: {deduplicator.duplicates}")
+
+    return Pipeline(source, stages, collect, args.report_every), close
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl, preprocess and index the wiki in one streaming run")
+    parser.add_argument("root", help="index folder, the result becomes a new version there (see index_versions.py)")
+    parser.add_argument("--pages-dir", default=None, help="index the html files of an earlier crawl instead of crawling")
+    parser.add_argument("--save-pages", action="store_true", help="also write the crawled pages to scraper.OUTPUT_DIR")
+    parser.add_argument("--http-cache", default=None, help="response cache of the crawl, default scraper.CACHE_FILE")
+    parser.add_argument("--no-http-cache", action="store_true", help="download every page again")
+    parser.add_argument("--sections", action="store_true", help="only crawl the lead and the sections the preprocessing handles")
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--preprocess-workers", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--embed-workers", type=int, default=1, help="more than one starts a pool of encoder processes")
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--queue-size", type=int, default=64, help="items a stage may queue up in front of the next one")
+    parser.add_argument("--encoder", default=DEFAULT_ENCODER)
+    parser.add_argument("--index-type", default="flat", choices=["flat", "hnsw", "ivf"])
+    parser.add_argument("--dedup-threshold", type=float, default=0.95)
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--min-tokens", type=int, default=DEFAULT_MIN_TOKENS)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP)
+    parser.add_argument("--entities-db", default=None, help="also rebuild this entity database and the crafting graph")
+    parser.add_argument("--chunks-file", default=None, help="also write the final chunks as json")
+    parser.add_argument("--no-activate", action="store_true", help="build only, keep the current version live")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines, 0 for none")
+    args = parser.parse_args()
+
+    chunks, embeddings, entity_rows, piece_sources = [], [], [], []
+    pipeline, close = build_pipeline(args, chunks, embeddings, entity_rows, piece_sources)
+    try:
+        pipeline.run()
+    finally:
+        close()
+    resolve_provenance(piece_sources)
+    print(pipeline.summary())
+    if not chunks:
+        raise SystemExit("No chunks came out of the pipeline, nothing to index")
+
+    import json
+    from index import build_faiss_index, chunk_metadata, copy_entities_db, save_index
+    from index_versions import CRAFTING_GRAPH_FILE, ENTITIES_DB_FILE, INDEX_FILE, METADATA_FILE, publish_version
+
+    if args.chunks_file:
+        with open(args.chunks_file, "w", encoding="utf-8") as output:
+            json.dump(chunks, output, indent=4, ensure_ascii=False)
+    if args.entities_db:
+        from entity_store import EntityStore, replay_entity_rows
+        store = EntityStore(args.entities_db)
+        store.clear()
+        replay_entity_rows(store, entity_rows)
+        store.close()
+
+    def write_files(build_dir):
+        from crafting_graph import compile_graph
+        index = build_faiss_index(np.vstack(embeddings), args.index_type)
+        save_index(index, chunk_metadata(chunks), os.path.join(build_dir, INDEX_FILE), os.path.join(build_dir, METADATA_FILE))
+        if args.entities_db:
+            compile_graph(args.entities_db).save(os.path.join(build_dir, CRAFTING_GRAPH_FILE))
+            copy_entities_db(args.entities_db, os.path.join(build_dir, ENTITIES_DB_FILE))
+        return {
+            "source_file": os.path.abspath(args.pages_dir) if args.pages_dir else "crawl",
+            "chunk_count": index.ntotal,
+            "encoder": args.encoder,
+            "dimension": index.d,
+            "index_type": args.index_type,
+        }
+
+    publish_version(args.root, write_files, not args.no_activate)
+
+if __name__ == "__main__":
+    main()
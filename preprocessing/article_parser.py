@@ -0,0 +1,26 @@
+# build the soup of the article body only: the html is cut before the navboxes at the end of the page and
+# only div.mw-parser-output is turned into a tree, so navboxes, page chrome and scripts never become tags
+
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+
+PARSER_OUTPUT = SoupStrainer("div", class_="mw-parser-output")
+NAVBOX_PATTERN = re.compile(rb'<(?:div|table)\b[^>]*\bclass="[^"]*\bnavbox\b')
+
+
+# navboxes come after the last section. the cut only happens when no section heading follows the first one,
+# so a navbox inside the article never loses the sections after it
+def trim_article(html):
+    match = NAVBOX_PATTERN.search(html)
+    if match and html.find(b"<h2", match.start()) == -1:
+        return html[:match.start()]
+    return html
+
+
+def parse_article(html, restricted=True):
+    if restricted:
+        soup = BeautifulSoup(trim_article(html).decode("utf-8"), "html.parser", parse_only=PARSER_OUTPUT)
+        if soup.contents:
+            return soup
+    # pages without the wrapper (saved from another source) are parsed whole
+    return BeautifulSoup(html.decode("utf-8"), "html.parser")
@@ -0,0 +1,137 @@
+# compact chunks: a record per chunk with __slots__ holding the text and the ids of its page and section title
+# in a string table shared by all chunks, instead of two dicts per chunk repeating the same title strings.
+# on disk the titles are stored once and the chunks refer to them by id:
+#   {"format": "compact-chunks", "version": 1, "strings": [...], "chunks": [[text, page_id, section_id], ...]}
+# a chunk with metadata beyond the two titles carries it as a fourth element.
+# usage: python preprocessing/chunk_records.py compact.json -o chunks.json   (to the list of chunk dicts)
+#        python preprocessing/chunk_records.py chunks.json -o compact.json --compact
+
+import argparse
+import json
+
+FORMAT = "compact-chunks"
+VERSION = 1
+
+
+class StringTable:
+    def __init__(self, strings=()):
+        self.strings = []
+        self.ids = {}
+        for string in strings:
+            self.intern(string)
+
+    def intern(self, string):
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+
+class ChunkRecord:
+    __slots__ = ("text", "page_id", "section_id", "extra")
+
+    def __init__(self, text, page_id, section_id, extra=None):
+        self.text = text
+        self.page_id = page_id
+        self.section_id = section_id
+        self.extra = extra
+
+
+# collects chunks as records. iterating or indexing gives the usual chunk dicts, built on demand
+class ChunkStore:
+    def __init__(self, titles=None):
+        self.titles = titles or StringTable()
+        self.records = []
+
+    def append(self, chunk):
+        metadata = chunk["metadata"]
+        extra = {key: value for key, value in metadata.items() if key not in ("page_title", "section_title")}
+        self.records.append(ChunkRecord(
+            chunk["text"], self.titles.intern(metadata["page_title"]), self.titles.intern(metadata["section_title"]), extra or None
+        ))
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.append(chunk)
+
+    def to_dict(self, record):
+        metadata = {"page_title": self.titles[record.page_id], "section_title": self.titles[record.section_id]}
+        if record.extra:
+            metadata.update(record.extra)
+        return {"text": record.text, "metadata": metadata}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        return self.to_dict(self.records[i])
+
+    def __iter__(self):
+        for record in self.records:
+            yield self.to_dict(record)
+
+    def write(self, path):
+        rows = []
+        for record in self.records:
+            row = [record.text, record.page_id, record.section_id]
+            if record.extra:
+                row.append(record.extra)
+            rows.append(row)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"format": FORMAT, "version": VERSION, "strings": self.titles.strings, "chunks": rows}, f, ensure_ascii=False)
+
+    @classmethod
+    def from_compact(cls, data):
+        if data.get("format") != FORMAT or data.get("version") != VERSION:
+            raise ValueError(f"Not a {FORMAT} v{VERSION} file (format {data.get('format')}, version {data.get('version')})")
+        store = cls(StringTable(data["strings"]))
+        store.records = [ChunkRecord(*row) for row in data["chunks"]]
+        return store
+
+
+# chunk dicts from a compact file or from the plain list of chunk dicts
+def read_chunks(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data
+    return list(ChunkStore.from_compact(data))
+
+
+# the plain list of chunk dicts, written one chunk at a time so the dicts never all exist at once
+def write_expanded(chunks, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, chunk in enumerate(chunks):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(chunk, indent=4, ensure_ascii=False))
+        f.write("\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between compact chunk files and the plain list of chunk dicts")
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--compact", action="store_true", help="write the compact format instead of the plain list")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        store = ChunkStore()
+        store.extend(data)
+    else:
+        store = ChunkStore.from_compact(data)
+
+    if args.compact:
+        store.write(args.output)
+    else:
+        write_expanded(store, args.output)
+    print(f"{len(store)} chunks, {len(store.titles.strings)} distinct titles -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# typed rows for items, npcs, recipes and drops, written to sqlite next to the text chunks
+# so exact stat / recipe / drop questions can be answered without vector search
+
+import re
+import sqlite3
+
+# the stat fields process_infoboxes collects, stored as columns of the items table
+ITEM_FIELDS = [
+    "type", "rarity", "buy", "sell", "tooltip", "body_slot", "research", "set_bonus", "consumable",
+    "defense", "damage", "knockback", "critical_chance", "use_time", "velocity", "mana", "healsmana",
+    "healshealth", "max_stack", "basevelocity", "velocity_multiplier", "tool_speed", "baitpower",
+    "placeable", "bonus", "usesammo",
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    page_title TEXT NOT NULL,
+    section_title TEXT NOT NULL,
+    name TEXT NOT NULL,
+    {", ".join(f"{field} TEXT" for field in ITEM_FIELDS)}
+);
+CREATE INDEX IF NOT EXISTS items_name ON items (name COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS npcs (
+    id INTEGER PRIMARY KEY,
+    page_title TEXT NOT NULL,
+    name TEXT NOT NULL,
+    npc_id TEXT,
+    mode TEXT NOT NULL,
+    health TEXT,
+    damage TEXT,
+    defense TEXT,
+    kb_resist TEXT,
+    coins TEXT
+);
+CREATE INDEX IF NOT EXISTS npcs_name ON npcs (name COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    page_title TEXT NOT NULL,
+    section_title TEXT NOT NULL,
+    result TEXT NOT NULL,
+    result_quantity INTEGER NOT NULL,
+    station TEXT
+);
+CREATE INDEX IF NOT EXISTS recipes_result ON recipes (result COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+    recipe_id INTEGER NOT NULL REFERENCES recipes (id),
+    item TEXT NOT NULL,
+    quantity INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recipe_ingredients_recipe ON recipe_ingredients (recipe_id);
+CREATE INDEX IF NOT EXISTS recipe_ingredients_item ON recipe_ingredients (item COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS drops (
+    id INTEGER PRIMARY KEY,
+    page_title TEXT NOT NULL,
+    item TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    quantity TEXT,
+    drop_rate TEXT
+);
+CREATE INDEX IF NOT EXISTS drops_item ON drops (item COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS drops_entity ON drops (entity COLLATE NOCASE);
+"""
+
+
+VERSION_NOTE_PATTERN = re.compile(r"\s*\([^()]*(?:versions?|only)\)")
+
+
+# "Cell Phone (Desktop, Console and Mobile versions)" -> "Cell Phone", names have to match what users type
+def strip_version_notes(name):
+    return VERSION_NOTE_PATTERN.sub("", name).strip()
+
+
+def parse_quantity(text, default=1):
+    try:
+        return int(str(text).replace(",", "").strip())
+    except ValueError:
+        return default
+
+
+class EntityStore:
+    def __init__(self, db_file):
+        self.connection = sqlite3.connect(db_file)
+        self.connection.executescript(SCHEMA)
+
+    def clear(self):
+        for table in ["items", "npcs", "recipe_ingredients", "recipes", "drops"]:
+            self.connection.execute(f"DELETE FROM {table}")
+
+    def add_item(self, page_title, section_title, name, values):
+        fields = [field for field in ITEM_FIELDS if values.get(field) is not None]
+        self.connection.execute(
+            f"INSERT INTO items (page_title, section_title, name{''.join(', ' + f for f in fields)}) "
+            f"VALUES (?, ?, ?{', ?' * len(fields)})",
+            [page_title, section_title, strip_version_notes(name)] + [str(values[field]) for field in fields]
+        )
+
+    def add_npc(self, page_title, name, npc_id, mode, health=None, damage=None, defense=None, kb_resist=None, coins=None):
+        self.connection.execute(
+            "INSERT INTO npcs (page_title, name, npc_id, mode, health, damage, defense, kb_resist, coins) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (page_title, strip_version_notes(name), npc_id, mode, health, damage, defense, kb_resist, coins)
+        )
+
+    # ingredients is a list of (quantity, item name)
+    def add_recipe(self, page_title, section_title, result, result_quantity, station, ingredients):
+        cursor = self.connection.execute(
+            "INSERT INTO recipes (page_title, section_title, result, result_quantity, station) VALUES (?, ?, ?, ?, ?)",
+            (page_title, section_title, strip_version_notes(result), parse_quantity(result_quantity), station)
+        )
+        self.connection.executemany(
+            "INSERT INTO recipe_ingredients (recipe_id, item, quantity) VALUES (?, ?, ?)",
+            [(cursor.lastrowid, strip_version_notes(item), parse_quantity(quantity)) for quantity, item in ingredients]
+        )
+
+    def add_drop(self, page_title, item, entity, quantity, drop_rate):
+        self.connection.execute(
+            "INSERT INTO drops (page_title, item, entity, quantity, drop_rate) VALUES (?, ?, ?, ?, ?)",
+            (page_title, item, strip_version_notes(entity), quantity, drop_rate)
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+# stands in for the store while a handler runs and remembers every row it writes,
+# so the preprocessing cache can replay the rows on a cache hit
+class RecordingEntityStore:
+    def __init__(self, store=None):
+        self.store = store
+        self.calls = []
+
+    def __getattr__(self, name):
+        if not name.startswith("add_"):
+            raise AttributeError(name)
+
+        def record(*args):
+            self.calls.append([name, list(args)])
+            if self.store:
+                getattr(self.store, name)(*args)
+        return record
+
+
+def replay_entity_rows(store, calls):
+    for name, args in calls:
+        getattr(store, name)(*args)
@@ -0,0 +1,69 @@
+# per-page, per-handler cache of preprocessing results, keyed by the page's html hash, the handler's
+# name and version, the hash of the cleanup rules the handlers apply and the html parse mode the handlers
+# read (article_parser.py), so only changed pages, bumped handlers, edited rules and a switched parse are re-run
+
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS handler_results (
+    content_hash TEXT NOT NULL,
+    page_title TEXT NOT NULL,
+    handler TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    rules_hash TEXT NOT NULL,
+    parse_mode TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (content_hash, page_title, handler, version, rules_hash, parse_mode)
+);
+"""
+
+
+class PreprocessCache:
+    def __init__(self, cache_file, rules_hash, parse_mode, commit_every=200):
+        self.connection = sqlite3.connect(cache_file)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(handler_results)")]
+        if columns and not {"rules_hash", "parse_mode"} <= set(columns):
+            # written before the rules and the parse mode were part of the key, nothing in it can be trusted
+            self.connection.execute("DROP TABLE handler_results")
+        self.connection.executescript(SCHEMA)
+        self.rules_hash = rules_hash
+        self.parse_mode = parse_mode
+        self.commit_every = commit_every
+        self.pending_writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # page_title is part of the key because chunks carry it and it comes from the file name, not the html
+    def get(self, content_hash, page_title, handler, version):
+        row = self.connection.execute(
+            "SELECT result FROM handler_results WHERE content_hash = ? AND page_title = ? AND handler = ? AND version = ? AND rules_hash = ? AND parse_mode = ?",
+            (content_hash, page_title, handler, version, self.rules_hash, self.parse_mode)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, content_hash, page_title, handler, version, result):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO handler_results (content_hash, page_title, handler, version, rules_hash, parse_mode, result) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, page_title, handler, version, self.rules_hash, self.parse_mode, json.dumps(result, ensure_ascii=False))
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.connection.commit()
+            self.pending_writes = 0
+
+    # drop results of older handler versions, rules and the other parse mode, they are not hit by this run
+    def prune(self, handler_versions):
+        for handler, version in handler_versions.items():
+            self.connection.execute("DELETE FROM handler_results WHERE handler = ? AND version != ?", (handler, version))
+        self.connection.execute(
+            "DELETE FROM handler_results WHERE rules_hash != ? OR parse_mode != ?", (self.rules_hash, self.parse_mode)
+        )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,76 @@
+# profiling report for a preprocessing run: time, chunks and pages per handler, plus how often every
+# unhandled section shows up and on which pages. collected in memory and written once as json at the end
+
+import json
+import time
+
+
+class PreprocessProfile:
+    def __init__(self, max_examples=5):
+        self.max_examples = max_examples
+        self.started = time.perf_counter()
+        self.pages = 0
+        self.parse_seconds = 0.0
+        self.handlers = {}
+        self.unhandled_sections = {}
+        self.unhandled_fields = {}
+
+    def record_parse(self, seconds):
+        self.parse_seconds += seconds
+
+    def record_page(self):
+        self.pages += 1
+
+    # cached results count as chunks and pages, only a real run adds wall time
+    def record_handler(self, name, seconds, chunks, cached=False):
+        stats = self.handlers.setdefault(name, {"seconds": 0.0, "runs": 0, "cache_hits": 0, "chunks": 0, "pages_touched": 0})
+        stats["seconds"] += seconds
+        if cached:
+            stats["cache_hits"] += 1
+        else:
+            stats["runs"] += 1
+        stats["chunks"] += chunks
+        if chunks:
+            stats["pages_touched"] += 1
+
+    def record_unhandled(self, section_titles, page_title, counts=None):
+        counts = self.unhandled_sections if counts is None else counts
+        for section_title in section_titles:
+            stats = counts.setdefault(section_title, {"count": 0, "examples": []})
+            stats["count"] += 1
+            if len(stats["examples"]) < self.max_examples:
+                stats["examples"].append(page_title)
+
+    # infobox labels a handler's schema does not know, keyed "section: label"
+    def record_unhandled_fields(self, section_title, fields, page_title):
+        self.record_unhandled([f"{section_title}: {field}" for field in fields], page_title, self.unhandled_fields)
+
+    def report(self):
+        return {
+            "pages": self.pages,
+            "total_seconds": time.perf_counter() - self.started,
+            "parse_seconds": self.parse_seconds,
+            "handlers": dict(sorted(self.handlers.items(), key=lambda item: item[1]["seconds"], reverse=True)),
+            "unhandled_sections": dict(sorted(self.unhandled_sections.items(), key=lambda item: item[1]["count"], reverse=True)),
+            "unhandled_fields": dict(sorted(self.unhandled_fields.items(), key=lambda item: item[1]["count"], reverse=True)),
+        }
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=4, ensure_ascii=False)
+
+    def summary(self, top=10):
+        report = self.report()
+        lines = [f"Preprocessed {report['pages']} pages in {report['total_seconds']:.1f}s (html parsing {report['parse_seconds']:.1f}s)"]
+        lines.append(f"{'handler':<20}{'seconds':>10}{'runs':>8}{'cached':>8}{'chunks':>9}{'pages':>8}")
+        for name, stats in report["handlers"].items():
+            lines.append(
+                f"{name:<20}{stats['seconds']:>10.2f}{stats['runs']:>8}{stats['cache_hits']:>8}"
+                f"{stats['chunks']:>9}{stats['pages_touched']:>8}"
+            )
+        unhandled = list(report["unhandled_sections"].items())
+        if unhandled:
+            lines.append(f"{len(unhandled)} unhandled section titles, most frequent:")
+            for section_title, stats in unhandled[:top]:
+                lines.append(f"  {stats['count']:>6}  {section_title} (e.g. {', '.join(stats['examples'][:3])})")
+        return "\n".join(lines)
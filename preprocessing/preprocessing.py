@@ -1,14 +1,33 @@
 import os
-import json
-from bs4 import BeautifulSoup
+import hashlib
+import time
 from bs4 import Tag
 import re
+from rule_engine import RuleEngine, load_rules, rules_file_hash
+from article_parser import parse_article
+from chunk_records import ChunkStore
+from entity_store import EntityStore, RecordingEntityStore, replay_entity_rows
+from preprocess_cache import PreprocessCache
+from preprocess_profile import PreprocessProfile
+from table_extractor import VARIANTS_TABLE, describe, extract_generic_table, extract_stat_table, extract_table
 
-# initialize
-json_data = []
+# initialize, chunks are kept as compact records with interned titles (see chunk_records.py)
+json_data = ChunkStore()
 
-all_unlogged = {}
-def log_unhandled_sections(soup, processed_sections, ignored_sections, page_title):
+# when set, the handlers also write typed rows (items, npcs, recipes, drops) to this store
+entity_store = None
+
+# cleanups for the crafting result cell, see cleanup_rules.json
+crafting_result_cleaner = RuleEngine(load_rules("crafting_result"))
+
+# per-handler timings and unhandled section counts, written as a report at the end of the run
+profile = PreprocessProfile()
+
+# only build the tree of the article body (div.mw-parser-output, without the navboxes), see article_parser.py
+RESTRICTED_PARSE = True
+
+def find_unhandled_sections(soup, processed_sections, ignored_sections):
+    unhandled_sections = []
     # Find all <h2> tags for potential sections
     for header in soup.find_all("h2"):
         # Extract the section title
@@ -20,12 +39,8 @@ def log_unhandled_sections(soup, processed_sections, ignored_sections, page_titl
             continue
 
         if section_title != "Unknown Section": 
-            # Log the unhandled section title
-            print(f"[INFO] Unhandled section found: {section_title} in {page_title}")
-            if section_title in all_unlogged:
-                all_unlogged[section_title] += 1
-            else:
-                all_unlogged[section_title] = 1
+            unhandled_sections.append(section_title)
+    return unhandled_sections
 
 
 def process_general_info(soup, page_title):
@@ -133,14 +148,15 @@ def process_infoboxes(soup, page_title):
                     values[normalized_key] = value
                 else:
                     # log unprocessed fields
-                    unprocessed_fields.append(f"Key: '{key}', Value: '{value}'")
+                    unprocessed_fields.append(key)
                     
 
-        # print any unprocessed fields to standard output
+        # unprocessed fields go to the profiling report
         if unprocessed_fields:
-            print(f"[INFO] Unhandled fields in '{title}' from infobox:")
-            for field in unprocessed_fields:
-                print(f"  - {field}")
+            report_unhandled_fields("Infobox", unprocessed_fields)
+
+        if entity_store:
+            entity_store.add_item(page_title, "Infobox", title, values)
 
         text_content = f""
         
@@ -339,24 +355,24 @@ def process_drop_infoboxes(soup, page_title):
                         
                     except Exception as e:
                         # Log any exceptions or unhandled cases
-                        unprocessed_items.append(f"Unhandled row in: {columns}")
+                        unprocessed_items.append("row that failed to parse")
                         continue
 
                     # Form full entity description with multiple drop rates and version info
                     full_entity_description = (
                         f"{entity_name} has a {drop_rate_text} chance to drop {quantity_text}."
                     )
+                    if entity_store:
+                        entity_store.add_drop(page_title, page_title, entity_name, quantity_raw, drop_rate_text)
                     
                     entities.append(full_entity_description)
                 else:
                     # Log unhandled row structure
-                    unprocessed_items.append(f"Unexpected row format in: {row}")
+                    unprocessed_items.append("row with an unexpected format")
 
-        # Print any unprocessed items
+        # unprocessed items go to the profiling report
         if unprocessed_items:
-            print(f"[INFO] Unhandled cases in '{title_text}':")
-            for item in unprocessed_items:
-                print(f"  - {item}")
+            report_unhandled_fields("Drop Infobox", unprocessed_items)
 
         # Construct text content
         for entity in entities:
@@ -402,15 +418,14 @@ def process_crafting_section(soup, page_title):
             result_cell = row.find("td", class_="result")
             if result_cell:
                 current_result = result_cell.get_text(strip=True)
-                # Insert space before any version info enclosed in parentheses
-                current_result = re.sub(r"(\S)(\(.*?\))", r"\1 \2", current_result)
-                current_result = re.sub(r"InternalItem ID: \d+", "", current_result)  # Remove 'InternalItem ID: <digits>'
-                current_result = re.sub(r"\bonly:\b", "", current_result)  # Remove the word 'only'
+                # space before version info, drop 'InternalItem ID: <digits>' and 'only:'
+                current_result = crafting_result_cleaner.clean_text(current_result)
 
 
             # Extract ingredients
             ingredients_cell = row.find("td", class_="ingredients")
             ingredients = []
+            ingredient_rows = []
             if ingredients_cell:
                 for li in ingredients_cell.find_all("li"):
                     # Extract quantity and name in "X item_name" format
@@ -418,6 +433,7 @@ def process_crafting_section(soup, page_title):
                     quantity = amount_tag.get_text(strip=True) if amount_tag else "1"
                     item_name = li.get_text(separator=" ", strip=True).replace(quantity, "").strip()
                     ingredients.append(f"{quantity} {item_name}")
+                    ingredient_rows.append((quantity, item_name))
 
             # Extract crafting station, update only if present in the current row
             station_cell = row.find("td", class_="station")
@@ -466,325 +482,153 @@ def process_crafting_section(soup, page_title):
                         }
                     })
 
+            if entity_store:
+                match = re.match(r"(.*?)(\d+)$", current_result)
+                result_name, result_quantity = (match.group(1).strip(), match.group(2)) if match else (current_result, 1)
+                entity_store.add_recipe(page_title, f"Crafting - {section_title}", result_name, result_quantity, current_station, ingredient_rows)
+
     return crafting_chunks
 
-def process_set_section(soup, page_title):
-    set_section = soup.find("span", {"id": "Set"})
-    set_chunks = []
+# the item infoboxes listed under a section (Set, Tiers) as (title, stat fields)
+def extract_section_items(soup, page_title, section_id):
+    items = []
+    section = soup.find("span", {"id": section_id})
+    if not section:
+        return items
 
-    if set_section:
-        # Locate the parent <h2> tag to find associated content
-        set_header = set_section.find_parent("h2")
-        set_content = set_header.find_next_sibling("div")
-
-        if set_content:
-            # Find all infoboxes within the "Set" section
-            infoboxes = set_content.find_all("div", class_="infobox item")
-            for infobox in infoboxes:
-                # Extract item title
-                title = infobox.find("div", class_="title").get_text(strip=True) if infobox.find("div", class_="title") else "Unknown Item"
-
-                # Extract statistics
-                type_value = None
-                body_slot = None
-                rarity_value = None
-                buy_value = None
-                sell_value = None
-                research_value = None
-                tooltip = None
-                defense = None
-                unprocessed_fields = []  # Track unhandled fields
-
-                stat_table = infobox.find("table", class_="stat")
-                if stat_table:
-                    for row in stat_table.find_all("tr"):
-                        key = row.find("th").get_text(strip=True) if row.find("th") else "Unknown Key"
-                        value_tag = row.find("td")
-                        value = value_tag.get_text(separator=" ", strip=True) if value_tag else "Unknown Value"
-                        
-                        # Handle specific keys
-                        if key.lower() == "type":
-                            type_value = value.lower()
-                        elif key.lower() == "body slot":
-                            body_slot = value
-                        elif key.lower() == "rarity":
-                            rarity_sortkey = value_tag.find("s", class_="sortkey")
-                            if rarity_sortkey:
-                               rarity_value = re.sub(r'[^0-9]', '', rarity_sortkey.get_text())
-                        elif key.lower() == "buy":
-                            # Handle Defender Medals and other formats
-                            if "Defender Medals" in value:
-                                buy_value = value_tag.get("title", value)
-                            elif value_tag.find("span", class_="coins"):
-                                buy_value = value_tag.find("span", class_="coins").get("title", value)
-                            else:
-                                buy_value = value
-                        elif key.lower() == "sell":
-                            if value.lower() == "no value":
-                                sell_value = "No value"
-                            else:
-                                coin_span = value_tag.find("span", class_="coin")
-                                sell_value = coin_span.get("title", "") if coin_span else value
-                        elif key.lower() == "tooltip":
-                            tooltip = value.strip("'")
-                        elif key.lower() == "research":
-                            research_value = value
-                        elif key.lower() == "defense":
-                            defense = value
-                        else:
-                            # Log unprocessed field
-                            unprocessed_fields.append(f"Key: '{key}', Value: '{value}'")
-
-                # Print unprocessed fields
-                if unprocessed_fields:
-                    print(f"[INFO] Unhandled fields in '{title}', set:")
-                    for field in unprocessed_fields:
-                        print(f"  - {field}")
-
-                # Construct text content for the item
-                text_content = (
-                    f"The item '{title}' is part of the {page_title + (' set' if not page_title.lower().endswith('set') else '')} and is of type {type_value}."
-                    f"It is equipped in the {body_slot} slot. "
-                    f"It has a rarity level of {rarity_value}. "
-                )
-                if buy_value:
-                    text_content += f"It can be bought for {buy_value}. "
-                if sell_value:
-                    text_content += f"It can be sold for {sell_value}. "
-                if tooltip:
-                    text_content += f"The tooltip reads: \"{tooltip}\". "
-                if research_value:
-                    text_content += f"It requires {research_value} for research purposes. "
-                if defense:
-                    text_content += f"It provides {defense} defense."
-
-                # Create a chunk for the item
-                set_chunks.append({
-                    "text": text_content.strip(),
-                    "metadata": {
-                        "page_title": page_title,
-                        "section_title": "Set"
-                    }
-                })
+    # Locate the parent <h2> tag to find associated content
+    section_header = section.find_parent("h2")
+    section_content = section_header.find_next_sibling("div") if section_header else None
+    if not section_content:
+        return items
 
+    for infobox in section_content.find_all("div", class_="infobox item"):
+        title_tag = infobox.find("div", class_="title")
+        title = title_tag.get_text(strip=True) if title_tag else "Unknown Item"
+
+        stat_table = infobox.find("table", class_="stat")
+        values, unhandled_fields = extract_stat_table(stat_table) if stat_table else ({}, [])
+        if unhandled_fields:
+            report_unhandled_fields(section_id, unhandled_fields)
+
+        if entity_store:
+            entity_store.add_item(page_title, section_id, title, values)
+        items.append((title, values))
+    return items
+
+# the stat sentences shared by every item chunk
+def describe_item_stats(values):
+    text_content = ""
+    if values.get("buy"):
+        text_content += f"It can be bought for {values['buy']}. "
+    if values.get("sell"):
+        text_content += f"It can be sold for {values['sell']}. "
+    if values.get("tooltip"):
+        text_content += f"The tooltip reads: \"{values['tooltip']}\". "
+    if values.get("research"):
+        text_content += f"It requires {values['research']} for research purposes. "
+    if values.get("defense"):
+        text_content += f"It provides {values['defense']} defense. "
+    if values.get("damage"):
+        text_content += f"It deals {values['damage']}. "
+    if values.get("knockback"):
+        text_content += f"It has a knockback rating of {values['knockback']}. "
+    if values.get("mana"):
+        text_content += f"It consumes {values['mana']} mana per use. "
+    if values.get("use_time"):
+        text_content += f"It has a use time of {values['use_time']}. "
+    if values.get("velocity"):
+        text_content += f"It has a velocity of {values['velocity']}. "
+    return text_content
+
+def process_set_section(soup, page_title):
+    set_chunks = []
+    set_name = page_title + (' set' if not page_title.lower().endswith('set') else '')
+    for title, values in extract_section_items(soup, page_title, "Set"):
+        # Construct text content for the item
+        text_content = (
+            f"The item '{title}' is part of the {set_name} and is of type {values.get('type')}. "
+            f"It is equipped in the {values.get('body_slot')} slot. "
+            f"It has a rarity level of {values.get('rarity')}. "
+        ) + describe_item_stats(values)
+
+        set_chunks.append({
+            "text": text_content.strip(),
+            "metadata": {
+                "page_title": page_title,
+                "section_title": "Set"
+            }
+        })
     return set_chunks
 
+def process_tiers_section(soup, page_title):
+    tier_chunks = []
+    for title, values in extract_section_items(soup, page_title, "Tiers"):
+        text_content = (
+            f"The item '{title}' is part of the set. "
+            f"It is of type {values.get('type')}. "
+            f"It has a rarity level of {values.get('rarity')}. "
+        ) + describe_item_stats(values)
+
+        tier_chunks.append({
+            "text": text_content.strip(),
+            "metadata": {
+                "page_title": page_title,
+                "section_title": "Tiers"
+            }
+        })
+    return tier_chunks
+
+def extract_achievement(achievement_container):
+    # Extract achievement title
+    title_tag = achievement_container.find("b")
+    achievement_title = title_tag.get_text(separator=" ", strip=True) if title_tag else "Unknown Achievement"
+
+    # Extract achievement description (italicized text within the container)
+    description_tag = achievement_container.find("i")
+    achievement_description = description_tag.get_text(separator=" ", strip=True) if description_tag else "No description available"
+
+    # Extract the criteria (the first div after the description that is not a note)
+    criteria_div = achievement_container.find("div")
+    achievement_criteria = "Unknown criteria"
+    if criteria_div:
+        for child_div in criteria_div.find_all("div", recursive=False):
+            if 'note-text' not in child_div.get("class", []):
+                achievement_criteria = child_div.get_text(separator=" ", strip=True)
+                break
+
+    # Extract applicable game versions (like Desktop, Console, etc.)
+    version_tag = achievement_container.find("span", class_="eico")
+    version_span = version_tag.find("span") if version_tag else None
+    applicable_versions = version_span.get_text(separator=" ", strip=True).strip("()") if version_span else "All versions"
+
+    # Extract achievement category (usually in the note-text small div with the category image)
+    category_div = achievement_container.find("div", class_="note-text small")
+    achievement_category = "Uncategorized"
+    if category_div:
+        category_text_match = re.search(r'Category:\s*(.*)', category_div.get_text(separator=" ", strip=True))
+        if category_text_match:
+            achievement_category = category_text_match.group(1)
+
+    return (
+        f"The achievement '{achievement_title}' is described as: '{achievement_description}'. "
+        f"To unlock this achievement, you must: {achievement_criteria}. "
+        f"This achievement is categorized under '{achievement_category}' and is available in {applicable_versions}."
+    )
+
+# achievement boxes on item pages and the full list on the Achievements page
 def process_achievements_section(soup, page_title):
-    # Find all achievement containers
-    achievement_containers = soup.find_all("div", class_="achievement")
-    achievement_chunks = []
-    
-    for achievement_container in achievement_containers:
-        try:
-            # Extract achievement title
-            title_tag = achievement_container.find("b")
-            achievement_title = title_tag.get_text(separator=" ", strip=True) if title_tag else "Unknown Achievement"
-            
-            # Extract achievement description (italicized text within the container)
-            description_tag = achievement_container.find("i")
-            achievement_description = description_tag.get_text(separator=" ", strip=True) if description_tag else "No description available"
-            
-            # Extract the criteria (look for the first div after the description and exclude specific known classes and tags)
-            criteria_div = achievement_container.find("div")
-            achievement_criteria = "Unknown criteria"
-            if criteria_div:
-                for child_div in criteria_div.find_all("div", recursive=False):
-                    achievement_criteria = child_div.get_text(separator=" ", strip=True)
-                    # print(achievement_criteria)
-                    break
-                    
-            # Extract applicable game versions (like Desktop, Console, etc.)
-            version_tag = achievement_container.find("span", class_="eico")
-            applicable_versions = "All versions"
-            if version_tag and version_tag.find("span"):
-                applicable_versions = version_tag.find("span").get_text(separator=" ", strip=True).strip("()")
-            
-            # Extract achievement category (usually in the note-text small div with the category image)
-            category_div = achievement_container.find("div", class_="note-text small")
-            achievement_category = "Uncategorized"
-            if category_div and category_div.get_text():
-                category_text_match = re.search(r'Category:\s*(.*)', category_div.get_text(separator=" ", strip=True))
-                achievement_category = category_text_match.group(1) if category_text_match else "Uncategorized"
-            
-            # Compile all information into a single descriptive text
-            full_achievement_description = (
-                f"The achievement '{achievement_title}' is described as: '{achievement_description}'. "
-                f"To unlock this achievement, you must: {achievement_criteria}. "
-                f"This achievement is categorized under '{achievement_category}' and is available in {applicable_versions}."
-            )
-            
-            # Add the formatted achievement to the list of chunks
-            achievement_chunks.append({
-                "text": full_achievement_description.strip(),
-                "metadata": {
-                    "page_title": page_title,
-                    "section_title": "Achievement"
-                }
-            })
-            
-        except Exception as e:
-            # Log any exceptions or unhandled cases
-            print(f"[INFO] Unhandled achievement in '{page_title}': {e}")
-            continue
-    
-    return achievement_chunks
-
-def process_achievementss_section(soup, page_title):
-    achievement_containers = soup.find_all("div", class_="achievement")
     achievement_chunks = []
-
-    for achievement_container in achievement_containers:
-        # Extract achievement title
-        title_tag = achievement_container.find("b")
-        achievement_title = title_tag.get_text(separator=" ", strip=True) if title_tag else "Unknown Achievement"
-        
-        # Extract achievement description (italicized text within the container)
-        description_tag = achievement_container.find("i")
-        achievement_description = description_tag.get_text(separator=" ", strip=True) if description_tag else "No description available"
-        
-        # Extract the criteria (look for the first div after the description and exclude specific known classes and tags)
-        criteria_div = achievement_container.find("div")
-        achievement_criteria = "Unknown criteria"
-        if criteria_div:
-            for child_div in criteria_div.find_all("div", recursive=False):
-                if not child_div.get("class") or 'note-text' not in child_div.get("class"):
-                    achievement_criteria = child_div.get_text(separator=" ", strip=True)
-                    break
-        
-        # Extract applicable game versions (like Desktop, Console, etc.)
-        version_tag = achievement_container.find("span", class_="eico")
-        applicable_versions = "All versions"
-        if version_tag and version_tag.find("span"):
-            applicable_versions = version_tag.find("span").get_text(separator=" ", strip=True).strip("()")
-        
-        # Extract achievement category (usually in the note-text small div with the category image)
-        category_div = achievement_container.find("div", class_="note-text small")
-        achievement_category = "Uncategorized"
-        if category_div and category_div.get_text():
-            category_text_match = re.search(r'Category:\s*(.*)', category_div.get_text(separator=" ", strip=True))
-            achievement_category = category_text_match.group(1) if category_text_match else "Uncategorized"
-        
-        # Compile all information into a single descriptive text
-        full_achievement_description = (
-            f"The achievement '{achievement_title}' is described as: '{achievement_description}'. "
-            f"To unlock this achievement, you must: {achievement_criteria}. "
-            f"This achievement is categorized under '{achievement_category}' and is available in {applicable_versions}."
-        )
-        
-        # Add the formatted achievement to the list of chunks
+    for achievement_container in soup.find_all("div", class_="achievement"):
         achievement_chunks.append({
-            "text": full_achievement_description.strip(),
+            "text": extract_achievement(achievement_container),
             "metadata": {
-                "page_title": "Achievements",  # Example page title
+                "page_title": page_title,
                 "section_title": "Achievement"
             }
         })
-
     return achievement_chunks
 
-def process_variants_section2(soup, page_title):
-    npcs = []
-    
-    # Extract the section title (if available)
-    section_title_tag = soup.find('span', class_='mw-headline')
-    section_title = section_title_tag.text if section_title_tag else 'Unknown Section'
-    
-    # Extract the NPC rows from the table
-    npc_rows = soup.select('table.terraria tbody tr')
-    
-    for row in npc_rows[1:]:  # Skip header row
-        columns = row.find_all('td')
-        if len(columns) < 7:
-            continue
-        
-        # Extract NPC name and variant (if any)
-        npc_name_tag = columns[2].find('span', title=True)
-        npc_name = npc_name_tag['title'] if npc_name_tag else 'Unknown NPC'
-        
-        variant_note_tag = columns[2].find('span', class_='note')
-        variant = variant_note_tag.text.strip('()') if variant_note_tag else ''
-        if variant: 
-            npc_name += f' ({variant})'
-        
-        health_raw = columns[3].text.strip()
-        damage_raw = columns[4].text.strip()
-        defense_raw = columns[5].text.strip()
-        kb_resist_raw = columns[6].text.strip()
-        coins_raw = columns[7].text.strip() if len(columns) > 7 else ''
-        
-        health_values = extract_values(health_raw)
-        damage_values = extract_values(damage_raw)
-        defense_values = extract_values(defense_raw)
-        kb_resist_values = extract_values(kb_resist_raw)
-        coin_drop = extract_coin_values(coins_raw)
-        
-        # Build NPC data for each mode
-        modes = ["Classic", "Expert", "Master"]
-        health_by_mode = zip(modes, health_values)
-        damage_by_mode = zip(modes, damage_values)
-        defense_by_mode = zip(modes, defense_values)
-        kb_resist_by_mode = zip(modes, kb_resist_values)
-        
-        for mode, health in health_by_mode:
-            damage = next(damage_by_mode, (mode, 0))[1]
-            defense = next(defense_by_mode, (mode, 0))[1]
-            kb_resist = next(kb_resist_by_mode, (mode, '0%'))[1]
-            coins = coin_drop.get(mode, '')
-            if not coins and mode == 'Master':
-                coins = coin_drop.get('Expert', '')  # Default Master coin drop to Expert mode value if not specified
-            coin_text = f" Upon death, it drops {coins}." if coins else ''
-            
-            npc_data = {
-                "text": f"In {mode} mode, '{npc_name}' has {health} health, {defense} defense, and {kb_resist} knockback resistance. It does {damage} damage.{coin_text}",
-                "metadata": {
-                    "page_title": page_title,
-                    "section_title": section_title
-                }
-            }
-            npcs.append(npc_data)
-    
-    return npcs
-
-    def extract_values(raw_text):
-        values = []
-        numbers = re.findall(r'\d+(?:\.\d+)?%', raw_text)  # Extract percentages
-        if numbers:
-            return numbers
-        
-        values = re.findall(r'\d+', raw_text)  # Extract numeric values
-        if len(values) == 1:  # If only one value, apply it to all modes
-            values = [values[0]] * 3
-        elif len(values) == 2:  # If two values, assume Pre-Hardmode and Hardmode
-            values.append(values[-1])
-        elif len(values) > 3:  # Sometimes there may be more values than needed, limit to 3
-            values = values[:3]
-        
-        return values
-
-    def extract_coin_values(raw_text):
-        """Extract coin values from the raw text and return a dictionary with mode-specific coin values."""
-        coin_pattern = re.compile(r'(\d+)\s*SC')  # Match Silver Coins
-        copper_pattern = re.compile(r'(\d+)\s*CC')  # Match Copper Coins
-        
-        modes = ["Classic", "Expert", "Master"]
-        coin_values = {}
-        
-        sc_values = coin_pattern.findall(raw_text)
-        cc_values = copper_pattern.findall(raw_text)
-        
-        if sc_values or cc_values:
-            for i, mode in enumerate(modes):
-                sc = sc_values[i] if i < len(sc_values) else ''
-                cc = cc_values[i] if i < len(cc_values) else ''
-                coin_string = []
-                if sc:
-                    coin_string.append(f"{sc} Silver Coin{'s' if int(sc) > 1 else ''}")
-                if cc:
-                    coin_string.append(f"{cc} Copper Coin{'s' if int(cc) > 1 else ''}")
-                coin_values[mode] = ' and '.join(coin_string)
-        
-        return coin_values
-
 def process_variants_section(soup, page_title):
     variant_chunks = []
 
@@ -798,56 +642,36 @@ def process_variants_section(soup, page_title):
     if not variants_table:
         return variant_chunks  # No table found in the variants section
 
-    # Parse the table rows
-    rows = variants_table.find_all("tr")[1:]  # Skip the header row
-    for row in rows:
-        cells = row.find_all("td")
+    mode_columns = VARIANTS_TABLE["mode_columns"]
+    for npc in extract_table(variants_table, VARIANTS_TABLE):
+        npc_name = npc.get("name") or "Unknown Name"
+        npc_id = npc.get("npc_id") or "Unknown ID"
 
-        if not cells:
-            continue  # Skip rows without cells
+        for mode in npc["modes"]:
+            stats = {
+                column: npc[column][mode] for column in mode_columns
+                if any(value for _, value in npc.get(column, {}).get(mode, []))
+            }
+            if not stats:
+                continue
+
+            if entity_store:
+                # health, damage, defense, kb_resist, coins
+                entity_store.add_npc(page_title, npc_name, npc_id, mode, *[describe(stats[column]) if column in stats else None for column in mode_columns])
+
+            parts = [
+                describe(stats[column], unit)
+                for column, unit in [("health", "health"), ("defense", "defense"), ("kb_resist", "knockback resistance")]
+                if column in stats
+            ]
+            chunk_text = f"In {mode} mode, '{npc_name}'"
+            if parts:
+                chunk_text += " has " + (", ".join(parts[:-1]) + ", and " + parts[-1] if len(parts) > 1 else parts[0]) + "."
+            if "damage" in stats:
+                chunk_text += f" It does {describe(stats['damage'], 'damage')}."
+            if "coins" in stats:
+                chunk_text += f" Upon death, it drops {describe(stats['coins'])}."
 
-        # Determine the modes
-        row_class = row.get("class", [])
-        if "m-expert-master" in row_class:
-            modes = ["Expert", "Master"]
-        else:
-            modes = ["Classic", "Expert", "Master"]
-
-        # Extract NPC ID
-        npc_id = cells[0].get_text(strip=True) if len(cells) > 0 else "Unknown ID"
-
-        # Extract NPC Name
-        name_cell = cells[2] if len(cells) > 2 else None
-        npc_name = (
-            name_cell.find("span", title=True).get("title") if name_cell and name_cell.find("span", title=True) else "Unknown Name"
-        )
-
-        # Extract stats for Classic Mode (`m-normal`)
-        if "Classic" in modes: 
-            health = row.find("span", class_="m-normal").get_text(" ", strip=True) if row.find("span", class_="m-normal") else "Unknown Health"
-            damage = row.find("span", class_="m-normal").get_text(" ", strip=True) if row.find("span", class_="m-normal") else "Unknown Damage"
-            defense = row.find("span", class_="m-normal").get_text(" ", strip=True) if row.find("span", class_="m-normal") else "Unknown Defense"
-            kb_resist = row.find("span", class_="m-normal").get_text(" ", strip=True) if row.find("span", class_="m-normal") else "Unknown KB Resist"
-
-            # Extract Coins for Classic Mode
-            coins_cell = cells[7] if len(cells) > 7 else None
-            classic_coins = "Unknown Coins"
-
-            if coins_cell:
-                # Find the 'm-normal' span first
-                classic_span = coins_cell.find("span", class_="m-normal")
-                if classic_span:
-                    # Then find the nested 'coin' span inside 'm-normal'
-                    coin_span = classic_span.find("span", class_="coin")
-                    if coin_span and coin_span.has_attr("title"):
-                        classic_coins = coin_span["title"]
-
-            # Create a chunk for Classic mode
-            chunk_text = (
-                f"In Classic mode, '{npc_name}' has {health} health, {defense} defense, and {kb_resist} knockback resistance. It does {damage} damage."
-            )
-            if coins_cell:
-                chunk_text += f" Upon death, it drops {classic_coins}."
             variant_chunks.append({
                 "text": chunk_text,
                 "metadata": {
@@ -855,328 +679,42 @@ def process_variants_section(soup, page_title):
                     "section_title": "Variants"
                 }
             })
-            
-        # now handle expert
-        def extract_values_from_row(row):
-            # Function to extract and process values for a given class
-            def parse_stat(class_names):
-                for class_name in class_names:
-                    stat_span = row.find("span", class_=class_name)
-                    if stat_span:
-                        # Find all spans with the 's' class inside the parent span
-                        value_spans = stat_span.find_all("span", class_="s")
-
-                        # Extract title and value, ignoring separators
-                        results = [
-                            [span["title"], span.get_text(strip=True)]
-                            for span in value_spans if span.has_attr("title")
-                        ]
-                        if results:
-                            return results
-                return None
-
-            # Classes to look for in priority order
-            class_names = ["m-expert", "m-expert-master"]
-
-            # Extract values for each stat using parse_stat
-            health = parse_stat(class_names)
-            damage = parse_stat(class_names)
-            defense = parse_stat(class_names)
-            kb_resist = parse_stat(class_names)
-
-            # Return a dictionary of stats
-            return {
-                "health": health,
-                "damage": damage,
-                "defense": defense,
-                "kb_resist": kb_resist,
-            }
-
-
-        stats = extract_values_from_row(row) 
-
-        # Extract Coins for Classic Mode
-        coins_cell = cells[7] if len(cells) > 7 else None
-        classic_coins = []
-
-        if coins_cell:
-            # Search for either 'm-expert' or 'm-expert-master' span
-            classic_span = (
-                coins_cell.find("span", class_="m-expert") or
-                coins_cell.find("span", class_="m-expert-master")
-            )
-            if classic_span:
-                # Find all spans with the 's' class inside the found span
-                coin_modes = classic_span.find_all("span", class_="s")
-                for mode in coin_modes:
-                    if mode and mode.has_attr("title"):
-                        # Extract mode title and coin value
-                        mode_title = mode["title"]  # e.g., "Pre-Hardmode"
-                        coin_span = mode.find("span", class_="coin")
-                        if coin_span and coin_span.has_attr("title"):
-                            coin_value = coin_span["title"]  # e.g., "1 Silver 50 Copper Coins"
-                            classic_coins.append(f"{coin_value} in {mode_title}")
-
-
-        # Create a chunk for Expert mode
-        chunk_text = f"In Expert mode, '{npc_name}' "
-
-        # Add health information if available
-        if stats.get("health"):
-            health_info = ", ".join([f"{health[1]} health in {health[0]}" for health in stats["health"] if health])
-            chunk_text += f"has {health_info}. "
-
-        # Add defense information if available
-        if stats.get("defense"):
-            defense_info = ", ".join([f"{defense[1]} defense in {defense[0]}" for defense in stats["defense"] if defense])
-            chunk_text += f"It has {defense_info}. "
-
-        # Add knockback resistance information if available
-        if stats.get("kb_resist"):
-            kb_resist_info = ", ".join([f"{kb_resist[1]} knockback resistance in {kb_resist[0]}" for kb_resist in stats["kb_resist"] if kb_resist])
-            chunk_text += f"It has {kb_resist_info}. "
-
-        # Add damage information if available
-        if stats.get("damage"):
-            damage_info = ", ".join([f"{damage[1]} damage in {damage[0]}" for damage in stats["damage"] if damage])
-            chunk_text += f"It does {damage_info}."
-
-        
-        if classic_coins:
-            coin_info = ", ".join(classic_coins)
-            chunk_text += f" Upon death, it drops {coin_info}."
-            
-        variant_chunks.append({
-            "text": chunk_text,
-            "metadata": {
-                "page_title": page_title,
-                "section_title": "Variants"
-            }
-        }) 
-        
-        # now handle master
-        def extract_values_from_row(row):
-            # Function to extract and process values for a given class
-            def parse_stat(class_names):
-                for class_name in class_names:
-                    stat_span = row.find("span", class_=class_name)
-                    if stat_span:
-                        # Find all spans with the 's' class inside the parent span
-                        value_spans = stat_span.find_all("span", class_="s")
-
-                        # Extract title and value, ignoring separators
-                        results = [
-                            [span["title"], span.get_text(strip=True)]
-                            for span in value_spans if span.has_attr("title")
-                        ]
-                        if results:
-                            return results
-                return None
-
-            # Classes to look for in priority order
-            class_names = ["m-master", "m-expert-master"]
-
-            # Extract values for each stat using parse_stat
-            health = parse_stat(class_names)
-            damage = parse_stat(class_names)
-            defense = parse_stat(class_names)
-            kb_resist = parse_stat(class_names)
-
-            # Return a dictionary of stats
-            return {
-                "health": health,
-                "damage": damage,
-                "defense": defense,
-                "kb_resist": kb_resist,
-            }
-
-
-        stats = extract_values_from_row(row) 
-
-        # Extract Coins for Classic Mode
-        coins_cell = cells[7] if len(cells) > 7 else None
-        classic_coins = []
-
-        if coins_cell:
-            # Search for either 'm-expert' or 'm-expert-master' span
-            classic_span = (
-                coins_cell.find("span", class_="m-master") or
-                coins_cell.find("span", class_="m-expert-master")
-            )
-            if classic_span:
-                # Find all spans with the 's' class inside the found span
-                coin_modes = classic_span.find_all("span", class_="s")
-                for mode in coin_modes:
-                    if mode and mode.has_attr("title"):
-                        # Extract mode title and coin value
-                        mode_title = mode["title"]  # e.g., "Pre-Hardmode"
-                        coin_span = mode.find("span", class_="coin")
-                        if coin_span and coin_span.has_attr("title"):
-                            coin_value = coin_span["title"]  # e.g., "1 Silver 50 Copper Coins"
-                            classic_coins.append(f"{coin_value} in {mode_title}")
-
-
-        # Create a chunk for Expert mode
-        chunk_text = f"In Master mode, '{npc_name}' "
-
-        # Add health information if available
-        if stats.get("health"):
-            health_info = ", ".join([f"{health[1]} health in {health[0]}" for health in stats["health"] if health])
-            chunk_text += f"has {health_info}. "
-
-        # Add defense information if available
-        if stats.get("defense"):
-            defense_info = ", ".join([f"{defense[1]} defense in {defense[0]}" for defense in stats["defense"] if defense])
-            chunk_text += f"It has {defense_info}. "
-
-        # Add knockback resistance information if available
-        if stats.get("kb_resist"):
-            kb_resist_info = ", ".join([f"{kb_resist[1]} knockback resistance in {kb_resist[0]}" for kb_resist in stats["kb_resist"] if kb_resist])
-            chunk_text += f"It has {kb_resist_info}. "
-
-        # Add damage information if available
-        if stats.get("damage"):
-            damage_info = ", ".join([f"{damage[1]} damage in {damage[0]}" for damage in stats["damage"] if damage])
-            chunk_text += f"It does {damage_info}."
-
-        
-        if classic_coins:
-            coin_info = ", ".join(classic_coins)
-            chunk_text += f" Upon death, it drops {coin_info}."
-        
-        variant_chunks.append({
-            "text": chunk_text,
-            "metadata": {
-                "page_title": page_title,
-                "section_title": "Variants"
-            }
-        }) 
 
     return variant_chunks
 
-def process_tiers_section(soup, page_title):
-    set_section = soup.find("span", {"id": "Tiers"})
-    set_chunks = []
+# picked by hand, not derived from a profile run (the crawled corpus is not in the repo): h2 titles that, on the
+# pages looked at, hold only terraria tables that no other handler reads. check it against the most frequent
+# entries of unhandled_sections in preprocess_profile.json after a full run, and bump the "tables" handler version
+# when it changes
+TABLE_SECTIONS = ["Types", "Variations", "Items", "Contents", "Stages", "Buffs", "Sets"]
 
-    if set_section:
-        # Locate the parent <h2> tag to find associated content
-        set_header = set_section.find_parent("h2")
-        set_content = set_header.find_next_sibling("div")
-
-        if set_content:
-            # Find all infoboxes within the "Set" section
-            infoboxes = set_content.find_all("div", class_="infobox item")
-            for infobox in infoboxes:
-                # Extract item title
-                title = infobox.find("div", class_="title").get_text(strip=True) if infobox.find("div", class_="title") else "Unknown Item"
-
-                # Extract statistics
-                type_value = None
-                rarity_value = None
-                buy_value = None
-                sell_value = None
-                research_value = None
-                tooltip = None
-                defense = None
-                damage = None
-                knockback = None
-                mana = None
-                use_time = None
-                velocity = None
-                unprocessed_fields = []  # Track unhandled fields
-
-                stat_table = infobox.find("table", class_="stat")
-                if stat_table:
-                    for row in stat_table.find_all("tr"):
-                        key = row.find("th").get_text(strip=True) if row.find("th") else "Unknown Key"
-                        value_tag = row.find("td")
-                        value = value_tag.get_text(separator=" ", strip=True) if value_tag else "Unknown Value"
-                        
-                        # Handle specific keys
-                        if key.lower() == "type":
-                            print(value)
-                            type_value = value.lower()
-                        elif key.lower() == "rarity":
-                            rarity_sortkey = value_tag.find("s", class_="sortkey")
-                            if rarity_sortkey:
-                               rarity_value = re.sub(r'[^0-9]', '', rarity_sortkey.get_text())
-                        elif key.lower() == "buy":
-                            # Handle Defender Medals and other formats
-                            if "Defender Medals" in value:
-                                buy_value = value_tag.get("title", value)
-                            elif value_tag.find("span", class_="coins"):
-                                buy_value = value_tag.find("span", class_="coins").get("title", value)
-                            else:
-                                buy_value = value
-                        elif key.lower() == "sell":
-                            if value.lower() == "no value":
-                                sell_value = "No value"
-                            else:
-                                coin_span = value_tag.find("span", class_="coin")
-                                sell_value = coin_span.get("title", "") if coin_span else value
-                        elif key.lower() == "tooltip":
-                            tooltip = value.strip("'")
-                        elif key.lower() == "research":
-                            research_value = value
-                        elif key.lower() == "defense":
-                            defense = value
-                        elif key.lower() == "damage":
-                            damage = value
-                        elif key.lower() == "knockback":
-                            knockback = value
-                        elif key.lower() == "mana":
-                            mana = value
-                        elif key.lower() == "use time":
-                            use_time = value
-                        elif key.lower() == "velocity":
-                            velocity = value
-                        else:
-                            # Log unprocessed field
-                            unprocessed_fields.append(f"Key: '{key}', Value: '{value}'")
-
-                # Print unprocessed fields
-                if unprocessed_fields:
-                    print(f"[INFO] Unhandled fields in '{title}', set:")
-                    for field in unprocessed_fields:
-                        print(f"  - {field}")
-
-                # Construct text content for the item
-                text_content = (
-                    f"The item '{title}' is part of the set. "
-                    f"It is of type {type_value}. "
-                    f"It has a rarity level of {rarity_value}. "
-                )
-                if buy_value:
-                    text_content += f"It can be bought for {buy_value}. "
-                if sell_value:
-                    text_content += f"It can be sold for {sell_value}. "
-                if tooltip:
-                    text_content += f"The tooltip reads: \"{tooltip}\". "
-                if research_value:
-                    text_content += f"It requires {research_value} for research purposes. "
-                if defense:
-                    text_content += f"It provides {defense} defense. "
-                if damage:
-                    text_content += f"It deals {damage}. "
-                if knockback:
-                    text_content += f"It has a knockback rating of {knockback}. "
-                if mana:
-                    text_content += f"It consumes {mana} mana per use. "
-                if use_time:
-                    text_content += f"It has a use time of {use_time}. "
-                if velocity:
-                    text_content += f"It has a velocity of {velocity}."
-
-                # Create a chunk for the item
-                set_chunks.append({
-                    "text": text_content.strip(),
-                    "metadata": {
-                        "page_title": page_title,
-                        "section_title": "Tiers"
-                    }
-                })
+# one chunk per row of every terraria table in the sections above, "Header: value" pairs
+def process_table_sections(soup, page_title):
+    table_chunks = []
+    for header in soup.find_all("h2"):
+        section_title_tag = header.find("span", class_="mw-headline")
+        section_title = section_title_tag.get_text(strip=True) if section_title_tag else "Unknown Section"
+        if section_title not in TABLE_SECTIONS:
+            continue
 
-    return set_chunks
+        current_element = header.find_next_sibling()
+        while current_element and current_element.name != "h2":
+            if isinstance(current_element, Tag):
+                tables = [current_element] if current_element.name == "table" else current_element.find_all("table")
+                for table in tables:
+                    if "terraria" not in table.get("class", []):
+                        continue
+                    for record in extract_generic_table(table):
+                        table_chunks.append({
+                            "text": f"{section_title} of {page_title}: " + ", ".join(f"{key}: {value}" for key, value in record.items()) + ".",
+                            "metadata": {
+                                "page_title": page_title,
+                                "section_title": section_title
+                            }
+                        })
+            current_element = current_element.find_next_sibling()
+
+    return table_chunks
 
 def process_list_sections(soup, page_title):
     list_chunks = []
@@ -1228,87 +766,154 @@ def process_list_sections(soup, page_title):
     return list_chunks
 
 
-# main function that calls all the other splitters
-def process_html_file(file_path, file_name):
-    with open(file_path, "r", encoding="utf-8") as file:
-        soup = BeautifulSoup(file, "html.parser")
-        
-        # use file name as page title (strip the .html extension)
-        page_title = os.path.splitext(file_name)[0]
-        
-        # keep track of processed sections
-        processed_sections = []
-        ignored_sections = ["References", "See also", "History", "Gallery", "Quotes", "Footnotes"]  
-        
-        # general information
-        # json_data.extend(process_general_info(soup, page_title))
-        processed_sections.append("General Information")
-        
-        # infoboxes
-        # json_data.extend(process_infoboxes(soup, page_title))
-        processed_sections.append("Infobox")
-        
-        # drop infobox
-        # json_data.extend(process_drop_infoboxes(soup, page_title))
-        processed_sections.append("Drop Infobox")
-        
-        # crafting
-        # json_data.extend(process_crafting_section(soup, page_title))
-        processed_sections.append("Crafting")
-        
-        # set
-        # json_data.extend(process_set_section(soup, page_title))
-        processed_sections.append("Set")
-        
-        # achievements
-        # json_data.extend(process_achievements_section(soup, page_title))
-        processed_sections.append("Achievement")
-        # json_data.extend(process_achievementss_section(soup, page_title))
-        processed_sections.append("Achievements")
-        
-        # variants
-        # json_data.extend(process_variants_section(soup, page_title))  # needed two because the variations seem to be not happy with me
-        # json_data.extend(process_variants_section2(soup, page_title))
-        processed_sections.append("Variants")
-        
-        # tiers
-        # json_data.extend(process_tiers_section(soup, page_title))
-        processed_sections.append("Tiers")
-        
-        # general stuff
-        json_data.extend(process_list_sections(soup, page_title))
-        processed_sections.append("Trivia")
-        processed_sections.append("Tips")
-        processed_sections.append("Notes")
-        processed_sections.append("Note")
-        
-        log_unhandled_sections(soup, processed_sections, ignored_sections, page_title)
-        
-        
-        
-
+# every splitter with the sections it covers. only enabled ones run, bump "version" whenever a
+# handler's output changes so the preprocessing cache re-runs it instead of reusing old chunks
+HANDLERS = [
+    {"name": "general_info", "function": process_general_info, "version": 2, "enabled": False, "sections": ["General Information"]},
+    {"name": "infoboxes", "function": process_infoboxes, "version": 2, "enabled": False, "sections": ["Infobox"]},
+    {"name": "drop_infoboxes", "function": process_drop_infoboxes, "version": 2, "enabled": False, "sections": ["Drop Infobox"]},
+    {"name": "crafting", "function": process_crafting_section, "version": 2, "enabled": False, "sections": ["Crafting"]},
+    {"name": "set", "function": process_set_section, "version": 3, "enabled": False, "sections": ["Set"]},
+    {"name": "achievements", "function": process_achievements_section, "version": 3, "enabled": False, "sections": ["Achievement", "Achievements"]},
+    {"name": "variants", "function": process_variants_section, "version": 3, "enabled": False, "sections": ["Variants"]},
+    {"name": "tiers", "function": process_tiers_section, "version": 3, "enabled": False, "sections": ["Tiers"]},
+    {"name": "tables", "function": process_table_sections, "version": 2, "enabled": False, "sections": TABLE_SECTIONS},
+    # general stuff
+    {"name": "list_sections", "function": process_list_sections, "version": 2, "enabled": True, "sections": ["Trivia", "Tips", "Notes", "Note"]},
+]
+IGNORED_SECTIONS = ["References", "See also", "History", "Gallery", "Quotes", "Footnotes"]
+UNHANDLED_SECTIONS_VERSION = 1
+
+# handlers report what they could not read here instead of printing it. run_handler keeps it with the
+# handler's result, so a cached page still shows up in the profiling report
+handler_unhandled_fields = None
+
+
+def report_unhandled_fields(section_title, fields):
+    if handler_unhandled_fields is not None:
+        handler_unhandled_fields.append([section_title, list(fields)])
+
+
+# run one handler with the entity rows it writes and the fields it could not read recorded, so a cache hit can replay them
+def run_handler(handler, soup, page_title):
+    global entity_store, handler_unhandled_fields
+    store = entity_store
+    entity_store = RecordingEntityStore(store)
+    handler_unhandled_fields = []
+    try:
+        chunks = handler["function"](soup, page_title)
+    finally:
+        recorded_rows = entity_store.calls
+        unhandled_fields = handler_unhandled_fields
+        entity_store = store
+        handler_unhandled_fields = None
+    return {"chunks": chunks, "entity_rows": recorded_rows, "unhandled_fields": unhandled_fields}
+
+# main function that calls all the other splitters on one page's raw html.
+# returns the page's chunks and the entity rows its handlers wrote (also written to entity_store when set)
+def process_page(html, page_title, cache=None):
+    content_hash = hashlib.sha256(html).hexdigest()
+    chunks = []
+    entity_rows = []
+
+    # only parse the page when some handler actually has to run
+    soup = None
+    def get_soup():
+        nonlocal soup
+        if soup is None:
+            start = time.perf_counter()
+            soup = parse_article(html, RESTRICTED_PARSE)
+            profile.record_parse(time.perf_counter() - start)
+        return soup
+
+    # keep track of processed sections
+    processed_sections = [section for handler in HANDLERS for section in handler["sections"]]
+
+    for handler in HANDLERS:
+        if not handler["enabled"]:
+            continue
+        result = cache.get(content_hash, page_title, handler["name"], handler["version"]) if cache else None
+        if result is None:
+            page_soup = get_soup()
+            start = time.perf_counter()
+            result = run_handler(handler, page_soup, page_title)
+            profile.record_handler(handler["name"], time.perf_counter() - start, len(result["chunks"]))
+            if cache:
+                cache.put(content_hash, page_title, handler["name"], handler["version"], result)
+        else:
+            if entity_store:
+                replay_entity_rows(entity_store, result["entity_rows"])
+            profile.record_handler(handler["name"], 0.0, len(result["chunks"]), cached=True)
+        for section_title, fields in result["unhandled_fields"]:
+            profile.record_unhandled_fields(section_title, fields, page_title)
+        chunks.extend(result["chunks"])
+        entity_rows.extend(result["entity_rows"])
+
+    # the unhandled section scan is cached like a handler, a fully cached page is never parsed
+    unhandled_sections = cache.get(content_hash, page_title, "unhandled_sections", UNHANDLED_SECTIONS_VERSION) if cache else None
+    if unhandled_sections is None:
+        unhandled_sections = find_unhandled_sections(get_soup(), processed_sections, IGNORED_SECTIONS)
+        if cache:
+            cache.put(content_hash, page_title, "unhandled_sections", UNHANDLED_SECTIONS_VERSION, unhandled_sections)
+    profile.record_unhandled(unhandled_sections, page_title)
+    profile.record_page()
+    return chunks, entity_rows
+
+
+def process_html_file(file_path, file_name, cache=None):
+    with open(file_path, "rb") as file:
+        html = file.read()
+
+    # use file name as page title (strip the .html extension)
+    page_title = os.path.splitext(file_name)[0]
+    chunks, _ = process_page(html, page_title, cache)
+    json_data.extend(chunks)
 
 
 # main function to process all htmls the input folder
-def process_input_folder(input_folder, output_file):
+def process_input_folder(input_folder, output_file, entity_db_file=None, cache_file=None, profile_file=None):
+    global entity_store, profile
+    profile = PreprocessProfile()
+    if entity_db_file:
+        entity_store = EntityStore(entity_db_file)
+        entity_store.clear()
+    # the crafting handler applies cleanup_rules.json, editing a rule has to re-run it. the handlers read a
+    # different soup with RESTRICTED_PARSE on or off, results from the other parse are never reused
+    parse_mode = "restricted" if RESTRICTED_PARSE else "full"
+    cache = PreprocessCache(cache_file, rules_file_hash(), parse_mode) if cache_file else None
+
     for root, _, files in os.walk(input_folder):
         for file_name in files:
             if file_name.endswith(".html"):
                 file_path = os.path.join(root, file_name)
-                process_html_file(file_path, file_name)
-    
-        
-    sorted_dict = dict(sorted(all_unlogged.items(), key=lambda item: item[1], reverse=True))
-    print(sorted_dict)
+                process_html_file(file_path, file_name, cache)
+
+    if cache:
+        print(f"Preprocessing cache: {cache.hits} hits, {cache.misses} misses")
+        handler_versions = {handler["name"]: handler["version"] for handler in HANDLERS}
+        handler_versions["unhandled_sections"] = UNHANDLED_SECTIONS_VERSION
+        cache.prune(handler_versions)
+        cache.close()
+
+    print(profile.summary())
+    if profile_file:
+        profile.write(profile_file)
+        print(f"Profiling report saved to {profile_file}")
+
+    # write the output JSON, titles stored once and referenced by id.
+    # python preprocessing/chunk_records.py converts it to the plain list of chunk dicts
+    json_data.write(output_file)
 
-    # write the output JSON
-    with open(output_file, "w", encoding="utf-8") as output:
-        json.dump(json_data, output, indent=4, ensure_ascii=False)
+    if entity_store:
+        entity_store.close()
 
 # Entry point
 if __name__ == "__main__":
     input_folder = "terraria_wiki_pages"
     output_file = "preprocessing/terraria_preprocessed_chunks_misc.json"
-    process_input_folder(input_folder, output_file)
+    entity_db_file = "preprocessing/terraria_entities.db"
+    cache_file = "preprocessing/.preprocess_cache.db"
+    profile_file = "preprocessing/preprocess_profile.json"
+    process_input_folder(input_folder, output_file, entity_db_file, cache_file, profile_file)
 
 
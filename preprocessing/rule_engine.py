@@ -0,0 +1,179 @@
+# text cleanup rules defined in cleanup_rules.json, compiled once and applied as a streaming stage over chunk records
+# usage: python preprocessing/rule_engine.py input.json output.json [--rule-set chunks] [--workers 4]
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+from multiprocessing import Pool
+from chunk_records import FORMAT as CHUNK_FORMAT, ChunkStore
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cleanup_rules.json")
+
+
+class Rule:
+    def __init__(self, name, pattern, replacement="", count=0, occurrence=None, sections=None, description=""):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.replacement = replacement
+        self.count = count  # like re.sub, 0 replaces every match
+        self.occurrence = occurrence  # only replace the nth match (1-based)
+        self.sections = set(sections) if sections else None
+        self.description = description
+
+    def applies_to(self, section_title):
+        return self.sections is None or section_title in self.sections
+
+    # returns the new text and how many replacements were made
+    def apply(self, text):
+        if self.occurrence:
+            match = next(itertools.islice(self.pattern.finditer(text), self.occurrence - 1, None), None)
+            if match is None:
+                return text, 0
+            return text[:match.start()] + match.expand(self.replacement) + text[match.end():], 1
+        return self.pattern.subn(self.replacement, text, count=self.count)
+
+
+# changes whenever any rule in the file does, for caches of output the rules were applied to
+def rules_file_hash(rules_file=DEFAULT_RULES_FILE):
+    with open(rules_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def load_rules(rule_set, rules_file=DEFAULT_RULES_FILE):
+    with open(rules_file, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if rule_set not in config:
+        raise KeyError(f"Rule set '{rule_set}' not found in {rules_file}")
+    return [Rule(**rule) for rule in config[rule_set]]
+
+
+class RuleEngine:
+    def __init__(self, rules):
+        self.rules = rules
+        self.stats = {rule.name: {"hits": 0, "seconds": 0.0} for rule in rules}
+
+    def clean_text(self, text, section_title=None):
+        for rule in self.rules:
+            if section_title is not None and not rule.applies_to(section_title):
+                continue
+            start = time.perf_counter()
+            text, hits = rule.apply(text)
+            stats = self.stats[rule.name]
+            stats["seconds"] += time.perf_counter() - start
+            stats["hits"] += hits
+        return text
+
+    def clean_record(self, record):
+        cleaned = dict(record)
+        cleaned["text"] = self.clean_text(record.get("text", ""), record.get("metadata", {}).get("section_title", ""))
+        return cleaned
+
+    # streaming: records are cleaned one at a time as the caller iterates
+    def transform(self, records):
+        for record in records:
+            yield self.clean_record(record)
+
+    def merge_stats(self, other_stats):
+        for name, stats in other_stats.items():
+            self.stats[name]["hits"] += stats["hits"]
+            self.stats[name]["seconds"] += stats["seconds"]
+
+    def report(self):
+        lines = [f"{'rule':<28}{'hits':>10}{'ms':>12}"]
+        for name, stats in self.stats.items():
+            lines.append(f"{name:<28}{stats['hits']:>10}{stats['seconds'] * 1000:>12.1f}")
+        return "\n".join(lines)
+
+
+# multiprocess mode: every worker compiles the rules once and cleans whole batches
+worker_engine = None
+
+def init_worker(rule_set, rules_file):
+    global worker_engine
+    worker_engine = RuleEngine(load_rules(rule_set, rules_file))
+
+def clean_batch(records):
+    for stats in worker_engine.stats.values():
+        stats["hits"], stats["seconds"] = 0, 0.0
+    cleaned = [worker_engine.clean_record(record) for record in records]
+    return cleaned, worker_engine.stats
+
+
+def batched(records, size):
+    iterator = iter(records)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def transform_parallel(records, engine, rule_set, rules_file, workers, batch_size=500):
+    with Pool(workers, initializer=init_worker, initargs=(rule_set, rules_file)) as pool:
+        # imap keeps the input order
+        for cleaned, stats in pool.imap(clean_batch, batched(records, batch_size)):
+            engine.merge_stats(stats)
+            yield from cleaned
+
+
+# accepts the json array the preprocessing writes, or json lines
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    # a compact chunk file is one json object on one line
+                    if record.get("format") == CHUNK_FORMAT:
+                        yield from ChunkStore.from_compact(record)
+                    else:
+                        yield record
+
+
+# still a json array so index.py can json.load it, but one record per line and written as it streams
+def write_records(path, records):
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for record in records:
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(record, ensure_ascii=False))
+            count += 1
+        f.write("\n]\n")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the cleanup rules to preprocessed chunks")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--rule-set", default="chunks")
+    parser.add_argument("--rules-file", default=DEFAULT_RULES_FILE)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    engine = RuleEngine(load_rules(args.rule_set, args.rules_file))
+    records = read_records(args.input)
+    if args.workers > 1:
+        cleaned = transform_parallel(records, engine, args.rule_set, args.rules_file, args.workers)
+    else:
+        cleaned = engine.transform(records)
+
+    start = time.perf_counter()
+    count = write_records(args.output, cleaned)
+    print(f"Cleaned {count} records in {time.perf_counter() - start:.2f}s")
+    print(engine.report())
+
+if __name__ == "__main__":
+    main()
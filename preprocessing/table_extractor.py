@@ -0,0 +1,205 @@
+# schema-driven extraction of the wiki's stat tables. every table is walked once: header cells are mapped to
+# column names, and each cell's mode spans (m-normal, m-expert, m-master) are read in the same pass
+
+import re
+
+MODES = ["Classic", "Expert", "Master"]
+
+# mode span class -> the modes its value holds in
+MODE_CLASSES = {
+    "m-normal": ["Classic"],
+    "m-expert": ["Expert"],
+    "m-master": ["Master"],
+    "m-expert-master": ["Expert", "Master"],
+}
+
+
+def text_value(tag):
+    return tag.get_text(separator=" ", strip=True)
+
+
+# coin amounts are only spelled out in the title of the coin span
+def coin_or_text_value(tag):
+    coin_span = tag.find("span", class_="coin")
+    if coin_span and coin_span.has_attr("title"):
+        return coin_span["title"]
+    return text_value(tag)
+
+
+def linked_title_value(tag):
+    title_span = tag.find("span", title=True)
+    return title_span["title"] if title_span else text_value(tag)
+
+
+# one value can differ by progression stage (span.s titled Pre-Hardmode, Hardmode, ...),
+# returned as a list of (stage, value) with stage None when there is only one value
+def staged_values(tag):
+    stages = [span for span in tag.find_all("span", class_="s") if span.has_attr("title")]
+    if stages:
+        return [(span["title"], coin_or_text_value(span)) for span in stages]
+    return [(None, coin_or_text_value(tag))]
+
+
+# {"Classic": [(stage, value), ...], "Expert": ..., "Master": ...} for one table cell
+def extract_mode_values(cell):
+    mode_values = {}
+    for span in cell.find_all("span", class_=list(MODE_CLASSES)):
+        values = staged_values(span)
+        for class_name in span.get("class", []):
+            for mode in MODE_CLASSES.get(class_name, []):
+                mode_values.setdefault(mode, values)
+    if not mode_values:
+        # no mode spans, the same value holds in every mode
+        values = staged_values(cell)
+        mode_values = {mode: values for mode in MODES}
+    return mode_values
+
+
+# "90 health in Pre-Hardmode, 198 health in Hardmode" or "45 health"
+def describe(values, unit=""):
+    unit = f" {unit}" if unit else ""
+    return ", ".join(f"{value}{unit} in {stage}" if stage else f"{value}{unit}" for stage, value in values)
+
+
+def normalize_header(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+# npc variant tables (Variants sections and the enemy lists), one row per npc
+VARIANTS_TABLE = {
+    "columns": {
+        "id": "npc_id",
+        "name": "name", "entity": "name", "npc": "name",
+        "health": "health", "max life": "health", "life": "health", "hp": "health",
+        "damage": "damage",
+        "defense": "defense",
+        "kb resist": "kb_resist", "knockback resist": "kb_resist", "knockback resistance": "kb_resist",
+        "coins": "coins", "money": "coins", "money dropped": "coins",
+    },
+    # column order of the wiki template, used when a header cell is not recognised
+    "positions": ["npc_id", None, "name", "health", "damage", "defense", "kb_resist", "coins"],
+    "mode_columns": ["health", "damage", "defense", "kb_resist", "coins"],
+    "parsers": {"name": linked_title_value},
+}
+
+
+# column name for every cell position, from the header row (colspans expanded) or the schema's positions
+def map_columns(header_row, schema):
+    columns = []
+    if header_row is not None:
+        for cell in header_row.find_all(["th", "td"], recursive=False):
+            name = schema["columns"].get(normalize_header(cell.get_text(" ", strip=True)))
+            columns.extend([name] * int(cell.get("colspan", 1) or 1))
+    positions = schema["positions"]
+    for i in range(max(len(columns), len(positions))):
+        if i >= len(columns):
+            columns.append(positions[i])
+        elif columns[i] is None and i < len(positions) and positions[i] not in columns:
+            columns[i] = positions[i]
+    return columns
+
+
+# rows of a table as dicts; mode columns hold extract_mode_values results, "modes" lists the
+# modes the row exists in (rows classed m-expert-master only exist in expert and master)
+def extract_table(table, schema):
+    rows = table.find_all("tr")
+    header_row = rows[0] if rows and rows[0].find("th") and not rows[0].find("td") else None
+    columns = map_columns(header_row, schema)
+    mode_columns = set(schema["mode_columns"])
+    parsers = schema.get("parsers", {})
+
+    records = []
+    for row in rows[1:] if header_row is not None else rows:
+        cells = row.find_all("td", recursive=False)
+        if not cells:
+            continue
+        record = {"modes": MODES}
+        for row_class in row.get("class", []):
+            if row_class in MODE_CLASSES:
+                record["modes"] = MODE_CLASSES[row_class]
+        for column, cell in zip(columns, cells):
+            if column is None or column in record:
+                continue
+            if column in mode_columns:
+                record[column] = extract_mode_values(cell)
+            else:
+                record[column] = parsers.get(column, text_value)(cell)
+        records.append(record)
+    return records
+
+
+# any table: header text -> cell text, for sections without a dedicated schema
+def extract_generic_table(table):
+    rows = table.find_all("tr")
+    if not rows:
+        return []
+    headers = [cell.get_text(" ", strip=True) for cell in rows[0].find_all(["th", "td"], recursive=False)]
+    records = []
+    for row in rows[1:]:
+        cells = row.find_all(["th", "td"], recursive=False)
+        record = {}
+        for header, cell in zip(headers, cells):
+            value = text_value(cell)
+            if header and value:
+                record[header] = value
+        if record:
+            records.append(record)
+    return records
+
+
+def rarity_value(tag):
+    sortkey = tag.find("s", class_="sortkey")
+    return re.sub(r"[^0-9]", "", sortkey.get_text()) if sortkey else None
+
+
+def buy_value(tag):
+    value = text_value(tag)
+    # Defender Medals and other non-coin prices
+    if "Defender Medals" in value:
+        return tag.get("title", value)
+    coins_span = tag.find("span", class_="coins")
+    return coins_span.get("title", value) if coins_span else value
+
+
+def sell_value(tag):
+    value = text_value(tag)
+    if value.lower() == "no value":
+        return "No value"
+    coin_span = tag.find("span", class_="coin")
+    return coin_span.get("title", "") if coin_span else value
+
+
+# item infobox stat tables (key in th, value in td): label -> (field, parser)
+ITEM_STAT_FIELDS = {
+    "type": ("type", lambda tag: text_value(tag).lower()),
+    "body slot": ("body_slot", text_value),
+    "rarity": ("rarity", rarity_value),
+    "buy": ("buy", buy_value),
+    "sell": ("sell", sell_value),
+    "tooltip": ("tooltip", lambda tag: text_value(tag).strip("'")),
+    "research": ("research", text_value),
+    "defense": ("defense", text_value),
+    "damage": ("damage", text_value),
+    "knockback": ("knockback", text_value),
+    "mana": ("mana", text_value),
+    "use time": ("use_time", text_value),
+    "velocity": ("velocity", text_value),
+}
+
+
+# returns the parsed fields and the labels the schema does not know
+def extract_stat_table(table, fields=ITEM_STAT_FIELDS):
+    values = {}
+    unhandled = []
+    for row in table.find_all("tr"):
+        key_tag = row.find("th")
+        value_tag = row.find("td")
+        if key_tag is None or value_tag is None:
+            continue
+        key = normalize_header(key_tag.get_text(strip=True))
+        if key in fields:
+            field, parser = fields[key]
+            values[field] = parser(value_tag)
+        else:
+            unhandled.append(key_tag.get_text(strip=True))
+    return values, unhandled
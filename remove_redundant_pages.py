@@ -1,32 +1,51 @@
 import os
 import re
-from bs4 import BeautifulSoup
+import hashlib
+
+# the redirect stub is the first thing in the parser output, so the head of the file is enough to spot it
+REDIRECT_PATTERN = re.compile(rb'<p[^>]*>\s*Redirect to:')
+REDIRECT_CHECK_BYTES = 4096
+
+def is_redirect(data):
+    head = data[:REDIRECT_CHECK_BYTES]
+    # cheap substring test first, the regex only runs on the few files that contain the text
+    return b'Redirect to:' in head and REDIRECT_PATTERN.search(head) is not None
+
+# why a page should not be kept ("underscore", "redirect", "duplicate"), or None to keep it.
+# seen_hashes collects the hashes of the kept pages
+def unwanted_reason(filename, data, seen_hashes):
+    # files with an underscore in the filename (subpages, the scraper turns '/' into '_')
+    if '_' in filename:
+        return "underscore"
+
+    # Check the raw bytes for the redirect text instead of parsing the whole page
+    if is_redirect(data):
+        return "redirect"
+
+    # byte-identical copies of a page that was already kept
+    digest = hashlib.sha256(data).hexdigest()
+    if digest in seen_hashes:
+        return "duplicate"
+    seen_hashes.add(digest)
+    return None
 
 def remove_unwanted_pages(directory):
+    seen_hashes = set()
+
     # Iterate over all files in the directory
-    for filename in os.listdir(directory):
+    for filename in sorted(os.listdir(directory)):
         filepath = os.path.join(directory, filename)
         
         # Skip files that do not have .html extension
         if not filename.endswith(".html"):
             continue
 
-        # Remove files with an underscore in the filename
-        if '_' in filename:
-            print(f"Removing file with underscore: {filename}")
+        # the underscore check needs no read
+        data = b"" if '_' in filename else open(filepath, 'rb').read()
+        reason = unwanted_reason(filename, data, seen_hashes)
+        if reason:
+            print(f"Removing {reason} file: {filename}")
             os.remove(filepath)
-            continue
-
-        # Open and parse the HTML file to check for the redirect text
-        with open(filepath, 'r', encoding='utf-8') as file:
-            soup = BeautifulSoup(file, 'html.parser')
-            redirect_text = soup.find('p', text=re.compile(r'Redirect to:'))
-            
-            # If the redirect text is found, remove the file
-            if redirect_text:
-                print(f"Removing redirect file: {filename}")
-                os.remove(filepath)
-                continue
 
 if __name__ == "__main__":
     directory = 'terraria_wiki_pages'  
@@ -0,0 +1,106 @@
+import numpy as np
+from fuzzywuzzy import fuzz
+from metrics import span
+from index_loader import cached, load_index, load_metadata
+from sections import LoadedIndex, SectionRoutedIndex, classify_query, routed
+
+
+def clean_query(query):
+    # remove small words, e.g. "how to craft a workbench" -> "craft workbench"
+    stop_words = set(["how", "to", "with", "for", "the", "a", "an", "in", "at", "of"])
+    query_tokens = [word for word in query.split() if word.lower() not in stop_words]
+    return ' '.join(query_tokens)
+
+
+def rerank(cleaned_query, indices, distances, metadata, top_k, title_weight, section_weight):
+    # fine tune the distance match
+    results = []
+    for i, distance in zip(indices, distances):
+        if 0 <= i < len(metadata):
+            metadata_entry = metadata[i]
+            text = metadata_entry.get("text", "[No text available]")
+            page_title = metadata_entry.get("page_title", "").lower()
+            section_title = metadata_entry.get("section_title", "").lower()
+            
+            # using exponential decay, convert distance to score from the fais distances
+            score = np.exp(-distance)  
+            
+            # matching for title and section title 
+            if fuzz.partial_ratio(cleaned_query.lower(), page_title) > 80:
+                score *= title_weight  
+            if fuzz.partial_ratio(cleaned_query.lower(), section_title) > 80:
+                score *= section_weight  
+             
+            results.append({
+                "text": text,
+                "metadata": metadata_entry,
+                "score": score,
+                "index_id": int(i)
+            })
+    
+    # sort the results by score (higher is better) and keep the top_k
+    results = sorted(results, key=lambda x: x["score"], reverse=True)
+    return results[:top_k]
+
+
+# the index and metadata files with their section sub-indexes, built once per process
+def load_routed_index(index_file, metadata_file):
+    return cached("routed", index_file, lambda path: SectionRoutedIndex(LoadedIndex(load_index(path), load_metadata(metadata_file))))
+
+
+# retrieve for many queries at once: one encoder forward pass and one faiss search for the whole batch.
+# routing=True searches recipe and drop questions only in the sections they are about (sections.py)
+def retrieve_batch(queries, index_file, metadata_file, model, top_k=3, title_weight=1.5, section_weight=1.2, timings=None, routing=False):
+    if routing:
+        with span(timings, "index_load"):
+            routed_index = load_routed_index(index_file, metadata_file)
+        return retrieve_batch_loaded(queries, routed_index, model, top_k, title_weight, section_weight, timings, routing)
+
+    # Step 1: clean and encode all the queries together
+    cleaned_queries = [clean_query(query) for query in queries]
+    with span(timings, "query_encode"):
+        query_embeddings = model.encode(cleaned_queries, convert_to_tensor=False)
+    
+    # Step 2: get the FAISS index (memory-mapped and loaded once per process) and search for closest matches
+    with span(timings, "index_load"):
+        index = load_index(index_file)
+    with span(timings, "index_search"):
+        distances, indices = index.search(np.array(query_embeddings), k=top_k)
+    
+    # Step 3: load metadata for each result
+    with span(timings, "metadata_load"):
+        metadata = load_metadata(metadata_file)
+    
+    # Step 4: rerank every query's hits separately
+    with span(timings, "rerank"):
+        return [
+            rerank(cleaned_query, indices[row], distances[row], metadata, top_k, title_weight, section_weight)
+            for row, cleaned_query in enumerate(cleaned_queries)
+        ]
+
+
+# same as retrieve_batch over an index that is already loaded: anything with a faiss style search() and a
+# metadata list, i.e. a shards.ShardedIndex or an index_versions.IndexVersion
+def retrieve_batch_loaded(queries, loaded_index, model, top_k=3, title_weight=1.5, section_weight=1.2, timings=None, routing=False):
+    cleaned_queries = [clean_query(query) for query in queries]
+    with span(timings, "query_encode"):
+        query_embeddings = model.encode(cleaned_queries, convert_to_tensor=False)
+
+    with span(timings, "index_search"):
+        if routing:
+            if not isinstance(loaded_index, SectionRoutedIndex):
+                loaded_index = routed(loaded_index)
+            routes = [classify_query(query) for query in queries]
+            distances, indices = loaded_index.search_routes(np.array(query_embeddings), top_k, routes)
+        else:
+            distances, indices = loaded_index.search(np.array(query_embeddings), k=top_k)
+
+    with span(timings, "rerank"):
+        return [
+            rerank(cleaned_query, indices[row], distances[row], loaded_index.metadata, top_k, title_weight, section_weight)
+            for row, cleaned_query in enumerate(cleaned_queries)
+        ]
+
+
+def retrieve(query, index_file, metadata_file, model, top_k=3, title_weight=1.5, section_weight=1.2, timings=None, routing=False):
+    return retrieve_batch([query], index_file, metadata_file, model, top_k, title_weight, section_weight, timings, routing)[0]
@@ -1,43 +1,82 @@
 # !pip install requests tqdm
 
+import argparse
 import os
+import sys
+import hashlib
+import queue
+import threading
 import requests
 from tqdm import tqdm
+from crawl_journal import CrawlJournal
+from http_cache import DEFAULT_MAX_BYTES, HttpCache
 
 API_URL = "https://terraria.wiki.gg/api.php"
 OUTPUT_DIR = "terraria_wiki_pages"
+CACHE_FILE = ".scraper_cache.db"
+JOURNAL_FILE = ".crawl_journal.db"
+
+# parser output the preprocessing never reads: edit section links, the limit report comment and the toc
+TRIMMED_PARSE_PARAMS = {"disableeditsection": "1", "disablelimitreport": "1", "disabletoc": "1"}
+
+# one connection pool for the whole crawl. requests already asks for gzip / deflate, like the old plain requests.get did
+session = requests.Session()
+
+# set by main() (and pipeline.py) so a re-crawl reuses earlier responses, see http_cache.py
+http_cache = None
 
 # Create output directory if it doesn't exist
 if not os.path.exists(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR)
 
-# Step 1: Get the list of all pages
-def get_all_pages():
+# revid / touched name the revision the caller expects, a cached response of that revision is used as is
+def api_get(params, revid=None, touched=None):
+    if http_cache:
+        return http_cache.get_json(API_URL, params, revid, touched)
+    return session.get(API_URL, params=params).json()
+
+# Step 1: Get the list of all pages, one listing batch at a time so downloads can start right away.
+# allpages as a generator with prop=info, so every page comes with its latest revid and touched timestamp
+# (touched also moves when a template the page uses changes).
+# yields every batch with the continue parameters for the batch after it (None after the last one)
+def iter_listing_batches(continue_params=None):
     params = {
         "action": "query",
-        "list": "allpages",
-        "aplimit": "max",
-        "format": "json"
+        "generator": "allpages",
+        "gaplimit": "max",
+        "gapfilterredir": "nonredirects",  # redirects only render a "Redirect to:" stub, never download them
+        "prop": "info",
+        "format": "json",
+        "formatversion": "2"
     }
-    pages = []
+    if continue_params:
+        params.update(continue_params)
     while True:
-        response = requests.get(API_URL, params=params).json()
-        pages.extend(response['query']['allpages'])
-        if 'continue' in response:
-            params.update(response['continue'])
+        response = api_get(params)
+        next_params = response.get('continue')
+        yield response.get('query', {}).get('pages', []), next_params
+        if next_params:
+            params.update(next_params)
         else:
             break
-    return pages
+
+def iter_all_pages():
+    for pages, _ in iter_listing_batches():
+        yield from pages
+
+def get_all_pages():
+    return list(iter_all_pages())
 
 # Step 2: Fetch expanded page content
-def fetch_expanded_page_content(pageid):
-    params = {
-        "action": "parse",
-        "pageid": pageid,
-        "prop": "text",
-        "format": "json"
-    }
-    response = requests.get(API_URL, params=params).json()
+def parse_params(pageid, **extra):
+    return {"action": "parse", "pageid": pageid, "prop": "text|revid", **TRIMMED_PARSE_PARAMS, "format": "json", **extra}
+
+# with sections (a set of h2 titles) only the lead and those sections are rendered, each with its own request.
+# saves bytes on long pages at the cost of more requests, so it only pays off for a narrow set of sections
+def fetch_expanded_page_content(pageid, revid=None, touched=None, sections=None):
+    if sections:
+        return fetch_page_sections(pageid, sections, revid, touched)
+    response = api_get(parse_params(pageid), revid, touched)
     if 'parse' in response:
         title = response['parse']['title']
         content = response['parse']['text']['*']  # Rendered HTML
@@ -46,6 +85,33 @@ def fetch_expanded_page_content(pageid):
         print(f"Failed to expand page ID {pageid}")
         return None, None
 
+# the lead holds the infoboxes. transcluded sections have indexes like "T-1" and cannot be fetched by number
+def wanted_section_indexes(section_list, sections):
+    return ["0"] + [
+        section['index'] for section in section_list
+        if section['level'] == "2" and section['line'] in sections and section['index'].isdigit()
+    ]
+
+def fetch_page_sections(pageid, sections, revid=None, touched=None):
+    response = api_get({"action": "parse", "pageid": pageid, "prop": "sections|revid", "format": "json"}, revid, touched)
+    if 'parse' not in response:
+        print(f"Failed to list the sections of page ID {pageid}")
+        return None, None
+    parts = []
+    for index in wanted_section_indexes(response['parse']['sections'], sections):
+        part = api_get(parse_params(pageid, section=index), revid, touched)
+        if 'parse' not in part:
+            print(f"Failed to expand section {index} of page ID {pageid}")
+            return None, None
+        parts.append(part['parse']['text']['*'])
+    return response['parse']['title'], "\n".join(parts)
+
+# the h2 titles the enabled preprocessing handlers read
+def handled_section_titles():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
+    from preprocessing import HANDLERS
+    return {section for handler in HANDLERS if handler["enabled"] for section in handler["sections"]}
+
 # Step 3: Save expanded content to files
 def save_page_content(title, content):
     # Sanitize filename
@@ -54,18 +120,140 @@ def save_page_content(title, content):
     with open(filepath, 'w', encoding='utf-8') as f:
         f.write(content)
 
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+# hashes of the pages already on disk so a re-run also skips duplicates of earlier downloads
+def load_stored_hashes():
+    hashes = set()
+    for filename in os.listdir(OUTPUT_DIR):
+        if filename.endswith(".html"):
+            with open(os.path.join(OUTPUT_DIR, filename), 'rb') as f:
+                hashes.add(hashlib.sha256(f.read()).hexdigest())
+    return hashes
+
+# returns what happened to the page: saved, duplicate or failed
+def download_page(page, seen_hashes, sections=None):
+    title, content = fetch_expanded_page_content(page['pageid'], page.get('lastrevid'), page.get('touched'), sections)
+    if not (title and content):
+        return "failed"
+    # identical rendered html (e.g. two titles transcluding the same content), keep the first one only
+    digest = content_hash(content)
+    if digest in seen_hashes:
+        return "duplicate"
+    seen_hashes.add(digest)
+    save_page_content(title, content)
+    return "saved"
+
 def download_pages(pages):
+    seen_hashes = load_stored_hashes()
+    skipped = 0
     for page in tqdm(pages, desc="Downloading pages"):
-        title, content = fetch_expanded_page_content(page['pageid'])
-        if title and content:
-            save_page_content(title, content)
+        if download_page(page, seen_hashes) == "duplicate":
+            skipped += 1
+    print(f"Skipped {skipped} duplicate pages.")
+
+# producer: the pages a crashed run listed but never finished, then the rest of the listing from the stored
+# continuation token. every batch is journaled before its pages are queued
+def list_into_queue(journal, page_queue, errors):
+    try:
+        for page in journal.pending_pages():
+            page_queue.put(page)
+        if not journal.listing_done():
+            for pages, next_params in iter_listing_batches(journal.listing_continue()):
+                journal.record_listing_batch(pages, next_params)
+                for page in pages:
+                    page_queue.put(page)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        page_queue.put(None)
+
+# listing and downloading overlap: the listing runs in a thread and the downloads start with its first batch.
+# a crawl that was interrupted is resumed, a finished one is started over
+def crawl(journal, queue_size=1000, sections=None):
+    if journal.finished() or not journal.started():
+        journal.start_new()
+    else:
+        print(f"Resuming crawl, {journal.pending_count()} pages left to download" + ("" if journal.listing_done() else ", listing not finished"))
+
+    page_queue = queue.Queue(queue_size)
+    errors = []
+    producer = threading.Thread(target=list_into_queue, args=(journal, page_queue, errors), daemon=True)
+    producer.start()
+
+    seen_hashes = load_stored_hashes()
+    with tqdm(desc="Downloading pages") as progress:
+        while True:
+            page = page_queue.get()
+            if page is None:
+                break
+            journal.mark_done(page['pageid'], download_page(page, seen_hashes, sections))
+            progress.update()
+    producer.join()
+    if errors:
+        raise errors[0]
+    print(f"Crawl journal: {journal.counts()}")
+
+# bytes over the wire (compressed), bytes of html saved to disk and requests made for one page, uncached
+def wire_bytes(response):
+    return response.raw.tell() or len(response.content)
+
+def measure_request(params):
+    response = session.get(API_URL, params=params)
+    data = response.json()
+    html = data['parse']['text']['*'] if 'parse' in data else ""
+    return wire_bytes(response), len(html.encode("utf-8")), 1
+
+def measure_page(pageid, sections=None):
+    results = {
+        # what the scraper used to request: the default parser output, with the same default headers
+        "before": measure_request({"action": "parse", "pageid": pageid, "prop": "text", "format": "json"}),
+        "trimmed": measure_request(parse_params(pageid)),
+    }
+    if sections:
+        listing = session.get(API_URL, params={"action": "parse", "pageid": pageid, "prop": "sections", "format": "json"})
+        totals = [wire_bytes(listing), 0, 1]
+        for index in wanted_section_indexes(listing.json().get('parse', {}).get('sections', []), sections):
+            totals = [total + value for total, value in zip(totals, measure_request(parse_params(pageid, section=index)))]
+        results["sections"] = tuple(totals)
+    return results
+
+def measure(sample_size, sections=None):
+    pages = []
+    for page in iter_all_pages():
+        pages.append(page)
+        if len(pages) >= sample_size:
+            break
+    totals = {}
+    for page in tqdm(pages, desc="Measuring pages"):
+        for mode, values in measure_page(page['pageid'], sections).items():
+            totals[mode] = [total + value for total, value in zip(totals.get(mode, [0, 0, 0]), values)]
+    print(f"{'mode':<10}{'wire KB/page':>14}{'disk KB/page':>14}{'requests/page':>15}")
+    for mode, (wire, disk, requests_made) in totals.items():
+        print(f"{mode:<10}{wire / len(pages) / 1024:>14.1f}{disk / len(pages) / 1024:>14.1f}{requests_made / len(pages):>15.1f}")
 
 def main():
-    print("Fetching list of all pages...")
-    pages = get_all_pages()
-    print(f"Total pages to download: {len(pages)}")
-    download_pages(pages)
-    print("Download completed.")
+    global http_cache
+    parser = argparse.ArgumentParser(description="Download the rendered html of every wiki page")
+    parser.add_argument("--sections", action="store_true", help="only fetch the lead and the sections the preprocessing handles")
+    parser.add_argument("--measure", type=int, default=None, metavar="PAGES", help="compare request payloads on a sample of pages instead of crawling")
+    args = parser.parse_args()
+    sections = handled_section_titles() if args.sections else None
+
+    if args.measure:
+        measure(args.measure, sections)
+        return
+
+    http_cache = HttpCache(CACHE_FILE, DEFAULT_MAX_BYTES, session=session)
+    journal = CrawlJournal(JOURNAL_FILE)
+    try:
+        crawl(journal, sections=sections)
+        print("Download completed.")
+        print(http_cache.summary())
+    finally:
+        journal.close()
+        http_cache.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+# section types and query routing: every vector's metadata carries the type of the section it came from, and
+# recipe and drop questions are searched in a small exact sub-index of just the matching sections instead of
+# the whole index, where every trivia and notes chunk competes with them.
+# the sub-indexes are built from the loaded index's own vectors, so any build (flat, hnsw, ivf, sharded, versioned)
+# can be routed without rebuilding it
+
+import re
+import threading
+import faiss
+import numpy as np
+
+SECTION_TYPES = {
+    "Crafting - Recipes": "recipes",
+    "Crafting - Used in": "used_in",
+    "Drop Infobox": "drops",
+    "Drops": "drops",
+    "Trivia": "trivia",
+    "Tips": "tips",
+    "Notes": "notes",
+    "Note": "notes",
+    "General Information": "general",
+    "Infobox": "general",
+}
+
+# route name -> section types searched for it
+ROUTES = {
+    "crafting": ("recipes", "used_in"),
+    "drops": ("drops",),
+}
+
+CRAFTING_PATTERN = re.compile(
+    r"\b(craft|crafts|crafted|crafting|recipes?|ingredients?|materials?|make|made|used (in|for))\b", re.IGNORECASE
+)
+DROP_PATTERN = re.compile(r"\b(drop|drops|dropped|dropping|loot|drop rate|drop chance)\b", re.IGNORECASE)
+
+
+def section_type(section_title):
+    return SECTION_TYPES.get(section_title, "other")
+
+
+# the route of a question, None when it is not clearly about one of them
+def classify_query(query):
+    crafting = CRAFTING_PATTERN.search(query) is not None
+    drops = DROP_PATTERN.search(query) is not None
+    if crafting == drops:
+        return None
+    return "crafting" if crafting else "drops"
+
+
+def reconstruct_vectors(index, ids):
+    try:
+        return index.reconstruct_batch(ids)
+    except RuntimeError:
+        # ivf indexes only reconstruct with a direct map
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_batch(ids)
+
+
+# a loaded index (anything with a faiss style search(), reconstruct_batch() and a metadata list) plus one exact
+# sub-index per route. search() still covers everything, search_routes() sends every query to its route
+class SectionRoutedIndex:
+    def __init__(self, loaded_index, routes=ROUTES):
+        self.index = loaded_index
+        self.metadata = loaded_index.metadata
+        types = [entry.get("section_type") or section_type(entry.get("section_title", "")) for entry in self.metadata]
+        self.sub_indexes = {}
+        for route, route_types in routes.items():
+            ids = np.array([i for i, kind in enumerate(types) if kind in route_types], dtype="int64")
+            if not len(ids):
+                continue
+            try:
+                vectors = loaded_index.reconstruct_batch(ids)
+            except RuntimeError as e:
+                print(f"[INFO] Not routing {route} queries, the index cannot return its vectors: {e}")
+                continue
+            sub_index = faiss.IndexFlatL2(vectors.shape[1])
+            sub_index.add(np.ascontiguousarray(vectors, dtype="float32"))
+            self.sub_indexes[route] = (sub_index, ids)
+
+    @property
+    def ntotal(self):
+        return len(self.metadata)
+
+    def search(self, query_embeddings, k):
+        return self.index.search(query_embeddings, k)
+
+    # routes[i] is the route of query i (None for the whole index), returns global ids like search()
+    def search_routes(self, query_embeddings, k, routes):
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype="float32")
+        distances = np.full((len(query_embeddings), k), np.inf, dtype="float32")
+        indices = np.full((len(query_embeddings), k), -1, dtype="int64")
+        for route in set(routes):
+            rows = [row for row, query_route in enumerate(routes) if query_route == route]
+            if route in self.sub_indexes:
+                sub_index, ids = self.sub_indexes[route]
+                found_distances, found = sub_index.search(query_embeddings[rows], min(k, sub_index.ntotal))
+                found = np.where(found >= 0, ids[np.maximum(found, 0)], -1)
+            else:
+                found_distances, found = self.index.search(query_embeddings[rows], k)
+            distances[rows, :found.shape[1]] = found_distances
+            indices[rows, :found.shape[1]] = found
+        return distances, indices
+
+
+# built once per loaded index and kept on it, so a new index version or shard set gets its own sub-indexes
+# and an old one takes them along when it is dropped
+routed_lock = threading.Lock()
+
+
+def routed(loaded_index):
+    with routed_lock:
+        routed_index = getattr(loaded_index, "routed_index", None)
+        if routed_index is None:
+            routed_index = loaded_index.routed_index = SectionRoutedIndex(loaded_index)
+        return routed_index
+
+
+# an index and metadata file pair as a loaded index for SectionRoutedIndex
+class LoadedIndex:
+    def __init__(self, index, metadata):
+        self.index = index
+        self.metadata = metadata
+
+    def search(self, query_embeddings, k):
+        return self.index.search(query_embeddings, k)
+
+    def reconstruct_batch(self, ids):
+        return reconstruct_vectors(self.index, ids)
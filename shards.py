@@ -0,0 +1,237 @@
+# the index split into shards: one or more per source (wiki, forums, patch notes, ...), pages spread over a
+# source's shards by title hash. shards are built in parallel worker processes and every shard directory has
+# a manifest.json, so adding or rebuilding one source never touches the shards of the others.
+# usage: python shards.py build index/shards wiki=terraria_preprocessed.json [forums=forum_chunks.json ...] [--shards-per-source 4]
+#        python shards.py list index/shards
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from index_loader import read_index, read_metadata
+from sections import reconstruct_vectors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "preprocessing"))
+
+from chunk_records import read_chunks
+
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.faiss"
+METADATA_FILE = "metadata.json"
+DEFAULT_ENCODER = "all-MiniLM-L6-v2"
+
+
+def shard_name(source, shard, num_shards):
+    return source if num_shards == 1 else f"{source}-{shard:03d}-of-{num_shards:03d}"
+
+
+# a page always lands in the same shard, so a page's chunks stay together
+def shard_of(page_title, num_shards):
+    return zlib.crc32(page_title.encode("utf-8")) % num_shards
+
+
+def content_hash(chunks, encoder_name, index_type):
+    digest = hashlib.sha256(f"{encoder_name}\n{index_type}\n".encode("utf-8"))
+    for chunk in chunks:
+        digest.update(json.dumps(chunk, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def read_manifest(shard_dir):
+    path = os.path.join(shard_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_manifests(shards_dir):
+    manifests = []
+    for name in sorted(os.listdir(shards_dir)):
+        manifest = read_manifest(os.path.join(shards_dir, name))
+        if manifest:
+            manifests.append(manifest)
+    return manifests
+
+
+# worker process side: the encoder is loaded once per process and reused for every shard it builds
+worker_model = None
+
+def init_worker(encoder_name, torch_threads):
+    global worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(torch_threads)
+    worker_model = SentenceTransformer(encoder_name)
+
+
+def build_shard(shard_dir, chunks, manifest):
+    from index import write_index
+    start = time.perf_counter()
+    os.makedirs(shard_dir, exist_ok=True)
+    # the manifest is written last, a shard without one is an unfinished build
+    if os.path.exists(os.path.join(shard_dir, MANIFEST_FILE)):
+        os.remove(os.path.join(shard_dir, MANIFEST_FILE))
+
+    index = write_index(
+        chunks, worker_model, os.path.join(shard_dir, INDEX_FILE), os.path.join(shard_dir, METADATA_FILE), manifest["index_type"]
+    )
+    manifest = dict(manifest, chunk_count=index.ntotal, dimension=index.d, built_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    with open(os.path.join(shard_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest["name"], time.perf_counter() - start
+
+
+# sources is {source name: preprocessed chunk file}, only shards whose chunks changed are rebuilt
+def build_shards(sources, shards_dir, shards_per_source=1, index_type="flat", encoder_name=DEFAULT_ENCODER, workers=None):
+    os.makedirs(shards_dir, exist_ok=True)
+    workers = workers or min(os.cpu_count() or 1, len(sources) * shards_per_source)
+
+    jobs = []
+    for source, preprocessed_file in sources.items():
+        chunks = read_chunks(preprocessed_file)
+
+        shard_chunks = [[] for _ in range(shards_per_source)]
+        for chunk in chunks:
+            shard_chunks[shard_of(chunk["metadata"]["page_title"], shards_per_source)].append(chunk)
+
+        names = set()
+        for shard, chunks in enumerate(shard_chunks):
+            name = shard_name(source, shard, shards_per_source)
+            names.add(name)
+            manifest = {
+                "name": name,
+                "source": source,
+                "shard": shard,
+                "num_shards": shards_per_source,
+                "input_file": os.path.abspath(preprocessed_file),
+                "encoder": encoder_name,
+                "index_type": index_type,
+                "content_hash": content_hash(chunks, encoder_name, index_type),
+            }
+            existing = read_manifest(os.path.join(shards_dir, name))
+            if existing and existing.get("content_hash") == manifest["content_hash"]:
+                print(f"[INFO] Shard {name} is up to date, skipping")
+                continue
+            if chunks:
+                jobs.append((os.path.join(shards_dir, name), chunks, manifest))
+            elif os.path.isdir(os.path.join(shards_dir, name)):
+                # nothing hashes into this shard any more, its old vectors must not stay searchable
+                print(f"[INFO] Removing empty shard {name}")
+                shutil.rmtree(os.path.join(shards_dir, name))
+
+        # shards of this source from an earlier build with a different shard count
+        for manifest in load_manifests(shards_dir):
+            if manifest["source"] == source and manifest["name"] not in names:
+                print(f"[INFO] Removing stale shard {manifest['name']}")
+                shutil.rmtree(os.path.join(shards_dir, manifest["name"]))
+
+    if not jobs:
+        return []
+
+    # every worker gets an equal share of the cores for torch
+    workers = min(workers, len(jobs))
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(encoder_name, torch_threads)) as pool:
+        futures = [pool.submit(build_shard, *job) for job in jobs]
+        built = []
+        for future in futures:
+            name, seconds = future.result()
+            print(f"[INFO] Built shard {name} in {seconds:.1f}s")
+            built.append(name)
+    return built
+
+
+# every shard of a directory searched as one index. faiss releases the gil while searching,
+# so the fan-out runs on a thread pool and the shards stay loaded once per process
+class ShardedIndex:
+    def __init__(self, shards_dir, workers=None):
+        manifests = load_manifests(shards_dir)
+        if not manifests:
+            raise FileNotFoundError(f"No shards with a {MANIFEST_FILE} in {shards_dir}")
+        encoders = {(manifest["encoder"], manifest["dimension"]) for manifest in manifests}
+        if len(encoders) > 1:
+            raise ValueError(f"Shards in {shards_dir} were built with different encoders: {sorted(encoders)}")
+        self.encoder_name, self.dimension = encoders.pop()
+
+        # one metadata list for all shards, a shard's ids start at its offset
+        self.manifests = manifests
+        self.indexes = []
+        self.offsets = []
+        self.metadata = []
+        for manifest in manifests:
+            shard_dir = os.path.join(shards_dir, manifest["name"])
+            # memory-mapped, so shards loaded by several bot processes are not multiplied in ram
+            self.indexes.append(read_index(os.path.join(shard_dir, INDEX_FILE)))
+            self.offsets.append(len(self.metadata))
+            self.metadata.extend(read_metadata(os.path.join(shard_dir, METADATA_FILE)))
+        self.pool = ThreadPoolExecutor(workers or len(self.indexes))
+
+    @property
+    def ntotal(self):
+        return len(self.metadata)
+
+    def search_shard(self, shard, query_embeddings, k):
+        index = self.indexes[shard]
+        distances, indices = index.search(query_embeddings, min(k, index.ntotal))
+        return distances, np.where(indices >= 0, indices + self.offsets[shard], -1)
+
+    # vectors by global id, for the section sub-indexes (sections.py)
+    def reconstruct_batch(self, ids):
+        vectors = np.empty((len(ids), self.dimension), dtype="float32")
+        for shard, index in enumerate(self.indexes):
+            offset = self.offsets[shard]
+            in_shard = (ids >= offset) & (ids < offset + index.ntotal)
+            if in_shard.any():
+                vectors[in_shard] = reconstruct_vectors(index, ids[in_shard] - offset)
+        return vectors
+
+    # same interface as faiss: distances and global ids of the k nearest vectors over all shards
+    def search(self, query_embeddings, k):
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype="float32")
+        results = list(self.pool.map(lambda shard: self.search_shard(shard, query_embeddings, k), range(len(self.indexes))))
+        distances = np.concatenate([distances for distances, _ in results], axis=1)
+        indices = np.concatenate([indices for _, indices in results], axis=1)
+        # l2 distances from the same encoder are comparable across shards
+        distances[indices < 0] = np.inf
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+def parse_source(value):
+    name, separator, path = value.partition("=")
+    if not separator or not name or not path:
+        raise argparse.ArgumentTypeError(f"expected name=chunks.json, got '{value}'")
+    return name, path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or list the sharded FAISS index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build the shards of one or more sources")
+    build_parser.add_argument("shards_dir")
+    build_parser.add_argument("sources", nargs="+", type=parse_source, help="name=preprocessed_chunks.json")
+    build_parser.add_argument("--shards-per-source", type=int, default=1)
+    build_parser.add_argument("--index-type", default="flat", choices=["flat", "hnsw", "ivf"])
+    build_parser.add_argument("--encoder", default=DEFAULT_ENCODER)
+    build_parser.add_argument("--workers", type=int, default=None)
+
+    list_parser = subparsers.add_parser("list", help="show the shard manifests")
+    list_parser.add_argument("shards_dir")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_shards(dict(args.sources), args.shards_dir, args.shards_per_source, args.index_type, args.encoder, args.workers)
+    else:
+        for manifest in load_manifests(args.shards_dir):
+            print(f"{manifest['name']:<32}{manifest['source']:<16}{manifest['chunk_count']:>8} chunks  {manifest['index_type']:<6}{manifest['built_at']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# answers exact stat, recipe and drop questions straight from the entity tables written by
+# preprocessing (terraria_entities.db), no vector search or llm call needed
+
+import re
+import sqlite3
+import threading
+from fuzzywuzzy import fuzz, process
+
+ARTICLE = r"(?:an? |the )?"
+
+RECIPE_PATTERNS = [
+    re.compile(rf"^(?:how (?:do (?:i|you) |to |can i )?(?:craft|make)|what do i need to (?:craft|make)|what (?:items )?(?:is|are) needed to (?:craft|make)|(?:what is )?the recipe (?:for|of)|recipe (?:for|of)) {ARTICLE}(?P<name>.+)$"),
+]
+DROPS_FROM_ENTITY_PATTERNS = [
+    re.compile(rf"^what (?:does|do|can) {ARTICLE}(?P<name>.+?) drop$"),
+    re.compile(rf"^(?:drops|loot) (?:of|from) {ARTICLE}(?P<name>.+)$"),
+]
+DROPS_OF_ITEM_PATTERNS = [
+    re.compile(rf"^(?:what|who|which (?:enemy|enemies|npc|npcs|boss|bosses|monster|monsters)) drops? {ARTICLE}(?P<name>.+)$"),
+    re.compile(rf"^(?:what is )?the (?:drop rate|drop chance) (?:of|for) {ARTICLE}(?P<name>.+)$"),
+    re.compile(rf"^{ARTICLE}(?P<name>.+?) drop (?:rate|chance)$"),
+]
+
+# question wording -> (items column, npcs column)
+STAT_COLUMNS = {
+    "damage": ("damage", "damage"),
+    "defense": ("defense", "defense"),
+    "health": (None, "health"),
+    "hp": (None, "health"),
+    "knockback": ("knockback", None),
+    "knockback resistance": (None, "kb_resist"),
+    "rarity": ("rarity", None),
+    "critical chance": ("critical_chance", None),
+    "crit chance": ("critical_chance", None),
+    "use time": ("use_time", None),
+    "velocity": ("velocity", None),
+    "mana cost": ("mana", None),
+    "mana": ("mana", None),
+    "tooltip": ("tooltip", None),
+    "sell price": ("sell", None),
+    "buy price": ("buy", None),
+    "price": ("buy", None),
+    "max stack": ("max_stack", None),
+}
+STAT_NAMES = "|".join(sorted(map(re.escape, STAT_COLUMNS), key=len, reverse=True))
+MODE = r"(?: in (?P<mode>classic|expert|master)(?: mode)?)?"
+STAT_PATTERNS = [
+    re.compile(rf"^(?:what is|what's|how much) (?:the )?(?P<stat>{STAT_NAMES}) (?:of|for|does) {ARTICLE}(?P<name>.+?)(?: (?:have|deal|do|give|has))?{MODE}$"),
+    re.compile(rf"^how much (?P<stat>{STAT_NAMES}) does {ARTICLE}(?P<name>.+?) (?:have|deal|do|give){MODE}$"),
+    re.compile(rf"^(?:what is|what's) {ARTICLE}(?P<name>.+?)'s (?P<stat>{STAT_NAMES}){MODE}$"),
+]
+
+
+def normalize_query(query):
+    return " ".join(query.lower().strip().rstrip("?!. ").split())
+
+
+class StructuredLookup:
+    def __init__(self, db_file, min_score=90):
+        self.connection = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.Lock()  # one connection shared by the executor threads
+        self.min_score = min_score
+
+        # names are loaded once so resolving what the user typed never scans a table
+        self.names = {
+            "item": self.load_names("SELECT DISTINCT name FROM items"),
+            "npc": self.load_names("SELECT DISTINCT name FROM npcs"),
+            "recipe": self.load_names("SELECT DISTINCT result FROM recipes"),
+            "drop_item": self.load_names("SELECT DISTINCT item FROM drops"),
+            "drop_entity": self.load_names("SELECT DISTINCT entity FROM drops"),
+        }
+
+    def load_names(self, sql):
+        return {row[0].lower(): row[0] for row in self.connection.execute(sql)}
+
+    def query(self, sql, params):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    # exact (case-insensitive) match first, then a strict fuzzy match for typos and plurals
+    def resolve(self, name, kind):
+        names = self.names[kind]
+        name = name.lower()
+        if name in names:
+            return names[name]
+        if name.endswith("s") and name[:-1] in names:
+            return names[name[:-1]]
+        match = process.extractOne(name, list(names), scorer=fuzz.ratio, score_cutoff=self.min_score)
+        return names[match[0]] if match else None
+
+    def answer_recipe(self, name):
+        result = self.resolve(name, "recipe")
+        if not result:
+            return None
+        lines = []
+        seen = set()
+        for recipe in self.query("SELECT id, result_quantity, station FROM recipes WHERE result = ? COLLATE NOCASE", (result,)):
+            ingredients = self.query("SELECT item, quantity FROM recipe_ingredients WHERE recipe_id = ?", (recipe["id"],))
+            text = ", ".join(f"{row['quantity']} {row['item']}" for row in ingredients)
+            key = (recipe["result_quantity"], recipe["station"], text)
+            if key in seen:
+                continue  # the same recipe shows up on the result page and on every ingredient's page
+            seen.add(key)
+            quantity = f"{recipe['result_quantity']} " if recipe["result_quantity"] > 1 else ""
+            lines.append(f"- {quantity}{result}: {text} at the {recipe['station']}")
+        return f"**{result}** can be crafted with:\n" + "\n".join(lines) if lines else None
+
+    def answer_drops_of_item(self, name):
+        item = self.resolve(name, "drop_item")
+        if not item:
+            return None
+        rows = self.query("SELECT DISTINCT entity, quantity, drop_rate FROM drops WHERE item = ? COLLATE NOCASE", (item,))
+        lines = [f"- {row['entity']}: {row['drop_rate']} ({row['quantity']})" for row in rows]
+        return f"**{item}** is dropped by:\n" + "\n".join(lines) if lines else None
+
+    def answer_drops_from_entity(self, name):
+        entity = self.resolve(name, "drop_entity")
+        if not entity:
+            return None
+        rows = self.query("SELECT DISTINCT item, quantity, drop_rate FROM drops WHERE entity = ? COLLATE NOCASE", (entity,))
+        lines = [f"- {row['item']}: {row['drop_rate']} ({row['quantity']})" for row in rows]
+        return f"**{entity}** drops:\n" + "\n".join(lines) if lines else None
+
+    def answer_stat(self, stat, name, mode=None):
+        item_column, npc_column = STAT_COLUMNS[stat]
+
+        if item_column:
+            item = self.resolve(name, "item")
+            if item:
+                rows = self.query(f"SELECT DISTINCT {item_column} AS value FROM items WHERE name = ? COLLATE NOCASE AND {item_column} IS NOT NULL", (item,))
+                if rows:
+                    return f"**{item}** {stat}: " + ", ".join(row["value"] for row in rows)
+
+        if npc_column:
+            npc = self.resolve(name, "npc")
+            if npc:
+                sql = f"SELECT mode, {npc_column} AS value FROM npcs WHERE name = ? COLLATE NOCASE AND {npc_column} IS NOT NULL"
+                params = [npc]
+                if mode:
+                    sql += " AND mode = ? COLLATE NOCASE"
+                    params.append(mode)
+                rows = self.query(sql, params)
+                if rows:
+                    values = dict((row["mode"], row["value"]) for row in rows)
+                    return f"**{npc}** {stat}: " + ", ".join(f"{value} in {mode}" for mode, value in values.items())
+        return None
+
+    # returns a ready answer, or None when the question should go through the rag pipeline
+    def answer(self, query):
+        query = normalize_query(query)
+        for pattern in STAT_PATTERNS:
+            match = pattern.match(query)
+            if match:
+                return self.answer_stat(match.group("stat"), match.group("name"), match.group("mode"))
+        for pattern in RECIPE_PATTERNS:
+            match = pattern.match(query)
+            if match:
+                return self.answer_recipe(match.group("name"))
+        for pattern in DROPS_FROM_ENTITY_PATTERNS:
+            match = pattern.match(query)
+            if match:
+                return self.answer_drops_from_entity(match.group("name"))
+        for pattern in DROPS_OF_ITEM_PATTERNS:
+            match = pattern.match(query)
+            if match:
+                return self.answer_drops_of_item(match.group("name"))
+        return None
@@ -0,0 +1,49 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import StreamingDeduplicator, deduplicate_chunks
+
+RECIPE_ROW = "Result: Hellstone Bar (1). Ingredients: Hellstone (3), Obsidian (1). Crafting station: Hellforge."
+
+
+def chunk(page_title, section_title, text=RECIPE_ROW):
+    return {"text": text, "metadata": {"page_title": page_title, "section_title": section_title}}
+
+
+# the "Used in" copy on the ingredient's page comes first, the recipe on the crafted item's page has to win
+def test_recipe_wins_over_used_in():
+    chunks = [
+        chunk("Hellstone", "Crafting - Used in"),
+        chunk("Obsidian", "Crafting - Used in"),
+        chunk("Hellstone", "Trivia", "Hellstone cannot be mined without a pickaxe of sufficient power."),
+        chunk("Hellstone Bar", "Crafting - Recipes"),
+    ]
+    deduplicated = deduplicate_chunks(chunks)
+
+    assert [c["metadata"]["section_title"] for c in deduplicated] == ["Trivia", "Crafting - Recipes"]
+    recipe = deduplicated[1]
+    assert recipe["metadata"]["page_title"] == "Hellstone Bar"
+    assert recipe["metadata"]["duplicates"] == [
+        {"page_title": "Hellstone", "section_title": "Crafting - Used in"},
+        {"page_title": "Obsidian", "section_title": "Crafting - Used in"},
+    ]
+    assert "duplicates" not in chunks[3]["metadata"]
+
+
+def test_streaming_keeps_recipe_after_used_in():
+    deduplicator = StreamingDeduplicator()
+    used_in = deduplicator.add(chunk("Hellstone", "Crafting - Used in"))
+    recipe = deduplicator.add(chunk("Hellstone Bar", "Crafting - Recipes"))
+    assert used_in is not None and recipe is not None
+    assert recipe["metadata"]["page_title"] == "Hellstone Bar"
+
+    # later copies go to the recipe, never to the earlier "Used in" chunk
+    assert deduplicator.add(chunk("Obsidian", "Crafting - Used in")) is None
+    assert deduplicator.add(chunk("Hellforge", "Crafting - Recipes")) is None
+    assert recipe["metadata"]["duplicates"] == [
+        {"page_title": "Obsidian", "section_title": "Crafting - Used in"},
+        {"page_title": "Hellforge", "section_title": "Crafting - Recipes"},
+    ]
+    assert used_in["metadata"]["duplicates"] == []
@@ -0,0 +1,75 @@
+# !pip install tiktoken
+
+import functools
+import tiktoken
+
+DEFAULT_MODEL = "gpt-3.5-turbo-1106"
+
+
+# load the tokenizer once per model, encoding_for_model is slow (reads the bpe file every call)
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model_name=DEFAULT_MODEL):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # unknown / local model names, fall back to the gpt-3.5/gpt-4 encoding
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model_name=DEFAULT_MODEL):
+    return len(get_tokenizer(model_name).encode(text))
+
+
+def format_context_line(i, text):
+    return f"({i+1}) {text}\n"
+
+
+# merge chunks that sat next to each other in the index and come from the same page and section
+def merge_adjacent_chunks(chunks):
+    merged = []
+    for chunk in sorted(chunks, key=lambda c: c.get("index_id", -1)):
+        metadata = chunk.get("metadata", {})
+        key = (metadata.get("page_title"), metadata.get("section_title"))
+        if merged:
+            previous = merged[-1]
+            previous_metadata = previous.get("metadata", {})
+            previous_key = (previous_metadata.get("page_title"), previous_metadata.get("section_title"))
+            if (
+                key == previous_key
+                and chunk.get("index_id") is not None
+                and chunk.get("index_id") == previous.get("last_index_id", -2) + 1
+            ):
+                previous["text"] += " " + chunk["text"]
+                previous["score"] = max(previous.get("score", 0), chunk.get("score", 0))
+                previous["last_index_id"] = chunk["index_id"]
+                continue
+
+        merged_chunk = dict(chunk)
+        merged_chunk["last_index_id"] = chunk.get("index_id", -2)
+        merged.append(merged_chunk)
+
+    # keep the best chunks first in the prompt
+    for chunk in merged:
+        chunk.pop("last_index_id", None)
+    return sorted(merged, key=lambda c: c.get("score", 0), reverse=True)
+
+
+# greedily fill the context with the highest scoring chunks that still fit in the budget
+def pack_context(retrieved_chunks, max_input_tokens, model_name=DEFAULT_MODEL):
+    # Step 1: best chunks first
+    candidates = sorted(retrieved_chunks, key=lambda c: c.get("score", 0), reverse=True)
+
+    # Step 2: take every chunk that still fits, smaller chunks further down can fill the gaps
+    selected = []
+    used_tokens = 0
+    for chunk in candidates:
+        chunk_tokens = count_tokens(format_context_line(len(selected), chunk["text"]), model_name)
+        if used_tokens + chunk_tokens > max_input_tokens:
+            continue
+        selected.append(chunk)
+        used_tokens += chunk_tokens
+
+    # Step 3: merging drops the repeated "(n) " prefixes so it can only shrink the context
+    packed = merge_adjacent_chunks(selected)
+    context = "".join(format_context_line(i, chunk["text"]) for i, chunk in enumerate(packed))
+    return packed, context, count_tokens(context, model_name)